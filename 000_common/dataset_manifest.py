@@ -0,0 +1,255 @@
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from image_probe import IMAGE_EXTENSIONS, list_images
+from materialize import materialize_files, MANIFEST_NAME
+
+# Манифест датасета - таблица, одна строка на изображение:
+# image  - абсолютный путь к изображению
+# label  - путь к yolo разметке ('' если ее нет, и для классификации)
+# source - из какого источника пришло изображение
+# split  - train / val / test ('' если еще не разбито)
+# class  - класс для датасетов классификации (папка на класс), '' для детекции
+# n_0, n_1, ... - количество объектов каждого класса в разметке, n_objects - всего
+# group  - необязательный: ключ группы (видео, камера), см. stratified_split.add_groups
+BASE_COLUMNS = ['image', 'label', 'source', 'split', 'class']
+TEXT_COLUMNS = BASE_COLUMNS + ['group']
+COUNT_PREFIX = 'n_'
+SPLITS = ('train', 'val', 'test')
+
+
+def label_path_for(image_path):
+    """Label path the way Ultralytics looks for it: /images/ -> /labels/, ext -> .txt"""
+    sa, sb = f'{os.sep}images{os.sep}', f'{os.sep}labels{os.sep}'
+    return sb.join(image_path.rsplit(sa, 1)).rsplit('.', 1)[0] + '.txt'
+
+
+def new_manifest(images, labels=None, source='', split='', classes=None):
+    """Manifest DataFrame from lists of paths, scalars are broadcast to all rows"""
+    images = [os.path.abspath(p) for p in images]
+    df = pd.DataFrame({
+        'image': images,
+        'label': [os.path.abspath(p) if p else '' for p in labels] if labels is not None else '',
+        'source': source,
+        'split': split,
+        'class': classes if classes is not None else '',
+    }, columns=BASE_COLUMNS)
+    return df
+
+
+def count_columns(df):
+    """n_<class_id> columns of the manifest, sorted by class id"""
+    columns = [c for c in df.columns if c.startswith(COUNT_PREFIX) and c[len(COUNT_PREFIX):].isdigit()]
+    return sorted(columns, key=lambda c: int(c[len(COUNT_PREFIX):]))
+
+
+def class_matrix(df):
+    """(images x classes) object count matrix as numpy array"""
+    return df[count_columns(df)].to_numpy()
+
+
+def _read_class_ids(label_path):
+    if not label_path:
+        return ()
+    try:
+        with open(label_path, 'r') as f:
+            return [int(float(line.split(maxsplit=1)[0])) for line in f if line.strip()]
+    except (FileNotFoundError, ValueError):
+        return ()
+
+
+def add_class_counts(df, num_threads=16):
+    """
+    Fill n_<class_id> and n_objects columns from the label files.
+    Files are read in a thread pool, the count matrix is built with one bincount.
+    """
+    with ThreadPoolExecutor(num_threads) as executor:
+        ids_per_file = list(executor.map(_read_class_ids, df['label']))
+
+    lengths = np.fromiter((len(ids) for ids in ids_per_file), np.int64, len(ids_per_file))
+    ids = np.fromiter((i for file_ids in ids_per_file for i in file_ids), np.int64, int(lengths.sum()))
+    num_classes = int(ids.max()) + 1 if len(ids) else 0
+    rows = np.repeat(np.arange(len(df)), lengths)
+    counts = np.bincount(rows * num_classes + ids, minlength=len(df) * num_classes)
+    counts = counts.reshape(len(df), num_classes)
+
+    df = df.drop(columns=count_columns(df) + ['n_objects'], errors='ignore')
+    counts = pd.DataFrame(counts, index=df.index,
+                          columns=[f'{COUNT_PREFIX}{i}' for i in range(num_classes)])
+    counts['n_objects'] = lengths
+    return pd.concat([df, counts], axis=1)
+
+
+def build_yolo_manifest(images_dir, labels_dir=None, source='', split='',
+                        count_classes=True, num_threads=16):
+    """
+    Manifest of a YOLO folder: images_dir with images, labels_dir with .txt.
+    labels_dir=None means Ultralytics layout (labels next to images/).
+    Images without a label file get label=''.
+    """
+    images = sorted(path for path, _, _ in list_images(images_dir, extensions=IMAGE_EXTENSIONS))
+    if labels_dir is None:
+        labels = [label_path_for(os.path.abspath(p)) for p in images]
+    else:
+        labels = [os.path.join(labels_dir, os.path.splitext(os.path.basename(p))[0] + '.txt')
+                  for p in images]
+
+    # одно чтение каждой папки разметки вместо os.path.exists на файл
+    existing = set()
+    for label_dir in {os.path.dirname(p) for p in labels}:
+        if os.path.isdir(label_dir):
+            existing.update(os.path.join(label_dir, name) for name in os.listdir(label_dir))
+    labels = [p if p in existing else '' for p in labels]
+
+    df = new_manifest(images, labels, source, split)
+    if count_classes:
+        df = add_class_counts(df, num_threads)
+    return df
+
+
+def build_class_manifest(root, source='', split=''):
+    """Manifest of a classification folder: root/<class>/<image>"""
+    images, classes = [], []
+    for class_name in sorted(os.listdir(root)):
+        class_dir = os.path.join(root, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+        for path, _, _ in sorted(list_images(class_dir)):
+            images.append(path)
+            classes.append(class_name)
+    return new_manifest(images, None, source, split, classes)
+
+
+def concat_manifests(manifests):
+    """Join manifests of several sources, missing class columns become 0"""
+    df = pd.concat(manifests, ignore_index=True)
+    columns = count_columns(df) + (['n_objects'] if 'n_objects' in df else [])
+    df[columns] = df[columns].fillna(0).astype(np.int64)
+    extra = [c for c in df.columns if c not in BASE_COLUMNS and c not in columns]
+    return df[BASE_COLUMNS + extra + columns]
+
+
+def save_manifest(df, path):
+    """.parquet (needs pyarrow) or .csv by the file extension"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+def load_manifest(path):
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path, keep_default_na=False, dtype={c: str for c in TEXT_COLUMNS})
+    return df
+
+
+def split_random(df, val_fraction, test_fraction=0.0, seed=None):
+    """Random train/val(/test) split, only the split column changes"""
+    df = df.copy()
+    order = np.random.default_rng(seed).permutation(len(df))
+    num_val = int(round(val_fraction * len(df)))
+    num_test = int(round(test_fraction * len(df)))
+    split = np.full(len(df), 'train', dtype=object)
+    split[order[:num_val]] = 'val'
+    split[order[num_val:num_val + num_test]] = 'test'
+    df['split'] = split
+    return df
+
+
+def read_class_names(classes_txt):
+    """classes.txt (one name per line) -> {id: name}"""
+    with open(classes_txt, 'r', encoding='utf-8') as f:
+        return {i: line.strip() for i, line in enumerate(line for line in f if line.strip())}
+
+
+def write_yolo_lists(df, dst_dir, names=None, yaml_name='data.yaml'):
+    """
+    Ultralytics train.txt / val.txt / test.txt and data yaml from a manifest.
+    Files are not copied: Ultralytics reads images by the listed paths and
+    finds labels by replacing /images/ with /labels/.
+    names: list, {id: name} or path to classes.txt; by default class ids.
+    Returns path to the yaml.
+    """
+    os.makedirs(dst_dir, exist_ok=True)
+    dst_dir = os.path.abspath(dst_dir)
+
+    if isinstance(names, str):
+        names = read_class_names(names)
+    elif names is None:
+        names = {int(c[len(COUNT_PREFIX):]): str(c[len(COUNT_PREFIX):]) for c in count_columns(df)}
+    elif not isinstance(names, dict):
+        names = dict(enumerate(names))
+
+    wrong_labels = (df['label'] != '') & (df['label'] != df['image'].map(label_path_for))
+    if wrong_labels.any():
+        print(f"Внимание: у {int(wrong_labels.sum())} изображений разметка лежит не по схеме "
+              f"images/ -> labels/, Ultralytics ее не найдет")
+
+    data = {'path': dst_dir}
+    for split in SPLITS:
+        images = df.loc[df['split'] == split, 'image']
+        if len(images):
+            with open(os.path.join(dst_dir, f'{split}.txt'), 'w', encoding='utf-8') as f:
+                f.write('\n'.join(images) + '\n')
+            data[split] = f'{split}.txt'
+    data['names'] = names
+
+    yaml_path = os.path.join(dst_dir, yaml_name)
+    with open(yaml_path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(data, f, allow_unicode=True, sort_keys=False)
+    return yaml_path
+
+
+def split_summary(df):
+    """Images and objects per split (and per class when counts are present)"""
+    columns = count_columns(df) + (['n_objects'] if 'n_objects' in df else [])
+    summary = df.groupby('split')[columns].sum() if columns else pd.DataFrame(index=df['split'].unique())
+    summary.insert(0, 'images', df.groupby('split').size())
+    return summary
+
+
+def materialize_manifest(df, dst_root, mode='copy', num_threads=16):
+    """
+    Physical tree from a manifest for tools that can't read list files:
+    dst_root/<split>/<class>/<image> for classification,
+    dst_root/<split>/images|labels/<file> for detection.
+    Files with the same name in one folder get a _1, _2, ... suffix (the label follows its image).
+    mode='manifest' only saves the manifest itself to dst_root.
+    """
+    if mode == 'manifest':
+        save_manifest(df, os.path.join(dst_root, MANIFEST_NAME))
+        return Counter({mode: len(df)})
+
+    pairs = []
+    used = set()
+    renamed = 0
+    for image, label, split, class_name in zip(df['image'], df['label'], df['split'], df['class']):
+        folder = os.path.join(split, class_name) if class_name else split
+        # одинаковые имена из разных источников в одной папке перезаписали бы друг друга:
+        # первый сохраняет имя, следующие получают суффикс _1, _2, ...
+        stem, ext = os.path.splitext(os.path.basename(image))
+        name, k = stem, 0
+        while (folder, name.lower()) in used:
+            k += 1
+            name = f'{stem}_{k}'
+        used.add((folder, name.lower()))
+        renamed += k > 0
+        if class_name:
+            pairs.append((image, os.path.join(dst_root, folder, name + ext)))
+            continue
+        pairs.append((image, os.path.join(dst_root, folder, 'images', name + ext)))
+        if label:
+            # разметка следует за именем изображения, иначе Ultralytics ее не найдет
+            pairs.append((label, os.path.join(dst_root, folder, 'labels', name + os.path.splitext(label)[1])))
+    if renamed:
+        print(f"Совпадающие имена файлов: {renamed} изображений получили суффикс _<n>")
+    return materialize_files(pairs, mode, os.path.join(dst_root, MANIFEST_NAME), num_threads)
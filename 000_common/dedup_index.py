@@ -0,0 +1,410 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from image_io import imread_fit
+from image_probe import IMAGE_EXTENSIONS, list_images
+from dataset_manifest import load_manifest
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Индекс дублей: для каждого изображения хэш содержимого (точные дубли) и
+# dHash 64 бита (почти дубли: пересжатие, ресайз, другой формат).
+# Хранится в .npz, при обновлении хэшируются только новые и изменившиеся файлы (size + mtime).
+INDEX_NAME = '.dedup_index.npz'
+INDEX_VERSION = 1
+HASH_NAME = 'xxh3_64' if xxhash is not None else 'blake2b_64'
+# порог по умолчанию: до 3 различающихся бит dHash из 64 - одно и то же изображение
+# (пересжатие, смена формата). Ресайз + сильное пересжатие дает 4-6 бит; порог выше 3
+# дробит хэш на полосы короче 16 бит и на миллионах изображений резко растет число кандидатов
+MAX_DISTANCE = 3
+# 0 - хэш файла, который не удалось прочитать (декодировать): в дубли он не попадает
+NO_HASH = np.uint64(0)
+# в clusters() серии разных dHash с одинаковой полосой до этой длины дают все пары кандидатов
+# сразу; более длинные (много разных темных/малотекстурных кадров) сравниваются тоже все
+# со всеми, но блоками BAND_BLOCK x BAND_BLOCK с проверкой popcount: память не растет
+# квадратично с длиной серии, и ни одна пара не пропускается
+MAX_BAND_RUN = 64
+BAND_BLOCK = 2048
+CHUNK = 1 << 20
+
+
+def content_hash(path):
+    """64-bit hash of the file bytes: xxh3 when xxhash is installed, else blake2b"""
+    if xxhash is not None:
+        h = xxhash.xxh3_64()
+    else:
+        h = hashlib.blake2b(digest_size=8)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK), b''):
+            h.update(chunk)
+    return int.from_bytes(h.digest(), 'big') or 1
+
+
+def dhash(path):
+    """
+    Difference hash: 9x8 grayscale, bit = pixel brighter than its right neighbour.
+    JPEGs are decoded at reduced scale, the image is tiny anyway.
+    """
+    img = imread_fit(path, (64, 64))
+    if img is None:
+        return 0
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0]) or 1
+
+
+def image_hashes(path):
+    try:
+        return content_hash(path), dhash(path)
+    except (OSError, cv2.error):
+        return 0, 0
+
+
+def popcount(values):
+    """Number of set bits of uint64 values"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    as_bytes = values.view(np.uint8).reshape(-1, 8)
+    return np.unpackbits(as_bytes, axis=1).sum(axis=1)
+
+
+def _bands(max_distance):
+    """max_distance + 1 bit ranges of the 64-bit hash: a pair within the distance matches exactly in one of them"""
+    edges = np.linspace(0, 64, max_distance + 2).astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def _band_values(phash, band):
+    low, high = band
+    mask = np.uint64((1 << (high - low)) - 1)
+    return (phash >> np.uint64(64 - high)) & mask
+
+
+class DedupIndex:
+    """
+    Persistent content + perceptual hash index of images from many sources.
+
+    update() hashes only new or changed files in a thread pool. Lookups use
+    sorted arrays: exact duplicates by searchsorted over content hashes,
+    near duplicates by multi-index hashing - the 64-bit dHash is cut into
+    max_distance + 1 bands, a candidate must match one band exactly and is
+    then checked by popcount. A query is a few binary searches, well under
+    a millisecond for millions of images.
+    """
+
+    def __init__(self, index_path, num_threads=16):
+        self.index_path = index_path
+        self.num_threads = num_threads
+        self.paths = np.array([], dtype=object)
+        self.sizes = np.array([], dtype=np.int64)
+        self.mtimes = np.array([], dtype=np.float64)
+        self.content = np.array([], dtype=np.uint64)
+        self.phash = np.array([], dtype=np.uint64)
+        self._load()
+        self._reset_lookup()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def _load(self):
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            with np.load(self.index_path) as data:
+                if int(data['version']) != INDEX_VERSION or str(data['hash_name']) != HASH_NAME:
+                    print(f"Индекс {self.index_path} другой версии или хэша, будет пересобран")
+                    return
+                # пути хранятся одним блоком utf-8, а не массивом строк фиксированной длины
+                blob = data['paths'].tobytes().decode('utf-8')
+                self.paths = np.array(blob.split('\n') if blob else [], dtype=object)
+                self.sizes, self.mtimes = data['sizes'], data['mtimes']
+                self.content, self.phash = data['content'], data['phash']
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Не удалось прочитать индекс {self.index_path}: {e}")
+
+    def save(self):
+        if not self.index_path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        blob = np.frombuffer('\n'.join(self.paths).encode('utf-8'), dtype=np.uint8)
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, version=INDEX_VERSION, hash_name=HASH_NAME, paths=blob, sizes=self.sizes,
+                     mtimes=self.mtimes, content=self.content, phash=self.phash)
+        os.replace(tmp, self.index_path)
+
+    def _reset_lookup(self):
+        self._path_index = None
+        self._content_order = None
+        self._band_tables = {}
+
+    def rows(self, paths):
+        """Row of each path in the index, -1 if it is not there"""
+        if self._path_index is None:
+            self._path_index = pd.Index(self.paths)
+        return self._path_index.get_indexer([_abspath(p) for p in paths])
+
+    def update(self, files, desc='hash'):
+        """
+        Add or refresh files: paths or (path, size, mtime) from image_probe.list_images.
+        Only files not in the index or with other size/mtime are hashed.
+        Returns number of hashed files.
+        """
+        files = [f if isinstance(f, tuple) else (f, *_stat(f)) for f in files]
+        if not files:
+            return 0
+        paths = np.array([_abspath(p) for p, _, _ in files], dtype=object)
+        sizes = np.array([s for _, s, _ in files], dtype=np.int64)
+        mtimes = np.array([m for _, _, m in files], dtype=np.float64)
+
+        rows = self.rows(paths)
+        known = rows >= 0
+        fresh = known.copy()
+        fresh[known] = (self.sizes[rows[known]] == sizes[known]) & (self.mtimes[rows[known]] == mtimes[known])
+        todo = np.flatnonzero(~fresh)
+        if not len(todo):
+            return 0
+
+        with ThreadPoolExecutor(self.num_threads) as executor:
+            hashes = list(tqdm(executor.map(image_hashes, paths[todo]), total=len(todo), desc=desc))
+        content = np.array([c for c, _ in hashes], dtype=np.uint64)
+        phash = np.array([p for _, p in hashes], dtype=np.uint64)
+
+        # изменившиеся - на месте, новые - в конец
+        changed = known[todo]
+        target = rows[todo[changed]]
+        self.sizes[target], self.mtimes[target] = sizes[todo[changed]], mtimes[todo[changed]]
+        self.content[target], self.phash[target] = content[changed], phash[changed]
+        new = todo[~changed]
+        self.paths = np.concatenate([self.paths, paths[new]])
+        self.sizes = np.concatenate([self.sizes, sizes[new]])
+        self.mtimes = np.concatenate([self.mtimes, mtimes[new]])
+        self.content = np.concatenate([self.content, content[~changed]])
+        self.phash = np.concatenate([self.phash, phash[~changed]])
+        self._reset_lookup()
+        return len(todo)
+
+    def update_directory(self, directory, recursive=True, extensions=IMAGE_EXTENSIONS):
+        """Index all images of a directory, files that disappeared from it are dropped"""
+        files = list_images(directory, recursive, extensions)
+        prefix = os.path.join(os.path.abspath(directory), '')
+        present = set(os.path.abspath(p) for p, _, _ in files)
+        keep = np.array([not p.startswith(prefix) or p in present for p in self.paths], dtype=bool)
+        if not keep.all():
+            self._select(keep)
+        return self.update(files, desc=os.path.basename(os.path.normpath(directory)))
+
+    def _select(self, mask):
+        self.paths, self.sizes, self.mtimes = self.paths[mask], self.sizes[mask], self.mtimes[mask]
+        self.content, self.phash = self.content[mask], self.phash[mask]
+        self._reset_lookup()
+
+    def _band_table(self, max_distance):
+        if max_distance not in self._band_tables:
+            tables = []
+            for band in _bands(max_distance):
+                values = _band_values(self.phash, band)
+                order = np.argsort(values, kind='stable')
+                tables.append((band, values[order], order))
+            self._band_tables[max_distance] = tables
+        return self._band_tables[max_distance]
+
+    def lookup(self, content, phash, max_distance=MAX_DISTANCE):
+        """Rows with the same content hash or dHash within max_distance bits"""
+        if self._content_order is None:
+            self._content_order = np.argsort(self.content, kind='stable')
+            self._sorted_content = self.content[self._content_order]
+        found = []
+        content = np.uint64(content)
+        if content != NO_HASH:
+            lo = np.searchsorted(self._sorted_content, content, side='left')
+            hi = np.searchsorted(self._sorted_content, content, side='right')
+            found.append(self._content_order[lo:hi])
+
+        phash = np.uint64(phash)
+        if phash != NO_HASH and max_distance >= 0:
+            candidates = []
+            for band, values, order in self._band_table(max_distance):
+                value = _band_values(np.array([phash]), band)[0]
+                lo, hi = np.searchsorted(values, value, side='left'), np.searchsorted(values, value, side='right')
+                candidates.append(order[lo:hi])
+            candidates = np.unique(np.concatenate(candidates))
+            near = popcount(self.phash[candidates] ^ phash) <= max_distance
+            found.append(candidates[near])
+        return np.unique(np.concatenate(found)) if found else np.array([], dtype=np.int64)
+
+    def query(self, path, max_distance=MAX_DISTANCE):
+        """Paths of indexed duplicates of an image (the image itself excluded)"""
+        row = self.rows([path])[0]
+        content, phash = (self.content[row], self.phash[row]) if row >= 0 else image_hashes(path)
+        rows = self.lookup(content, phash, max_distance)
+        return [self.paths[r] for r in rows if r != row]
+
+    def clusters(self, paths, max_distance=MAX_DISTANCE):
+        """
+        Duplicate cluster id for each of paths (all must be indexed): images
+        linked by equal content hash or dHash within max_distance share an id.
+        Only pairs among the given paths are considered.
+        """
+        rows = self.rows(paths)
+        if (rows < 0).any():
+            raise ValueError(f"{int((rows < 0).sum())} файлов нет в индексе, сначала update()")
+        content, phash = self.content[rows], self.phash[rows]
+
+        # для компонент связности достаточно цепочки внутри группы равных хэшей, все пары не нужны
+        readable = np.flatnonzero(content != NO_HASH)
+        i, j = _equal_pairs(content[readable], max_offset=1)
+        pairs = [(readable[i], readable[j])]
+        # одинаковые dHash (в том числе все однотонные кадры) - тоже цепочкой,
+        # в сравнение по полосам идет по одному изображению на каждый dHash
+        valid = np.flatnonzero(phash != NO_HASH)
+        i, j = _equal_pairs(phash[valid], max_offset=1)
+        pairs.append((valid[i], valid[j]))
+        unique, first = np.unique(phash[valid], return_index=True)
+        representative = valid[first]
+        for band in _bands(max_distance):
+            i, j = _band_pairs(unique, _band_values(unique, band), max_distance)
+            pairs.append((representative[i], representative[j]))
+        first = np.concatenate([p[0] for p in pairs])
+        second = np.concatenate([p[1] for p in pairs])
+        return _connected_components(len(rows), first, second)
+
+
+def _abspath(path):
+    # os.path.abspath на миллионах уже абсолютных путей заметно дорогой
+    return path if path.startswith(os.sep) else os.path.abspath(path)
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+
+def _equal_pairs(values, max_offset=None):
+    """
+    Pairs (i, j) with values[i] == values[j], i != j, without a Python loop:
+    after sorting, equal values are runs; offset k pairs every item with the
+    one k places later, items of runs shorter than k drop out.
+    max_offset limits k: 1 links every run as a chain (linear in the run length,
+    enough for connected components), None gives all pairs of every run.
+    """
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    first, second = [], []
+    alive = np.arange(len(order) - 1)
+    k = 1
+    while len(alive) and (max_offset is None or k <= max_offset):
+        same = sorted_values[alive] == sorted_values[alive + k]
+        alive = alive[same]
+        first.append(order[alive])
+        second.append(order[alive + k])
+        k += 1
+        alive = alive[alive + k < len(order)]
+    if not first:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return np.concatenate(first), np.concatenate(second)
+
+
+def _band_pairs(phash, values, max_distance):
+    """
+    Pairs (i, j) with equal band values and phash within max_distance bits.
+    Runs up to MAX_BAND_RUN give all candidate pairs at once (_equal_pairs),
+    longer runs are compared all against all block by block.
+    """
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    starts = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]]) if len(order) else order
+    lengths = np.diff(np.r_[starts, len(order)])
+    is_long = lengths > MAX_BAND_RUN
+
+    short = order[~np.repeat(is_long, lengths)]
+    i, j = _equal_pairs(values[short])
+    i, j = short[i], short[j]
+    near = popcount(phash[i] ^ phash[j]) <= max_distance
+    first, second = [i[near]], [j[near]]
+    for start, length in zip(starts[is_long], lengths[is_long]):
+        members = order[start:start + length]
+        for a in range(0, length, BAND_BLOCK):
+            rows = members[a:a + BAND_BLOCK]
+            for b in range(a, length, BAND_BLOCK):
+                cols = members[b:b + BAND_BLOCK]
+                xor = phash[rows][:, None] ^ phash[cols][None, :]
+                close = popcount(xor.ravel()).reshape(xor.shape) <= max_distance
+                if a == b:
+                    close = np.triu(close, 1)
+                r, c = np.nonzero(close)
+                first.append(rows[r])
+                second.append(cols[c])
+    return np.concatenate(first), np.concatenate(second)
+
+
+def _connected_components(n, first, second):
+    """Component id (smallest member index) by min-label propagation over the pairs"""
+    labels = np.arange(n)
+    while len(first):
+        smaller = np.minimum(labels[first], labels[second])
+        new = labels.copy()
+        np.minimum.at(new, first, smaller)
+        np.minimum.at(new, second, smaller)
+        # сжатие путей: метка метки
+        new = new[new]
+        if np.array_equal(new, labels):
+            break
+        labels = new
+    return labels
+
+
+def duplicate_mask(clusters):
+    """True for every image whose cluster already has an earlier image (the copies to drop)"""
+    first = np.zeros(len(clusters), dtype=bool)
+    first[np.unique(clusters, return_index=True)[1]] = True
+    return ~first
+
+
+def build_dedup_index(index_path, directories=(), paths=(), num_threads=16):
+    """Load the index, bring it up to date for the directories and paths, save"""
+    index = DedupIndex(index_path, num_threads)
+    hashed = sum(index.update_directory(d) for d in directories)
+    hashed += index.update(list(paths))
+    if hashed:
+        index.save()
+    print(f"Dedup index: {len(index)} images, hashed now {hashed} ({HASH_NAME})")
+    return index
+
+
+def drop_duplicates(paths, index, max_distance=MAX_DISTANCE):
+    """
+    Mask of paths to keep: from every group of exact/near duplicates only the
+    first path (in the given order) stays. Paths are added to the index if needed.
+    """
+    if index.update(list(paths)):
+        index.save()
+    keep = ~duplicate_mask(index.clusters(paths, max_distance))
+    print(f"Duplicates dropped: {int((~keep).sum())} of {len(keep)}")
+    return keep
+
+
+def duplicates_of(paths, other_paths, index, max_distance=MAX_DISTANCE):
+    """Mask of paths that have a duplicate among other_paths (e.g. the already assembled train set)"""
+    paths, other_paths = list(paths), list(other_paths)
+    if index.update(paths + other_paths):
+        index.save()
+    clusters = index.clusters(paths + other_paths, max_distance)
+    return np.isin(clusters[:len(paths)], clusters[len(paths):])
+
+
+def reference_images(path):
+    """Images to deduplicate against: the image column of a manifest (.csv/.parquet) or all images of a directory"""
+    if os.path.splitext(path)[1].lower() in ('.csv', '.parquet'):
+        return load_manifest(path)['image'].tolist()
+    return [p for p, _, _ in list_images(path, recursive=True)]
@@ -0,0 +1,146 @@
+import os
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+CACHE_NAME = '.dir_index_cache.pkl'
+CACHE_VERSION = 1
+# mtime директории меняется при добавлении/удалении/переименовании файла в ней.
+# Листинги, снятые в пределах этого окна от mtime, не кэшируются:
+# на FAT/exFAT точность mtime 2 секунды и изменение могло не попасть в mtime
+MTIME_SLACK = 2.0
+
+
+class DirIndex:
+    """
+    Directory listings of a tree, read once with os.scandir.
+
+    Each directory is listed at most once per run, all tools of the run ask
+    the index instead of calling os.listdir/os.walk again. Listings are also
+    cached on disk keyed by directory mtime, so the next run only stats the
+    directories and re-lists the ones that changed.
+    Directories outside root are listed lazily on first request.
+    """
+
+    def __init__(self, root, use_cache=True, cache_path=None, num_threads=16):
+        self.root = os.path.abspath(root)
+        self.use_cache = use_cache
+        self.cache_path = cache_path or os.path.join(self.root, CACHE_NAME)
+        self.num_threads = num_threads
+        # path -> (mtime, dirs, files), dirs/files - отсортированные имена
+        self.listings = {}
+        self._cached = self._load_cache() if use_cache else {}
+        self._lock = Lock()
+        self.listed = 0
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, 'rb') as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return {}
+        if data.get('version') != CACHE_VERSION:
+            return {}
+        return data['listings']
+
+    def save(self):
+        """Store listings whose directory did not change right before the scan"""
+        if not self.use_cache:
+            return
+        now = time.time()
+        listings = {path: listing for path, listing in {**self._cached, **self.listings}.items()
+                    if listing[0] < now - MTIME_SLACK}
+        try:
+            with open(self.cache_path, 'wb') as f:
+                pickle.dump({'version': CACHE_VERSION, 'listings': listings}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            print(f"Не удалось сохранить кэш индекса {self.cache_path}: {e}")
+
+    def _list(self, path):
+        """Listing of one directory: from cache if its mtime didn't change"""
+        mtime = os.stat(path).st_mtime
+        cached = self._cached.get(path)
+        if cached is not None and cached[0] == mtime:
+            listing = cached
+        else:
+            dirs, files = [], []
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.name == CACHE_NAME:
+                        continue
+                    # как os.walk: ссылки на папки считаются папками
+                    (dirs if entry.is_dir() else files).append(entry.name)
+            listing = (mtime, sorted(dirs), sorted(files))
+            with self._lock:
+                self.listed += 1
+        with self._lock:
+            self.listings[path] = listing
+        return listing
+
+    def _walk_tree(self, top):
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            _, dirs, _ = self._list(path)
+            # в папки-ссылки не заходим, как os.walk(followlinks=False)
+            stack.extend(os.path.join(path, d) for d in dirs
+                         if not os.path.islink(os.path.join(path, d)))
+
+    def scan(self):
+        """Walk the whole tree, top-level subdirectories in parallel"""
+        _, dirs, _ = self._list(self.root)
+        tops = [os.path.join(self.root, d) for d in dirs
+                if not os.path.islink(os.path.join(self.root, d))]
+        with ThreadPoolExecutor(self.num_threads) as executor:
+            list(executor.map(self._walk_tree, tops))
+        self.save()
+        return self
+
+    def _listing(self, path):
+        path = os.path.abspath(path)
+        listing = self.listings.get(path)
+        if listing is None:
+            listing = self._list(path)
+        return listing
+
+    def dirs(self, path):
+        return list(self._listing(path)[1])
+
+    def files(self, path, extensions=None):
+        """File names of a directory, optionally only with given extensions (lowercase, with dot)"""
+        files = self._listing(path)[2]
+        if extensions is None:
+            return list(files)
+        return [f for f in files if os.path.splitext(f)[1].lower() in extensions]
+
+    def listdir(self, path):
+        """Like os.listdir: directories and files"""
+        _, dirs, files = self._listing(path)
+        return dirs + files
+
+    def count(self, path, extensions=None):
+        return len(self.files(path, extensions))
+
+    def walk(self, top=None):
+        """Like os.walk(top), served from the index"""
+        stack = [os.path.abspath(top or self.root)]
+        while stack:
+            path = stack.pop()
+            _, dirs, files = self._listing(path)
+            yield path, list(dirs), list(files)
+            stack.extend(os.path.join(path, d) for d in reversed(dirs)
+                         if not os.path.islink(os.path.join(path, d)))
+
+    def discard(self, file_path):
+        """Forget a file removed by the caller, so later queries don't see it"""
+        path, name = os.path.split(os.path.abspath(file_path))
+        listing = self.listings.get(path)
+        if listing is not None and name in listing[2]:
+            self.listings[path] = (listing[0], listing[1], [f for f in listing[2] if f != name])
+
+
+def build_index(root, use_cache=True, num_threads=16):
+    """DirIndex of root with the whole tree already scanned"""
+    return DirIndex(root, use_cache, num_threads=num_threads).scan()
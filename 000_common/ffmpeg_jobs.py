@@ -0,0 +1,192 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+from tqdm import tqdm
+
+STATE_NAME = '.transcode_state.json'
+# суффикс недописанного файла: результат появляется под своим именем только после успешного ffmpeg
+PART_SUFFIX = '.part'
+
+# Пресеты без привязки к железу: только программные кодеки, есть в любой сборке ffmpeg.
+# ext - контейнер результата, args - параметры выхода
+PRESETS = {
+    # для разметки (CVAT/Label Studio): H.264, точная картинка, moov в начале файла
+    'h264': {'ext': '.mp4', 'args': ['-c:v', 'libx264', '-preset', 'medium', '-crf', '20',
+                                     '-pix_fmt', 'yuv420p', '-movflags', '+faststart', '-an']},
+    # быстрее и меньше, для просмотра
+    'h264_fast': {'ext': '.mp4', 'args': ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23',
+                                          '-pix_fmt', 'yuv420p', '-movflags', '+faststart', '-an']},
+    # все кадры ключевые: перемотка на любой кадр без декодирования соседних, 720p
+    'mjpeg_proxy': {'ext': '.avi', 'args': ['-c:v', 'mjpeg', '-q:v', '5', '-vf', 'scale=-2:720',
+                                            '-pix_fmt', 'yuvj420p', '-an']},
+    # прежние параметры conver_ffpmeg (закомментированный вариант с mpeg4 + aac)
+    'mpeg4': {'ext': '.mp4', 'args': ['-c:v', 'mpeg4', '-q:v', '5', '-c:a', 'aac', '-ac', '2']},
+}
+
+
+def probe_duration(path):
+    """Duration in seconds: ffprobe, without it from the OpenCV header. 0 if unknown"""
+    if shutil.which('ffprobe'):
+        result = subprocess.run(['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+                                 '-of', 'default=noprint_wrappers=1:nokey=1', path],
+                                capture_output=True, text=True)
+        try:
+            return float(result.stdout.strip())
+        except ValueError:
+            pass
+    video = cv2.VideoCapture(path)
+    fps, frames = video.get(cv2.CAP_PROP_FPS), video.get(cv2.CAP_PROP_FRAME_COUNT)
+    video.release()
+    return frames / fps if fps > 0 and frames > 0 else 0.0
+
+
+def job_threads(num_jobs=None, threads_per_job=None):
+    """
+    (parallel ffmpeg processes, threads of each) from the number of cores.
+    """
+    # libx264 хорошо масштабируется примерно до 4 потоков на 1080p,
+    # дальше выгоднее кодировать больше файлов одновременно
+    cores = os.cpu_count() or 1
+    threads_per_job = threads_per_job or min(4, cores)
+    num_jobs = num_jobs or max(1, cores // threads_per_job)
+    return num_jobs, threads_per_job
+
+
+class TranscodeState:
+    """
+    dst name -> (src size, src mtime, args) of the last successful run, stored
+    in dst. A job is up to date when the output exists and neither the source
+    nor the ffmpeg arguments changed.
+    """
+
+    def __init__(self, dst_dir):
+        self.path = os.path.join(dst_dir, STATE_NAME)
+        self.entries = {}
+        self.lock = threading.Lock()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+    @staticmethod
+    def _key(job):
+        st = os.stat(job['src'])
+        return [st.st_size, st.st_mtime, job['args']]
+
+    def is_done(self, job):
+        return os.path.exists(job['dst']) and self.entries.get(os.path.basename(job['dst'])) == self._key(job)
+
+    def mark_done(self, job):
+        with self.lock:
+            self.entries[os.path.basename(job['dst'])] = self._key(job)
+            self.save()
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+
+def make_job(src, dst, preset, threads, extra_input_args=(), extra_args=()):
+    """Job dict: src, dst, args (ffmpeg output args of the preset + threads), input_args"""
+    args = list(PRESETS[preset]['args']) + list(extra_args) + ['-threads', str(threads)]
+    return {'src': str(src), 'dst': str(dst), 'args': args, 'input_args': list(extra_input_args)}
+
+
+def _part_path(dst):
+    root, ext = os.path.splitext(dst)
+    return f"{root}{PART_SUFFIX}{ext}"
+
+
+def run_ffmpeg(job, on_progress=None):
+    """
+    Run one ffmpeg job writing to a .part file renamed into place on success.
+    Progress comes from `-progress pipe:1` (out_time_us), on_progress(seconds)
+    is called with the encoded time. Returns (ok, tail of stderr).
+    """
+    part = _part_path(job['dst'])
+    cmd = (['ffmpeg', '-y', '-nostdin', '-hide_banner', '-loglevel', 'error', '-nostats', '-progress', 'pipe:1']
+           + job['input_args'] + ['-i', job['src']] + job['args'] + [part])
+    # stderr во временный файл: чтение stdout построчно не должно заблокироваться на полном пайпе stderr
+    with tempfile.TemporaryFile() as log:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=log, text=True)
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            if key == 'out_time_us' and on_progress and value.lstrip('-').isdigit():
+                on_progress(max(0, int(value)) / 1e6)
+        code = process.wait()
+        log.seek(0)
+        tail = log.read().decode(errors='replace').strip().splitlines()[-10:]
+    if code == 0 and os.path.exists(part):
+        os.replace(part, job['dst'])
+        return True, ''
+    if os.path.exists(part):
+        os.remove(part)
+    return False, '\n'.join(tail) or f"ffmpeg exit code {code}"
+
+
+def run_jobs(jobs, num_jobs, state=None, retries=1):
+    """
+    Run jobs with at most num_jobs ffmpeg processes at once.
+    Jobs already done according to state are skipped. A failed job is retried
+    `retries` times. One progress bar for all jobs in seconds of video,
+    with ETA. Raises ValueError if two jobs share a dst. Returns dict: done, skipped, failed (list of (src, error)).
+    """
+    # два задания в один dst писали бы один .part одновременно
+    dst_counts = Counter(os.path.abspath(job['dst']) for job in jobs)
+    duplicates = [dst for dst, count in dst_counts.items() if count > 1]
+    if duplicates:
+        raise ValueError(f"Несколько исходников в один файл: {duplicates[:10]}")
+    todo = [job for job in jobs if not (state and state.is_done(job))]
+    report = {'done': 0, 'skipped': len(jobs) - len(todo), 'failed': []}
+    if not todo:
+        return report
+    with ThreadPoolExecutor(min(16, len(todo))) as executor:
+        durations = list(executor.map(lambda job: probe_duration(job['src']), todo))
+
+    progress = tqdm(total=round(sum(durations), 1), desc='transcode',
+                    bar_format='{l_bar}{bar}| {n:.0f}/{total:.0f} с видео [{elapsed}<{remaining}]')
+    lock = threading.Lock()
+
+    def run(job, duration):
+        for attempt in range(retries + 1):
+            counted = [0.0]
+
+            def on_progress(seconds):
+                seconds = min(seconds, duration) if duration else 0.0
+                with lock:
+                    progress.update(round(seconds - counted[0], 3))
+                counted[0] = seconds
+
+            started = time.time()
+            ok, error = run_ffmpeg(job, on_progress)
+            with lock:
+                # убираем частичный прогресс неудачной попытки, добиваем до длительности удачной
+                progress.update(round((duration if ok else 0.0) - counted[0], 3))
+            if ok:
+                if state:
+                    state.mark_done(job)
+                tqdm.write(f"OK {os.path.basename(job['dst'])} за {time.time() - started:.0f} с")
+                return None
+            tqdm.write(f"Ошибка {os.path.basename(job['src'])} (попытка {attempt + 1}/{retries + 1}):\n{error}")
+        return error
+
+    with ThreadPoolExecutor(num_jobs) as executor:
+        for job, error in zip(todo, executor.map(run, todo, durations)):
+            if error is None:
+                report['done'] += 1
+            else:
+                report['failed'].append((job['src'], error))
+    progress.close()
+    return report
@@ -0,0 +1,291 @@
+import argparse
+import errno
+import filecmp
+import json
+import os
+import shutil
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from tqdm import tqdm
+
+from materialize import materialize_file, has_form
+
+# Пакетные move/copy с журналом.
+# Сначала строится и проверяется весь план (op, src, dst), план пишется в журнал,
+# потом операции выполняются в потоках, выполненные отмечаются в журнале.
+# После падения по журналу можно доделать (resume) или откатить (rollback) весь пакет,
+# а не остаться с половиной перенесенных пар изображение + разметка.
+# hardlink/reflink/symlink - как в materialize.py, hardlink/reflink на другом разделе откатываются на copy
+OPERATIONS = ('move', 'copy', 'hardlink', 'reflink', 'symlink')
+JOURNAL_NAME = '.file_ops_journal.jsonl'
+JOURNAL_VERSION = 1
+# файл пишется во временный рядом с dst и переименовывается: dst либо целый, либо его нет
+TMP_SUFFIX = '.file_ops_tmp'
+# replace=True: прежний dst переносится в <журнал>.backup/<номер операции>, rollback возвращает его.
+# Резервные копии живут до следующего пакета с тем же журналом
+BACKUP_SUFFIX = '.backup'
+# как часто сбрасывать отметки о выполнении на диск
+FLUSH_EVERY = 1000
+
+
+def _replace_via_copy(src, dst):
+    tmp = dst + TMP_SUFFIX
+    shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+
+
+def _move(src, dst):
+    """os.rename (атомарно) на одном разделе, иначе копия через временный файл + удаление src"""
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        _replace_via_copy(src, dst)
+        os.remove(src)
+
+
+def _backup_path(journal_path, i):
+    return os.path.join(journal_path + BACKUP_SUFFIX, str(i))
+
+
+def _apply(operation, backup=None):
+    """Do one planned operation; safe to repeat after a crash"""
+    op, src, dst = operation
+    if os.path.lexists(dst + TMP_SUFFIX):
+        os.remove(dst + TMP_SUFFIX)
+    if backup and os.path.lexists(dst) and not os.path.lexists(backup):
+        # заменяемый dst сначала уходит в резервную копию: при повторе после падения
+        # резервная копия уже есть, и dst на ее месте - это уже новый файл
+        os.makedirs(os.path.dirname(backup), exist_ok=True)
+        _move(dst, backup)
+    if op == 'move':
+        if not os.path.lexists(src) and os.path.lexists(dst):
+            # уже перенесен до падения, отметка не успела попасть в журнал
+            return 'done'
+        _move(src, dst)
+    elif op == 'copy':
+        _replace_via_copy(src, dst)
+    else:
+        # ссылка тоже появляется под временным именем: dst либо готов, либо его нет
+        op = materialize_file(src, dst + TMP_SUFFIX, op)
+        os.replace(dst + TMP_SUFFIX, dst)
+    return op
+
+
+def _undo(operation, backup=None):
+    op, src, dst = operation
+    if os.path.lexists(dst + TMP_SUFFIX):
+        os.remove(dst + TMP_SUFFIX)
+    if backup and not os.path.lexists(backup):
+        # резервная копия делается первой: без нее операция не начиналась, dst - прежний
+        return 'untouched'
+    result = 'untouched'
+    if op == 'move':
+        if os.path.lexists(dst) and not os.path.lexists(src):
+            _move(dst, src)
+            result = 'restored'
+    elif os.path.lexists(dst):
+        os.remove(dst)
+        result = 'removed'
+    if backup:
+        if os.path.lexists(dst):
+            os.remove(dst)
+        _move(backup, dst)
+        result = 'restored'
+    return result
+
+
+def validate_plan(operations, replace=False):
+    """
+    Check the whole plan before touching anything: every src exists,
+    no dst repeats in the plan or exists (unless replace). Raises ValueError with the problems.
+    """
+    problems = []
+    seen = set()
+    for op, src, dst in operations:
+        if op not in OPERATIONS:
+            problems.append(f"неизвестная операция {op}")
+        if not os.path.lexists(src):
+            problems.append(f"нет исходного файла {src}")
+        if dst in seen:
+            problems.append(f"два файла в один {dst}")
+        elif os.path.lexists(dst) and not replace:
+            problems.append(f"файл уже существует {dst}")
+        seen.add(dst)
+    if problems:
+        shown = '\n'.join(problems[:20])
+        raise ValueError(f"План не выполнен, проблем: {len(problems)}\n{shown}")
+
+
+def _already_done(operation):
+    """dst already is what the operation would make (a move is never done while src exists)"""
+    op, src, dst = operation
+    if op == 'move' or not os.path.lexists(dst):
+        return False
+    if op in ('hardlink', 'symlink'):
+        if has_form(src, dst, op):
+            return True
+        if op == 'symlink':
+            return False
+    # copy/reflink (и hardlink, откатившийся на copy на другом разделе): независимый файл
+    # с тем же содержимым. Ссылка на src от прошлого запуска в другом режиме не годится
+    if os.path.islink(dst) or not os.path.isfile(dst):
+        return False
+    src_stat, dst_stat = os.stat(src), os.stat(dst)
+    if (src_stat.st_dev, src_stat.st_ino) == (dst_stat.st_dev, dst_stat.st_ino):
+        return False
+    if op == 'hardlink' and src_stat.st_dev == dst_stat.st_dev:
+        return False
+    return filecmp.cmp(src, dst, shallow=False)
+
+
+def overwrite_plan(operations, num_threads=16):
+    """
+    For tools rerun into the same dst that used to overwrite it (shutil.copy2/move):
+    operations whose dst already is what they would make are dropped - a copy with
+    the same content that is not a link to src, a hardlink/symlink of the requested
+    form. The rest stay in the plan; run it with execute_plan(..., replace=True)
+    so an existing dst is replaced through the journal and rollback restores it.
+    Returns (operations left, number of skipped, number of dst to replace).
+    """
+    with ThreadPoolExecutor(num_threads) as executor:
+        done = list(executor.map(_already_done, operations))
+    left = [operation for operation, d in zip(operations, done) if not d]
+    replaced = sum(os.path.lexists(dst) for _, _, dst in left)
+    return left, sum(done), replaced
+
+
+def read_journal(journal_path):
+    """
+    -> (operations, done indices, status, replaced indices) where status is
+    'running' or 'committed', replaced - operations whose old dst is backed up
+    """
+    operations, done, status, replaced = [], set(), 'running', set()
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # последняя строка могла оборваться при падении
+                continue
+            if 'op' in record:
+                if record.get('replace'):
+                    replaced.add(len(operations))
+                operations.append((record['op'], record['src'], record['dst']))
+            elif 'done' in record:
+                done.add(record['done'])
+            elif 'status' in record:
+                status = record['status']
+    return operations, done, status, replaced
+
+
+def _write_plan(journal_path, operations, replaced=()):
+    # план появляется целиком: пишется во временный файл и переименовывается
+    tmp = journal_path + TMP_SUFFIX
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'version': JOURNAL_VERSION}) + '\n')
+        for i, (op, src, dst) in enumerate(operations):
+            record = {'op': op, 'src': src, 'dst': dst}
+            if i in replaced:
+                record['replace'] = True
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, journal_path)
+
+
+def _run(operations, todo, journal_path, num_threads, desc, replaced=()):
+    for dst_dir in {os.path.dirname(operations[i][2]) for i in todo}:
+        if dst_dir:
+            os.makedirs(dst_dir, exist_ok=True)
+
+    used = Counter()
+    executor = ThreadPoolExecutor(num_threads)
+    with open(journal_path, 'a', encoding='utf-8') as journal:
+        try:
+            results = executor.map(lambda i: (i, _apply(operations[i], _backup_path(journal_path, i)
+                                                          if i in replaced else None)), todo)
+            for n, (i, result) in enumerate(tqdm(results, total=len(todo), desc=desc, disable=not todo)):
+                used[result] += 1
+                journal.write(f'{{"done": {i}}}\n')
+                if n % FLUSH_EVERY == 0:
+                    journal.flush()
+        except BaseException:
+            # ошибка или Ctrl+C: не начинаем новые операции, журнал остается незавершенным
+            executor.shutdown(wait=True, cancel_futures=True)
+            journal.flush()
+            print(f"Прервано, доделать или откатить: python {os.path.abspath(__file__)} resume|rollback {journal_path}")
+            raise
+        executor.shutdown()
+        journal.write(json.dumps({'status': 'committed'}) + '\n')
+        journal.flush()
+        os.fsync(journal.fileno())
+    return used
+
+
+def execute_plan(operations, journal_path, num_threads=16, desc=None, replace=False):
+    """
+    Validate and run a batch of (op, src, dst) operations, op in OPERATIONS.
+    The plan is journaled in journal_path before anything is touched;
+    a run interrupted by a crash is finished with resume_journal or undone with rollback_journal.
+    replace=True allows existing dst: the old file is moved to a backup next to
+    the journal first, rollback_journal puts it back.
+    Returns Counter of done operations.
+    """
+    operations = [(op, os.path.abspath(src), os.path.abspath(dst)) for op, src, dst in operations]
+    if os.path.exists(journal_path) and read_journal(journal_path)[2] != 'committed':
+        raise RuntimeError(f"Есть незавершенный журнал {journal_path}: "
+                           f"python {os.path.abspath(__file__)} resume|rollback {journal_path}")
+    validate_plan(operations, replace)
+    replaced = {i for i, (_, _, dst) in enumerate(operations) if os.path.lexists(dst)} if replace else set()
+    os.makedirs(os.path.dirname(os.path.abspath(journal_path)), exist_ok=True)
+    # прошлый пакет завершен, его журнал сейчас будет перезаписан - его резервные копии больше не нужны
+    shutil.rmtree(journal_path + BACKUP_SUFFIX, ignore_errors=True)
+    _write_plan(journal_path, operations, replaced)
+    return _run(operations, list(range(len(operations))), journal_path, num_threads, desc or 'files', replaced)
+
+
+def resume_journal(journal_path, num_threads=16, desc=None):
+    """Finish operations of an interrupted run"""
+    operations, done, status, replaced = read_journal(journal_path)
+    if status == 'committed':
+        print(f"Журнал {journal_path} уже завершен")
+        return Counter()
+    todo = [i for i in range(len(operations)) if i not in done]
+    print(f"Выполнено {len(done)} из {len(operations)}, осталось {len(todo)}")
+    return _run(operations, todo, journal_path, num_threads, desc or 'resume', replaced)
+
+
+def rollback_journal(journal_path, num_threads=16, desc=None):
+    """
+    Undo all operations of a journal (finished or not): moved files go back,
+    copies and links are removed, replaced dst are restored from their backups.
+    The journal is renamed to *.rolledback afterwards.
+    """
+    operations, _, _, replaced = read_journal(journal_path)
+    backups = [_backup_path(journal_path, i) if i in replaced else None for i in range(len(operations))]
+    with ThreadPoolExecutor(num_threads) as executor:
+        results = executor.map(_undo, operations[::-1], backups[::-1])
+        used = Counter(tqdm(results, total=len(operations), desc=desc or 'rollback', disable=not operations))
+    shutil.rmtree(journal_path + BACKUP_SUFFIX, ignore_errors=True)
+    os.replace(journal_path, journal_path + '.rolledback')
+    return used
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resume or roll back a batch of file operations by its journal")
+    parser.add_argument('action', choices=['status', 'resume', 'rollback'])
+    parser.add_argument('journal', help=f"path to {JOURNAL_NAME}")
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args()
+
+    if args.action == 'status':
+        operations, done, status, replaced = read_journal(args.journal)
+        print(f"{status}: {len(done)} of {len(operations)} done, {dict(Counter(op for op, _, _ in operations))}, "
+              f"replacing existing: {len(replaced)}")
+    elif args.action == 'resume':
+        print(dict(resume_journal(args.journal, args.threads)))
+    else:
+        print(dict(rollback_journal(args.journal, args.threads)))
@@ -0,0 +1,91 @@
+import os
+
+import cv2
+from PIL import Image
+
+from image_probe import probe_image
+
+# Коэффициенты уменьшения, которые libjpeg умеет делать прямо при декодировании
+REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+JPEG_EXTENSIONS = {'.jpg', '.jpeg', '.jpe', '.jfif'}
+
+
+def image_size(path):
+    """(width, height) from the file header, pixels are not decoded"""
+    info = probe_image(path, check=False)
+    if info.width:
+        return info.width, info.height
+    with Image.open(path) as img:
+        return img.size
+
+
+def fit_size(src_size, box_size):
+    """Size of src_size scaled to fit into box_size keeping aspect ratio"""
+    scale = min(box_size[0] / src_size[0], box_size[1] / src_size[1])
+    return max(1, int(src_size[0] * scale)), max(1, int(src_size[1] * scale))
+
+
+def reduce_factor(src_size, target_size):
+    """
+    Largest decode reduction (1, 2, 4 or 8) that still keeps the decoded
+    image not smaller than target_size. Sizes are (width, height).
+    """
+    src_w, src_h = src_size
+    target_w, target_h = target_size
+    for factor in (8, 4, 2):
+        if src_w // factor >= target_w and src_h // factor >= target_h:
+            return factor
+    return 1
+
+
+def imread_reduced(path, src_size, target_size):
+    """
+    cv2.imread that decodes JPEG at 1/2, 1/4 or 1/8 scale when the result is
+    going to be downscaled to target_size anyway. Other formats and small
+    downscales fall back to full decode.
+    """
+    factor = reduce_factor(src_size, target_size)
+    if factor > 1 and os.path.splitext(path)[1].lower() in JPEG_EXTENSIONS:
+        return cv2.imread(path, REDUCED_FLAGS[factor])
+    return cv2.imread(path)
+
+
+def imread_fit(path, box_size):
+    """
+    cv2.imread for an image that is going to be downscaled to fit into
+    box_size (width, height). Decodes at reduced scale when possible,
+    the caller still resizes to the exact size it needs.
+    """
+    try:
+        src_size = image_size(path)
+    except Exception:
+        return cv2.imread(path)
+    return imread_reduced(path, src_size, fit_size(src_size, box_size))
+
+
+def imread_preview(path, max_side):
+    """cv2.imread for a preview whose longest side is max_side (not resized yet)"""
+    return imread_fit(path, (max_side, max_side))
+
+
+def resize_max_side(img, max_side, interpolation=cv2.INTER_AREA):
+    """Downscale cv2 image so that its longest side is max_side"""
+    h, w = img.shape[:2]
+    if max(h, w) <= max_side:
+        return img
+    new_w, new_h = fit_size((w, h), (max_side, max_side))
+    return cv2.resize(img, (new_w, new_h), interpolation=interpolation)
+
+
+def open_reduced(path, target_size):
+    """
+    PIL Image.open with JPEG draft mode: decoded at 1/2, 1/4 or 1/8 scale but
+    not smaller than target_size (width, height). Other formats open as is.
+    """
+    img = Image.open(path)
+    img.draft(img.mode, tuple(target_size))
+    return img
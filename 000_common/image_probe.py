@@ -0,0 +1,170 @@
+import os
+import struct
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp'}
+
+ImageInfo = namedtuple('ImageInfo', ['path', 'width', 'height', 'format', 'file_size', 'valid'])
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_IEND = b'\x00\x00\x00\x00IEND\xaeB`\x82'
+# SOF маркеры, в которых лежат размеры JPEG (без DHT/JPG/DAC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Хвост, в котором ищем EOI: некоторые камеры дописывают данные после него
+JPEG_TAIL = 4096
+
+
+def _jpeg_size(f):
+    """Walk JPEG markers from SOI up to the first SOF segment"""
+    pos = 2
+    while True:
+        f.seek(pos)
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        # Пропускаем fill bytes 0xFF
+        while marker[1] == 0xFF:
+            marker = marker[1:] + f.read(1)
+            pos += 1
+            if len(marker) < 2:
+                return None
+        code = marker[1]
+        if code == 0x01 or 0xD0 <= code <= 0xD8:
+            pos += 2
+            continue
+        if code in (0xD9, 0xDA):
+            return None
+        length = f.read(2)
+        if len(length) < 2:
+            return None
+        if code in JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack('>HH', data[1:5])
+            return width, height
+        pos += 2 + struct.unpack('>H', length)[0]
+
+
+def _webp_size(head):
+    chunk = head[12:16]
+    if chunk == b'VP8X':
+        width = 1 + int.from_bytes(head[24:27], 'little')
+        height = 1 + int.from_bytes(head[27:30], 'little')
+        return width, height
+    if chunk == b'VP8 ' and head[23:26] == b'\x9d\x01\x2a':
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and head[20] == 0x2F:
+        bits = int.from_bytes(head[21:25], 'little')
+        return 1 + (bits & 0x3FFF), 1 + ((bits >> 14) & 0x3FFF)
+    return None
+
+
+def _pil_size(path):
+    """Fallback for formats without own parser: PIL reads only the header"""
+    from PIL import Image
+    with Image.open(path) as img:
+        return img.size, img.format.lower()
+
+
+def probe_image(path, check=True, file_size=None):
+    """
+    Read image dimensions from the file header without decoding pixels.
+
+    check=True also does a cheap structural check of the file end
+    (JPEG EOI marker, PNG IEND chunk, WebP RIFF size, GIF trailer), which
+    catches truncated downloads and interrupted copies.
+    Returns ImageInfo; width/height are None and valid is False if the file
+    can't be parsed.
+    """
+    if file_size is None:
+        try:
+            file_size = os.path.getsize(path)
+        except OSError:
+            return ImageInfo(path, None, None, None, None, False)
+
+    size, fmt, valid = None, None, False
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(32)
+            if head[:2] == b'\xff\xd8':
+                fmt = 'jpeg'
+                size = _jpeg_size(f)
+                if size and check:
+                    f.seek(max(0, file_size - JPEG_TAIL))
+                    valid = b'\xff\xd9' in f.read()
+            elif head[:8] == PNG_SIGNATURE:
+                fmt = 'png'
+                if head[12:16] == b'IHDR':
+                    size = struct.unpack('>II', head[16:24])
+                if size and check:
+                    f.seek(max(0, file_size - len(PNG_IEND)))
+                    valid = f.read() == PNG_IEND
+            elif head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+                fmt = 'webp'
+                size = _webp_size(head)
+                valid = struct.unpack('<I', head[4:8])[0] + 8 <= file_size
+            elif head[:3] == b'GIF':
+                fmt = 'gif'
+                size = struct.unpack('<HH', head[6:10])
+                if check:
+                    f.seek(file_size - 1)
+                    valid = f.read(1) == b';'
+            elif head[:2] == b'BM':
+                fmt = 'bmp'
+                width, height = struct.unpack('<ii', head[18:26])
+                size = (width, abs(height))
+                valid = struct.unpack('<I', head[2:6])[0] <= file_size
+            else:
+                size, fmt = _pil_size(path)
+                valid = True
+    except Exception:
+        size = None
+
+    if not size or not size[0] or not size[1]:
+        return ImageInfo(path, None, None, fmt, file_size, False)
+    return ImageInfo(path, int(size[0]), int(size[1]), fmt, file_size, valid or not check)
+
+
+def is_valid_image(path):
+    """Header + file end check instead of full decode with cv2.imread"""
+    return probe_image(path).valid
+
+
+def list_images(directory, recursive=False, extensions=IMAGE_EXTENSIONS):
+    """
+    Image files of a directory via os.scandir: (path, file_size, mtime).
+    Stat comes from the directory entry, so no extra syscall per file on
+    Windows and one cheap stat on other systems.
+    """
+    found = []
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        with os.scandir(current) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        stack.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in extensions and entry.is_file():
+                    stat = entry.stat()
+                    found.append((entry.path, stat.st_size, stat.st_mtime))
+    return found
+
+
+def probe_images(files, check=False, num_threads=32):
+    """Probe (path, file_size, ...) items from list_images in a thread pool"""
+    if not files:
+        return []
+    with ThreadPoolExecutor(num_threads) as executor:
+        return list(executor.map(lambda item: probe_image(item[0], check, item[1]), files))
+
+
+def scan_images(directory, recursive=False, check=False, num_threads=32, extensions=IMAGE_EXTENSIONS):
+    """
+    Probe all images of a directory in a thread pool.
+    Returns a list of ImageInfo in scandir order.
+    """
+    return probe_images(list_images(directory, recursive, extensions), check, num_threads)
@@ -0,0 +1,297 @@
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import cv2
+import numpy as np
+
+from image_io import imread_preview, resize_max_side
+
+CACHE_NAME = '.render_cache.pkl'
+CACHE_VERSION = 2
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+# сколько изображений одновременно в работе на один процесс: ограничивает память
+# под готовые, но еще не записанные превью
+PENDING_PER_WORKER = 4
+# не отмечать в кэше файлы, измененные только что (грубый mtime на FAT/exFAT)
+MTIME_SLACK = 2.0
+
+
+class LabelStyle:
+    """
+    Colors and label text of every class with glyph sizes measured once
+    (cv2.getTextSize per class, not per box).
+    """
+
+    def __init__(self, class_names, colors, box_thickness=2, font_scale=0.6, font_thickness=2):
+        self.class_names = list(class_names)
+        self.colors = [tuple(int(c) for c in color) for color in colors]
+        self.box_thickness = int(box_thickness)
+        self.font_scale = font_scale
+        self.font_thickness = int(font_thickness)
+        # (ширина текста, высота текста, baseline) для каждого класса
+        self.text_sizes = np.array([
+            (*size, baseline) for size, baseline in
+            (cv2.getTextSize(name, FONT, font_scale, self.font_thickness) for name in self.class_names)
+        ], dtype=np.int64).reshape(-1, 3)
+
+    def fingerprint(self):
+        """Everything that changes the picture: cached renders with another style are redone"""
+        return (self.class_names, self.colors, self.box_thickness, self.font_scale, self.font_thickness)
+
+
+def read_boxes(label_path):
+    """
+    bbox rows of a YOLO label file as arrays: class ids (n,), boxes (n, 4).
+    Rows that are not 5 numbers are skipped. Returns None if there is no file.
+    """
+    try:
+        with open(label_path, 'r') as f:
+            rows = [line.split() for line in f]
+    except FileNotFoundError:
+        return None
+    rows = [row for row in rows if len(row) == 5]
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 4))
+    try:
+        values = np.array(rows, dtype=np.float64)
+    except ValueError:
+        values = np.array([row for row in rows if _is_numeric(row)], dtype=np.float64).reshape(-1, 5)
+    return values[:, 0].astype(np.int64), values[:, 1:]
+
+
+def read_label(label_path):
+    """
+    All rows of a YOLO label file: (box classes (n,), boxes (n, 4), polygons)
+    where polygons is a list of (class_id, (k, 2) points) of segmentation rows.
+    Returns None if there is no file.
+    """
+    try:
+        with open(label_path, 'r') as f:
+            rows = [line.split() for line in f]
+    except FileNotFoundError:
+        return None
+    box_rows, polygons = [], []
+    for row in rows:
+        if not _is_numeric(row):
+            continue
+        if len(row) == 5:
+            box_rows.append(row)
+        elif len(row) >= 7 and len(row) % 2:
+            polygons.append((int(float(row[0])), np.array(row[1:], dtype=np.float64).reshape(-1, 2)))
+    values = np.array(box_rows, dtype=np.float64).reshape(-1, 5)
+    return values[:, 0].astype(np.int64), values[:, 1:], polygons
+
+
+def _is_numeric(row):
+    try:
+        [float(v) for v in row]
+        return True
+    except ValueError:
+        return False
+
+
+def valid_boxes(classes, boxes, n_classes):
+    """Mask of boxes with a known class and coordinates in [0, 1], one vectorized check"""
+    return (classes >= 0) & (classes < n_classes) & ((boxes >= 0) & (boxes <= 1)).all(axis=1)
+
+
+def draw_labels(image, classes, boxes, style):
+    """
+    Draw boxes with class captions. Pixel corners and caption rectangles
+    of all boxes are computed at once from the arrays, only the cv2 drawing
+    calls are per box.
+    """
+    height, width = image.shape[:2]
+    xy = boxes[:, :2]
+    half = boxes[:, 2:] / 2
+    corners = (np.hstack([xy - half, xy + half]) * [width, height, width, height]).astype(np.int64)
+    text_w, text_h, baseline = style.text_sizes[classes].T
+    for (x1, y1, x2, y2), class_id, tw, th, bl in zip(corners.tolist(), classes.tolist(),
+                                                      text_w.tolist(), text_h.tolist(), baseline.tolist()):
+        color = style.colors[class_id]
+        cv2.rectangle(image, (x1, y1), (x2, y2), color, style.box_thickness)
+        cv2.rectangle(image, (x1, y1 - th - bl), (x1 + tw, y1), color, -1)
+        cv2.putText(image, style.class_names[class_id], (x1, y1 - bl), FONT, style.font_scale,
+                    (255, 255, 255), style.font_thickness)
+    return image
+
+
+def draw_polygons(image, polygons, style, alpha=0.4):
+    """Segmentation polygons: translucent fill of the class color, outline and caption at the centroid"""
+    polygons = [(c, p) for c, p in polygons if 0 <= c < len(style.class_names)]
+    if not polygons:
+        return image
+    height, width = image.shape[:2]
+    points = [np.round(p * [width, height]).astype(np.int32) for _, p in polygons]
+    overlay = image.copy()
+    for (class_id, _), pts in zip(polygons, points):
+        cv2.fillPoly(overlay, [pts], style.colors[class_id])
+    cv2.addWeighted(overlay, alpha, image, 1 - alpha, 0, dst=image)
+    for (class_id, _), pts in zip(polygons, points):
+        cv2.polylines(image, [pts], True, style.colors[class_id], max(1, style.box_thickness // 2))
+        x, y = pts.mean(axis=0).astype(int)
+        cv2.putText(image, style.class_names[class_id], (int(x), int(y)), FONT, style.font_scale,
+                    (255, 255, 255), style.font_thickness)
+    return image
+
+
+def _encode_params(path, jpeg_quality):
+    if os.path.splitext(path)[1].lower() in ('.jpg', '.jpeg'):
+        return [cv2.IMWRITE_JPEG_QUALITY, int(jpeg_quality)]
+    return []
+
+
+def render_image(task, style, max_side=None, jpeg_quality=90):
+    """
+    Worker: decode (reduced for previews), draw, encode. The file is written by
+    the caller. Returns dict: image, dst, status ('rendered' | 'failed'),
+    has_label, counts (boxes per class), skipped (invalid boxes), data (encoded bytes).
+    """
+    img_path, label_path, dst_path = task
+    result = {'image': img_path, 'dst': dst_path, 'status': 'failed', 'has_label': False,
+              'counts': np.zeros(len(style.class_names), dtype=np.int64), 'skipped': 0, 'data': None}
+    if max_side:
+        # превью: JPEG декодируется сразу в уменьшенном размере
+        image = imread_preview(img_path, max_side)
+        if image is not None:
+            image = resize_max_side(image, max_side)
+    else:
+        image = cv2.imread(img_path)
+    if image is None:
+        return result
+
+    labels = read_boxes(label_path)
+    if labels is not None:
+        result['has_label'] = True
+        classes, boxes = labels
+        valid = valid_boxes(classes, boxes, len(style.class_names))
+        result['skipped'] = int((~valid).sum())
+        classes, boxes = classes[valid], boxes[valid]
+        result['counts'] = np.bincount(classes, minlength=len(style.class_names))
+        draw_labels(image, classes, boxes, style)
+
+    ok, data = cv2.imencode(os.path.splitext(dst_path)[1] or '.jpg', image,
+                            _encode_params(dst_path, jpeg_quality))
+    if ok:
+        result['status'], result['data'] = 'rendered', data.tobytes()
+    return result
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+class RenderCache:
+    """
+    dst path -> (image mtime, label mtime, boxes per class, has label) of the last render,
+    stored next to the renders. A task is skipped when both mtimes are the same,
+    the render exists and neither the style nor the output size/quality changed.
+    """
+
+    def __init__(self, cache_path, style, max_side=None, jpeg_quality=90):
+        self.cache_path = cache_path
+        # превью другого размера или качества - это другая картинка, как и другой стиль
+        self.fingerprint = (style.fingerprint(), max_side, int(jpeg_quality))
+        self.entries = {}
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as f:
+                    data = pickle.load(f)
+                if data.get('version') == CACHE_VERSION and data.get('style') == self.fingerprint:
+                    self.entries = data['entries']
+            except (OSError, pickle.UnpicklingError, EOFError):
+                pass
+
+    def lookup(self, task, stamps):
+        entry = self.entries.get(task[2])
+        if entry is None or entry[:2] != stamps or not os.path.exists(task[2]):
+            return None
+        return entry
+
+    def store(self, result, stamps):
+        if max(s or 0 for s in stamps) < time.time() - MTIME_SLACK:
+            self.entries[result['dst']] = (*stamps, result['counts'], result['has_label'])
+
+    def save(self):
+        if not self.cache_path:
+            return
+        tmp = self.cache_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump({'version': CACHE_VERSION, 'style': self.fingerprint, 'entries': self.entries}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.cache_path)
+
+
+def _write(result):
+    with open(result['dst'], 'wb') as f:
+        f.write(result['data'])
+
+
+def render_labels(tasks, style, max_side=None, jpeg_quality=90, num_workers=None, cache_path=None,
+                  progress=None):
+    """
+    Render (image, label, dst) tasks in a process pool.
+
+    Images whose image and label mtimes did not change since the last render
+    (see RenderCache) are not decoded again and come back with status 'cached'.
+    Only num_workers * PENDING_PER_WORKER images are in flight at once,
+    encoded renders are written by a separate writer thread.
+    Yields result dicts (see render_image, without data) in completion order.
+    progress: optional callable(n) called for every finished task.
+    """
+    cache = RenderCache(cache_path, style, max_side, jpeg_quality)
+    stamps = {}
+    todo = []
+    with ThreadPoolExecutor(16) as executor:
+        all_stamps = list(executor.map(lambda t: (_mtime(t[0]), _mtime(t[1])), tasks))
+    for task, task_stamps in zip(tasks, all_stamps):
+        entry = cache.lookup(task, task_stamps)
+        if entry is None:
+            todo.append(task)
+            stamps[task[2]] = task_stamps
+        else:
+            if progress:
+                progress(1)
+            yield {'image': task[0], 'dst': task[2], 'status': 'cached', 'has_label': entry[3],
+                   'counts': entry[2], 'skipped': 0}
+
+    for dst_dir in {os.path.dirname(task[2]) for task in todo}:
+        os.makedirs(dst_dir, exist_ok=True)
+
+    num_workers = num_workers or os.cpu_count()
+    window = num_workers * PENDING_PER_WORKER
+    try:
+        with ProcessPoolExecutor(num_workers) as pool, ThreadPoolExecutor(1) as writer:
+            pending, writes = set(), set()
+            todo_iter = iter(todo)
+            while True:
+                for task in todo_iter:
+                    pending.add(pool.submit(render_image, task, style, max_side, jpeg_quality))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    if result['status'] == 'rendered':
+                        writes.add(writer.submit(_write, result))
+                        cache.store(result, stamps[result['dst']])
+                    result = {k: v for k, v in result.items() if k != 'data'}
+                    if progress:
+                        progress(1)
+                    yield result
+                # запись тоже ограничена: не держим в памяти больше window готовых превью
+                if len(writes) >= window:
+                    finished, writes = wait(writes, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        future.result()
+            for future in writes:
+                future.result()
+    finally:
+        cache.save()
@@ -0,0 +1,136 @@
+import csv
+import errno
+import os
+import shutil
+import subprocess
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from tqdm import tqdm
+
+# copy     - обычная копия (shutil.copy2)
+# hardlink - жесткая ссылка, ноль лишнего места, только в пределах одного раздела
+# reflink  - copy-on-write клон (btrfs, xfs, APFS), независимая копия без копирования данных
+# symlink  - символическая ссылка на абсолютный путь исходника
+# manifest - файлы не трогаются, пишется только manifest.csv со списком src -> dst
+LINK_MODES = ('copy', 'hardlink', 'reflink', 'symlink', 'manifest')
+MANIFEST_NAME = 'manifest.csv'
+
+# ioctl FICLONE из linux/fs.h
+FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    if sys.platform == 'darwin':
+        # cp -c делает clonefile() на APFS
+        subprocess.run(['cp', '-c', src, dst], check=True, capture_output=True)
+        return
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+
+def has_form(src, dst, mode):
+    """
+    True when dst already is src in the given mode and can stay as is:
+    hardlink - the same inode and not a symlink, symlink - a symlink to src.
+    copy and reflink are never taken as done here: a link left by an earlier
+    run would make the "independent" copy an alias of the source.
+    """
+    if not os.path.lexists(dst):
+        return False
+    if mode == 'hardlink':
+        return not os.path.islink(dst) and os.path.samefile(src, dst)
+    if mode == 'symlink':
+        return os.path.islink(dst) and os.path.realpath(dst) == os.path.realpath(src)
+    return False
+
+
+def _remove_existing(src, dst, mode):
+    """
+    Remove dst before writing it, so an old link is replaced, not written through.
+    Returns False when there is nothing to do: dst is the path of src itself,
+    or dst already has the requested form (see has_form).
+    """
+    if not os.path.lexists(dst):
+        return True
+    if os.path.realpath(src) == os.path.realpath(dst) and not os.path.islink(dst):
+        return False
+    if has_form(src, dst, mode):
+        return False
+    os.remove(dst)
+    return True
+
+
+def materialize_file(src, dst, mode='copy'):
+    """
+    Put src to dst with the given mode (see LINK_MODES).
+    hardlink and reflink fall back to copy when the filesystem can't do it
+    (other device, FAT/exFAT, no CoW support).
+    Returns the mode that was actually used.
+    """
+    if mode == 'manifest':
+        return mode
+    # Копия поверх ссылки от прошлого запуска писала бы прямо в исходник
+    if not _remove_existing(src, dst, mode):
+        return mode
+
+    try:
+        if mode == 'copy':
+            shutil.copy2(src, dst)
+        elif mode == 'hardlink':
+            os.link(src, dst)
+        elif mode == 'symlink':
+            os.symlink(os.path.abspath(src), dst)
+        elif mode == 'reflink':
+            _reflink(src, dst)
+        else:
+            raise ValueError(f"Неизвестный режим {mode}, доступны: {LINK_MODES}")
+        return mode
+    except (OSError, subprocess.CalledProcessError) as e:
+        if mode in ('copy', 'symlink') or (isinstance(e, OSError) and e.errno == errno.ENOENT):
+            raise
+        if os.path.lexists(dst):
+            os.remove(dst)
+        shutil.copy2(src, dst)
+        return 'copy'
+
+
+def write_manifest(manifest_path, pairs):
+    """CSV with src,dst columns: the dataset without touching files"""
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    with open(manifest_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['src', 'dst'])
+        for src, dst in pairs:
+            writer.writerow([os.path.abspath(src), os.path.abspath(dst)])
+
+
+def materialize_files(pairs, mode='copy', manifest_path=None, num_threads=16, desc=None):
+    """
+    Materialize a list of (src, dst) pairs in a thread pool.
+
+    Parent directories of dst are created once per directory, not per file.
+    For mode='manifest' only manifest_path is written.
+    Returns Counter of the modes actually used, e.g. {'hardlink': 9990, 'copy': 10}
+    when part of the files were on another device.
+    """
+    if mode not in LINK_MODES:
+        raise ValueError(f"Неизвестный режим {mode}, доступны: {LINK_MODES}")
+    pairs = list(pairs)
+
+    if mode == 'manifest':
+        if manifest_path is None:
+            raise ValueError("Для режима manifest нужен путь manifest_path")
+        write_manifest(manifest_path, pairs)
+        return Counter({mode: len(pairs)})
+
+    for dst_dir in {os.path.dirname(dst) for _, dst in pairs}:
+        if dst_dir:
+            os.makedirs(dst_dir, exist_ok=True)
+
+    with ThreadPoolExecutor(num_threads) as executor:
+        used = executor.map(lambda pair: materialize_file(pair[0], pair[1], mode), pairs)
+        return Counter(tqdm(used, total=len(pairs), desc=desc or mode, disable=not pairs))
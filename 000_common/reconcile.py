@@ -0,0 +1,178 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from image_probe import IMAGE_EXTENSIONS
+from file_ops import execute_plan, JOURNAL_NAME
+
+LABEL_EXTENSIONS = {'.txt'}
+# images_without_labels - изображение без файла разметки
+# labels_without_images - разметка без изображения
+# duplicate_images / duplicate_labels - один stem с разными расширениями (a.jpg и a.png),
+#                                       первый по пути считается основным, остальные - дубли
+# empty_labels - пустая разметка (для YOLO это фон, по умолчанию только в отчет)
+ISSUES = ('images_without_labels', 'labels_without_images',
+          'duplicate_images', 'duplicate_labels', 'empty_labels')
+ACTIONS = ('report', 'move', 'delete')
+REPORT_NAME = 'reconcile_report.csv'
+# самая короткая строка разметки "0 0 0 0 0" - 9 байт: файлы меньше этого не могут содержать
+# объект и дочитываются (пробелы/переводы строк), остальные не открываются
+SMALL_LABEL = 9
+
+
+def stem_key(relative_path):
+    """Relative path without extension: images/a/b/x.jpg and labels/a/b/x.txt share a/b/x"""
+    return os.path.splitext(relative_path)[0]
+
+
+def _scan(directory, start, extensions, with_size, recursive):
+    """(key, path, size) of matching files; stat only when the size is needed"""
+    found = []
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        with os.scandir(current) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        stack.append(entry.path)
+                    continue
+                ext = os.path.splitext(entry.name)[1]
+                if ext.lower() in extensions:
+                    # ключ = stem_key(относительный путь), без второго splitext
+                    path = entry.path
+                    found.append((path[start:len(path) - len(ext)], path,
+                                  entry.stat().st_size if with_size else -1))
+    return found
+
+
+def index_by_stem(directory, extensions, with_size=False, num_threads=16):
+    """
+    One os.scandir pass over a nested tree, top-level subdirectories in parallel.
+    Returns DataFrame: key (relative path without extension), path, size (-1 without with_size).
+    """
+    directory = os.path.abspath(directory)
+    start = len(os.path.join(directory, ''))
+    found = _scan(directory, start, extensions, with_size, recursive=False)
+    with os.scandir(directory) as entries:
+        subdirs = [entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+    with ThreadPoolExecutor(num_threads) as executor:
+        for files in executor.map(lambda d: _scan(d, start, extensions, with_size, recursive=True), subdirs):
+            found += files
+
+    df = pd.DataFrame(found, columns=['key', 'path', 'size'])
+    return df.sort_values('path', ignore_index=True)
+
+
+def _duplicated(codes):
+    """True for every repeat of a code except its first occurrence"""
+    first = np.zeros(len(codes), dtype=bool)
+    first[np.unique(codes, return_index=True)[1]] = True
+    return ~first
+
+
+def _is_blank(path):
+    with open(path, 'rb') as f:
+        return not f.read().strip()
+
+
+def reconcile(images_dir, labels_dir, image_extensions=IMAGE_EXTENSIONS,
+              label_extensions=LABEL_EXTENSIONS, num_threads=16):
+    """
+    Match images and labels by relative stem.
+    Returns {issue: DataFrame(key, path, size)} for every issue in ISSUES
+    and 'pairs' - number of images that have a label.
+    """
+    images = index_by_stem(images_dir, image_extensions, num_threads=num_threads)
+    # размер нужен только разметке - для поиска пустых файлов
+    labels = index_by_stem(labels_dir, label_extensions, with_size=True, num_threads=num_threads)
+
+    # ключи обеих сторон -> общие целые коды одним хэшированием,
+    # дальше только операции над отсортированными массивами чисел
+    codes, _ = pd.factorize(np.concatenate([images['key'].to_numpy(object), labels['key'].to_numpy(object)]))
+    image_codes, label_codes = codes[:len(images)], codes[len(images):]
+
+    result = {}
+    # дубли: все кроме первого по пути с тем же ключом
+    image_dup = _duplicated(image_codes)
+    label_dup = _duplicated(label_codes)
+    result['duplicate_images'] = images[image_dup]
+    result['duplicate_labels'] = labels[label_dup]
+
+    # сироты: ключи, которых нет на другой стороне
+    has_label = np.isin(image_codes, label_codes)
+    has_image = np.isin(label_codes, image_codes)
+    result['images_without_labels'] = images[~has_label & ~image_dup]
+    result['labels_without_images'] = labels[~has_image & ~label_dup]
+    result['pairs'] = int((has_label & ~image_dup).sum())
+
+    # пустые: размер 0 по scandir, маленькие файлы дочитываются в потоках
+    small = labels[(labels['size'] < SMALL_LABEL) & ~label_dup]
+    with ThreadPoolExecutor(num_threads) as executor:
+        blank = list(executor.map(_is_blank, small['path']))
+    result['empty_labels'] = small[blank]
+
+    result['images'], result['labels'] = len(images), len(labels)
+    return result
+
+
+def print_summary(result):
+    print(f"images: {result['images']}, labels: {result['labels']}, pairs: {result['pairs']}")
+    for issue in ISSUES:
+        df = result[issue]
+        examples = ', '.join(os.path.basename(p) for p in df['path'][:5])
+        print(f"{issue}: {len(df)}" + (f" ({examples}{', ...' if len(df) > 5 else ''})" if len(df) else ''))
+
+
+def save_report(result, report_path):
+    """All found issues in one csv: issue, key, path, size"""
+    report = pd.concat([result[issue].assign(issue=issue) for issue in ISSUES], ignore_index=True)
+    report = report[['issue', 'key', 'path', 'size']]
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    report.to_csv(report_path, index=False)
+    return report_path
+
+
+def _side(issue, images_dir, labels_dir):
+    """(name, root) of the side the files of the issue belong to"""
+    if issue in ('images_without_labels', 'duplicate_images'):
+        return 'images', os.path.abspath(images_dir)
+    return 'labels', os.path.abspath(labels_dir)
+
+
+def apply_action(result, issues, action, images_dir, labels_dir, path_out=None, num_threads=16):
+    """
+    report - nothing is touched (see save_report);
+    move   - files of the issues go to path_out/<images|labels>/<relative path>
+             as one journaled batch (see file_ops);
+    delete - files of the issues are removed in a thread pool.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Неизвестное действие {action}, доступны: {ACTIONS}")
+    unknown = set(issues) - set(ISSUES)
+    if unknown:
+        raise ValueError(f"Неизвестные проблемы {sorted(unknown)}, доступны: {ISSUES}")
+    # файл может попасть в несколько проблем (пустая разметка без изображения) - берется первая
+    paths = {}
+    for issue in issues:
+        for path in result[issue]['path']:
+            paths.setdefault(path, issue)
+    paths = [(issue, path) for path, issue in paths.items()]
+    if action == 'report' or not paths:
+        return len(paths)
+
+    if action == 'move':
+        if path_out is None:
+            raise ValueError("Для move нужен path_out")
+        operations = []
+        for issue, path in paths:
+            side, root = _side(issue, images_dir, labels_dir)
+            operations.append(('move', path, os.path.join(path_out, side, os.path.relpath(path, root))))
+        execute_plan(operations, os.path.join(path_out, JOURNAL_NAME), num_threads, desc='move')
+    else:
+        with ThreadPoolExecutor(num_threads) as executor:
+            list(tqdm(executor.map(os.remove, [path for _, path in paths]), total=len(paths), desc='delete'))
+    return len(paths)
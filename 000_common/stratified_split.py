@@ -0,0 +1,236 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from dataset_manifest import class_matrix, count_columns, split_summary
+
+# Кадры fast_graber_frame называются {video_stem}_{idx}.jpg: группа - все до последнего _<число>
+GROUP_PATTERN = r'^(.+)_\d+$'
+
+
+def _fill_down(desired, amount):
+    """
+    Split amount items between subsets the way one-by-one "give to the subset
+    that still wants most" does: the largest desired values are lowered to a
+    common level first. Returns integer counts per subset.
+    """
+    need = np.maximum(desired, 0.0)
+    if need.sum() <= 0:
+        need = np.ones_like(desired)
+    if need.sum() <= amount:
+        # всем хватает, остаток делим пропорционально
+        share = need + (amount - need.sum()) * need / need.sum()
+    else:
+        order = np.sort(need)[::-1]
+        cumsum = np.cumsum(order)
+        # уровень: sum(max(need - level, 0)) == amount
+        k = np.arange(1, len(order) + 1)
+        levels = (cumsum - amount) / k
+        valid = levels >= np.append(order[1:], 0.0)
+        level = levels[np.argmax(valid)]
+        share = np.maximum(need - level, 0.0)
+    floor = np.floor(share + 1e-9).astype(np.int64)
+    rest = int(round(amount - floor.sum()))
+    floor[np.argsort(-(share - floor), kind='stable')[:rest]] += 1
+    return floor
+
+
+def _cut(values, counts):
+    """
+    Bounds that cut items with given values into consecutive chunks whose sums
+    are closest to counts. For unit values these are exactly cumsum(counts).
+    """
+    # элемент уходит в тот кусок, в который попадает его середина
+    middle = np.cumsum(values) - values / 2
+    return np.concatenate([[0], np.searchsorted(middle, np.cumsum(counts), side='right')])
+
+
+def iterative_stratification(matrix, sizes, seed=None, weights=None):
+    """
+    Multi-label iterative stratification (Sechidis et al.) on an
+    (images x classes) count matrix.
+
+    sizes: desired number of images per subset (sum == number of images).
+    Classes are processed from the rarest; all still unassigned images that
+    contain the class are split at once between subsets proportionally to how
+    many images of this class each subset still wants, then the wants of all
+    classes are updated with per-chunk column sums. Images without objects fill
+    the remaining subset sizes. Returns subset index per image.
+
+    weights: for groups of images (see group_matrix) - number of images in
+    each group, matrix then holds number of images with the class per group.
+    """
+    rng = np.random.default_rng(seed)
+    if weights is None:
+        presence = np.asarray(matrix) > 0
+        weights = np.ones(len(presence), dtype=np.int64)
+    else:
+        presence = np.asarray(matrix)
+        weights = np.asarray(weights)
+    n_images, n_classes = presence.shape
+    sizes = np.asarray(sizes, dtype=np.float64)
+    ratios = sizes / max(sizes.sum(), 1)
+
+    # сколько изображений каждого класса хочет каждое подмножество
+    desired = ratios[:, None] * presence.sum(axis=0)[None, :]
+    desired_size = sizes.copy()
+    assignment = np.full(n_images, -1, dtype=np.int64)
+    # сколько еще не распределенных изображений с каждым классом
+    left = presence.sum(axis=0)
+
+    for _ in range(n_classes):
+        candidates = np.flatnonzero(left > 0)
+        if not len(candidates):
+            break
+        # самый редкий из оставшихся классов, при равенстве случайный
+        rarest = candidates[left[candidates] == left[candidates].min()]
+        label = rng.choice(rarest)
+
+        images = np.flatnonzero((presence[:, label] > 0) & (assignment < 0))
+        images = images[rng.permutation(len(images))]
+        # при равном желании по классу - подмножеству, которому нужно больше изображений
+        wants = desired[:, label] + 1e-6 * np.maximum(desired_size, 0)
+        values = presence[images, label]
+        bounds = _cut(values, _fill_down(wants, int(values.sum())))
+
+        for subset in range(len(sizes)):
+            chunk = images[bounds[subset]:bounds[subset + 1]]
+            assignment[chunk] = subset
+            chunk_counts = presence[chunk].sum(axis=0)
+            desired[subset] -= chunk_counts
+            desired_size[subset] -= weights[chunk].sum()
+            left -= chunk_counts
+
+    # изображения без разметки (фон) добирают размеры подмножеств
+    background = np.flatnonzero(assignment < 0)
+    background = background[rng.permutation(len(background))]
+    values = weights[background]
+    bounds = _cut(values, _fill_down(desired_size, int(values.sum())))
+    for subset in range(len(sizes)):
+        assignment[background[bounds[subset]:bounds[subset + 1]]] = subset
+    return assignment
+
+
+def _group_key(path, regex):
+    # строковые операции вместо os.path: на миллионах путей в разы быстрее
+    name = path.rpartition(os.sep)[2]
+    stem = name.rpartition('.')[0] or name
+    match = regex.match(stem)
+    return match.group(1) if match else stem
+
+
+def add_groups(df, group_by='pattern', pattern=GROUP_PATTERN, recompute=False):
+    """
+    Add the 'group' column: images of one group always go to the same split.
+
+    group_by:
+      'pattern' - group from the file name by regex pattern (first capture group),
+                  default {video_stem}_{idx}.jpg -> video_stem; names that don't
+                  match are groups of their own
+      'parent'  - name of the parent folder (camera, date, ...)
+      any other - existing manifest column (source, class, ...)
+    Keys already in the 'group' column (a manifest saved earlier, merged
+    manifests of several sources) are kept, only rows without a key get one.
+    recompute=True derives all keys again (group_by or pattern changed).
+    """
+    df = df.copy()
+    if 'group' in df and not recompute:
+        missing = (df['group'].isna() | (df['group'].astype(str) == '')).to_numpy()
+    else:
+        missing = np.ones(len(df), dtype=bool)
+    if not missing.any():
+        return df
+    images = df['image'].to_numpy()[missing]
+    if group_by == 'pattern':
+        regex = re.compile(pattern)
+        keys = [_group_key(path, regex) for path in images]
+    elif group_by == 'parent':
+        keys = [path.rpartition(os.sep)[0].rpartition(os.sep)[2] for path in images]
+    elif group_by in df:
+        keys = df.loc[missing, group_by].astype(str).to_numpy()
+    else:
+        raise ValueError(f"Нет столбца {group_by} в манифесте, доступны: pattern, parent, {list(df.columns)}")
+    if 'group' not in df:
+        df['group'] = ''
+    df['group'] = df['group'].astype(object)
+    df.loc[missing, 'group'] = keys
+    return df
+
+
+def group_matrix(df, column='group'):
+    """
+    Per-group aggregates for the split:
+    group code per image, (groups x classes) number of images with the class, images per group.
+    """
+    codes, uniques = pd.factorize(df[column])
+    presence = class_matrix(df) > 0
+    order = np.argsort(codes, kind='stable')
+    sizes = np.bincount(codes, minlength=len(uniques))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    matrix = np.add.reduceat(presence[order].astype(np.int64), starts, axis=0) if len(df) else \
+        np.zeros((0, presence.shape[1]), dtype=np.int64)
+    return codes, matrix, sizes
+
+
+def subset_sizes(n_images, split_sizes):
+    """
+    {split: fraction or count} -> ([split names], [counts]).
+    Fractions (sum <= 1) are scaled to n_images, counts are taken as is;
+    what is left over goes to the '' split (not used for training).
+    """
+    names = list(split_sizes)
+    values = np.array([split_sizes[name] for name in names], dtype=np.float64)
+    if values.sum() <= 1.0 + 1e-9:
+        values = values * n_images
+    if values.sum() > n_images + 1e-9:
+        raise ValueError(f"Нужно {int(values.sum())} изображений, а есть {n_images}")
+    counts = np.floor(values + 1e-9).astype(np.int64)
+    # остаток от округления долей - подмножествам с наибольшей дробной частью
+    if np.allclose(values.sum(), n_images):
+        rest = n_images - counts.sum()
+        counts[np.argsort(-(values - counts), kind='stable')[:rest]] += 1
+    if counts.sum() < n_images:
+        names.append('')
+        counts = np.append(counts, n_images - counts.sum())
+    return names, counts
+
+
+def stratified_split(df, split_sizes, seed=0, groups=None):
+    """
+    Stratified split of a manifest with n_<class> columns
+    (see dataset_manifest.add_class_counts).
+
+    split_sizes: {'train': 0.8, 'val': 0.2} or counts {'train': 2500, 'val': 50}.
+    groups: column with group keys (see add_groups) - whole groups are
+    stratified, so frames of one video never end up in both train and val;
+    split sizes are then met up to the size of a group.
+    Only the split column changes, files are not touched.
+    """
+    if not count_columns(df):
+        raise ValueError("В манифесте нет столбцов n_<class>, сначала add_class_counts")
+    names, counts = subset_sizes(len(df), split_sizes)
+    if groups is None:
+        assignment = iterative_stratification(class_matrix(df), counts, seed)
+    else:
+        codes, matrix, weights = group_matrix(df, groups)
+        assignment = iterative_stratification(matrix, counts, seed, weights)[codes]
+    df = df.copy()
+    df['split'] = np.array(names, dtype=object)[assignment]
+    return df
+
+
+def stratification_report(df):
+    """Share of images with each class per split: close values = good stratification"""
+    summary = split_summary(df)
+    presence = df[count_columns(df)].gt(0).groupby(df['split']).sum()
+    share = presence / presence.sum(axis=0).replace(0, np.nan)
+    share.insert(0, 'images', summary['images'] / summary['images'].sum())
+    return share.round(3)
+
+
+def group_leakage(df, column='group'):
+    """Groups that have images in more than one split (should be empty)"""
+    splits_per_group = df.groupby(column)['split'].nunique()
+    return splits_per_group[splits_per_group > 1].index.tolist()
@@ -0,0 +1,98 @@
+import math
+
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+class TileGrid:
+    """
+    Fixed layout of labelled tiles: rows x columns cells of tile_size (width, height).
+
+    With header_height > 0 every cell has a band above the tile with its label
+    centered in it. The background and all header labels are drawn once into
+    `template`; a frame only overwrites tile areas of a canvas made by
+    new_canvas(), so one preallocated canvas serves all frames.
+    With header_height == 0 labels are drawn over the tile corner on every place().
+    """
+
+    def __init__(self, labels, tile_size, columns=None, header_height=40, background=255,
+                 font_scale=0.7, font_thickness=2, text_color=(0, 0, 0)):
+        self.labels = list(labels)
+        self.tile_w, self.tile_h = int(tile_size[0]), int(tile_size[1])
+        self.columns = int(columns or len(self.labels))
+        self.rows = math.ceil(len(self.labels) / self.columns)
+        self.header_height = int(header_height)
+        self.background = background
+        self.font_scale = font_scale
+        self.font_thickness = font_thickness
+        self.text_color = text_color
+        self.cell_h = self.tile_h + self.header_height
+        self.shape = (self.rows * self.cell_h, self.columns * self.tile_w, 3)
+
+        self.template = np.full(self.shape, background, dtype=np.uint8)
+        if self.header_height:
+            for i, label in enumerate(self.labels):
+                x, y = self.tile_origin(i)
+                text_w, text_h = cv2.getTextSize(label, FONT, font_scale, font_thickness)[0]
+                org = (x + (self.tile_w - text_w) // 2, y - self.header_height // 2 + text_h // 2)
+                cv2.putText(self.template, label, org, FONT, font_scale, text_color, font_thickness)
+
+    @property
+    def tile_size(self):
+        return self.tile_w, self.tile_h
+
+    @property
+    def size(self):
+        """(width, height) of the whole canvas"""
+        return self.shape[1], self.shape[0]
+
+    def new_canvas(self):
+        return self.template.copy()
+
+    def tile_origin(self, index):
+        """Top-left pixel (x, y) of tile index (row-major order)"""
+        row, col = divmod(index, self.columns)
+        return col * self.tile_w, row * self.cell_h + self.header_height
+
+    def fit(self, image):
+        """
+        image downscaled (or upscaled) to fit the tile keeping aspect ratio.
+        Can run in reader threads/processes so that place() only copies.
+        """
+        h, w = image.shape[:2]
+        if (w, h) == (self.tile_w, self.tile_h):
+            return image
+        scale = min(self.tile_w / w, self.tile_h / h)
+        new_w, new_h = max(1, round(w * scale)), max(1, round(h * scale))
+        if (new_w, new_h) == (w, h):
+            return image
+        return cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+
+    def place(self, canvas, index, image):
+        """
+        Put image into tile index of canvas: fitted to the tile (see fit),
+        centered, the rest of the tile is background.
+        An image of exactly the tile size is copied without resizing.
+        """
+        x, y = self.tile_origin(index)
+        tile = canvas[y:y + self.tile_h, x:x + self.tile_w]
+        image = self.fit(image)
+        if image.ndim == 2:
+            image = image[..., None]
+        h, w = image.shape[:2]
+        if (w, h) != (self.tile_w, self.tile_h):
+            tile[:] = self.background
+        off_x, off_y = (self.tile_w - w) // 2, (self.tile_h - h) // 2
+        tile[off_y:off_y + h, off_x:off_x + w] = image
+        if not self.header_height and self.labels[index]:
+            cv2.putText(tile, self.labels[index], (20, 20 + int(30 * self.font_scale)), FONT, self.font_scale,
+                        self.text_color, self.font_thickness, cv2.LINE_AA)
+        return canvas
+
+    def clear(self, canvas, index):
+        """Fill tile index with the background (a source without a frame/image)"""
+        x, y = self.tile_origin(index)
+        canvas[y:y + self.tile_h, x:x + self.tile_w] = self.background
+        return canvas
@@ -0,0 +1,295 @@
+import mmap
+import os
+import shutil
+import struct
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Прокси лежат рядом с исходником: <папка видео>/.proxy/<имя видео>.mjpg + .idx.npz
+PROXY_DIR = '.proxy'
+PROXY_EXT = '.mjpg'
+INDEX_EXT = '.idx.npz'
+INDEX_VERSION = 1
+READ_CHUNK = 1 << 20
+
+
+def proxy_paths(video_path, proxy_dir=None):
+    """(proxy stream path, frame index path) of a source video"""
+    directory = proxy_dir or os.path.join(os.path.dirname(os.path.abspath(video_path)), PROXY_DIR)
+    name = os.path.basename(video_path)
+    return os.path.join(directory, name + PROXY_EXT), os.path.join(directory, name + INDEX_EXT)
+
+
+def _src_stamp(video_path):
+    st = os.stat(video_path)
+    return st.st_size, st.st_mtime
+
+
+def load_index(video_path, proxy_dir=None):
+    """
+    Frame index of a proxy that is up to date with its source (same size and
+    mtime of the source), None otherwise.
+    """
+    stream_path, index_path = proxy_paths(video_path, proxy_dir)
+    if not (os.path.exists(index_path) and os.path.exists(stream_path)):
+        return None
+    try:
+        with np.load(index_path) as data:
+            index = {key: data[key] for key in data.files}
+    except (OSError, ValueError):
+        return None
+    if (int(index['version']) != INDEX_VERSION
+            or tuple(index['src_stamp'].tolist()) != _src_stamp(video_path)
+            or int(index['offsets'][-1]) != os.path.getsize(stream_path)):
+        return None
+    return index
+
+
+def _jpeg_end(buf, start):
+    """
+    End offset of the JPEG that starts at buf[start] (SOI), None if buf ends earlier.
+    Header segments are skipped by their lengths, the entropy-coded data after
+    SOS can contain 0xFF only as 0xFF00 or RSTn, so the first 0xFFD9 there is EOI.
+    """
+    pos = start + 2
+    while True:
+        if pos + 4 > len(buf):
+            return None
+        if buf[pos] != 0xFF:
+            raise ValueError(f"битый поток MJPEG на смещении {pos}")
+        marker = buf[pos + 1]
+        if marker == 0xFF:  # заполняющий байт
+            pos += 1
+            continue
+        length = struct.unpack('>H', buf[pos + 2:pos + 4])[0]
+        pos += 2 + length
+        if marker == 0xDA:  # SOS
+            break
+    end = buf.find(b'\xff\xd9', pos)
+    return None if end < 0 else end + 2
+
+
+def _split_jpegs(stream, out):
+    """Copy a concatenated JPEG stream to out, yield the size of every JPEG"""
+    buf = bytearray()
+    start = 0
+    while True:
+        chunk = stream.read(READ_CHUNK)
+        if chunk:
+            buf += chunk
+        while True:
+            if len(buf) - start < 4:
+                break
+            end = _jpeg_end(buf, start)
+            if end is None:
+                break
+            yield end - start
+            start = end
+        if start:
+            out.write(buf[:start])
+            del buf[:start]
+            start = 0
+        if not chunk:
+            if buf:
+                raise ValueError("поток MJPEG оборван посреди кадра")
+            return
+
+
+def _build_ffmpeg(video_path, out, max_height, quality, threads):
+    scale = ['-vf', f"scale=-2:'min({max_height},ih)'"] if max_height else []
+    cmd = (['ffmpeg', '-nostdin', '-v', 'error', '-i', video_path, '-vsync', '0'] + scale
+           + ['-c:v', 'mjpeg', '-q:v', str(quality), '-threads', str(threads), '-an', '-f', 'mjpeg', 'pipe:1'])
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # stderr читается отдельным потоком, чтобы ffmpeg не встал на полном пайпе
+    errors = []
+    reader = threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True)
+    reader.start()
+    try:
+        sizes = list(_split_jpegs(process.stdout, out))
+    finally:
+        process.stdout.close()
+        code = process.wait()
+        reader.join()
+    if code:
+        raise RuntimeError(f"ffmpeg: {errors[0].decode(errors='replace').strip()[-500:]}")
+    return sizes
+
+
+def _build_opencv(video_path, out, max_height, quality, threads):
+    video = cv2.VideoCapture(video_path)
+    if not video.isOpened():
+        raise RuntimeError(f"не открывается {video_path}")
+    params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+
+    def encode(frame):
+        h, w = frame.shape[:2]
+        if max_height and h > max_height:
+            frame = cv2.resize(frame, (round(w * max_height / h / 2) * 2, max_height), interpolation=cv2.INTER_AREA)
+        return cv2.imencode('.jpg', frame, params)[1]
+
+    sizes = []
+    # кодирование в пуле, запись по порядку; в работе не больше threads * 4 кадров
+    with ThreadPoolExecutor(threads) as pool:
+        pending = []
+        while True:
+            ret, frame = video.read()
+            if ret:
+                pending.append(pool.submit(encode, frame))
+            while pending and (not ret or len(pending) >= threads * 4):
+                data = pending.pop(0).result()
+                out.write(data.tobytes())
+                sizes.append(len(data))
+            if not ret:
+                break
+    video.release()
+    return sizes
+
+
+def build_proxy(video_path, proxy_dir=None, max_height=720, quality=5, threads=2, use_ffmpeg=True, force=False):
+    """
+    All-intra MJPEG proxy of a video + frame index (byte offset of every frame).
+    Frame k of the proxy is frame k of the source (no frames dropped or duplicated).
+    max_height: 0 keeps the source resolution. quality: ffmpeg -q:v (2 best .. 31),
+    converted to JPEG quality for the OpenCV fallback (used when there is no ffmpeg).
+    Returns 'built' or 'up_to_date'.
+    """
+    if not force and load_index(video_path, proxy_dir) is not None:
+        return 'up_to_date'
+    stream_path, index_path = proxy_paths(video_path, proxy_dir)
+    os.makedirs(os.path.dirname(stream_path), exist_ok=True)
+    stamp = _src_stamp(video_path)
+    tmp = stream_path + '.part'
+    try:
+        with open(tmp, 'wb') as out:
+            if use_ffmpeg and shutil.which('ffmpeg'):
+                sizes = _build_ffmpeg(video_path, out, max_height, quality, threads)
+            else:
+                sizes = _build_opencv(video_path, out, max_height, max(10, 100 - 3 * quality), threads)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    if not sizes:
+        os.remove(tmp)
+        raise RuntimeError(f"ни одного кадра в {video_path}")
+
+    video = cv2.VideoCapture(video_path)
+    fps = video.get(cv2.CAP_PROP_FPS)
+    src_size = (int(video.get(cv2.CAP_PROP_FRAME_WIDTH)), int(video.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    video.release()
+    with open(tmp, 'rb') as f:
+        first = f.read(sizes[0])
+    # размер кадра прокси из заголовка SOF, без декодирования
+    width, height = _jpeg_size(first) or cv2.imdecode(np.frombuffer(first, np.uint8), cv2.IMREAD_COLOR).shape[1::-1]
+
+    os.replace(tmp, stream_path)
+    offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    tmp_index = index_path + '.tmp.npz'
+    np.savez(tmp_index, version=INDEX_VERSION, offsets=offsets, fps=fps, src_stamp=np.array(stamp, dtype=np.float64),
+             size=np.array((width, height)), src_size=np.array(src_size))
+    os.replace(tmp_index, index_path)
+    return 'built'
+
+
+def _jpeg_size(data):
+    """(width, height) from the SOF segment of a JPEG in memory"""
+    pos = 2
+    while pos + 9 < len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        if marker in (0xC0, 0xC1, 0xC2):
+            height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + length
+    return None
+
+
+class ProxyCapture:
+    """
+    Random access to the frames of a proxy: frame k is one mmap slice +
+    cv2.imdecode, no decoding of neighbour frames. Implements the subset of
+    cv2.VideoCapture used by the tools (read, grab/retrieve, set/get of
+    POS_FRAMES, FPS, FRAME_COUNT, FRAME_WIDTH/HEIGHT), so it can replace it.
+    get_frame(k) does not move the read position and is thread-safe.
+    """
+
+    def __init__(self, video_path, index, proxy_dir=None):
+        self.video_path = video_path
+        self.offsets = index['offsets']
+        self.fps = float(index['fps'])
+        self.width, self.height = (int(v) for v in index['size'])
+        self.src_width, self.src_height = (int(v) for v in index['src_size'])
+        self._file = open(proxy_paths(video_path, proxy_dir)[0], 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._pos = 0
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get_frame(self, index, flags=cv2.IMREAD_COLOR):
+        if not 0 <= index < len(self):
+            return None
+        data = np.frombuffer(self._map, np.uint8, int(self.offsets[index + 1] - self.offsets[index]),
+                             int(self.offsets[index]))
+        return cv2.imdecode(data, flags)
+
+    def isOpened(self):
+        return self._map is not None
+
+    def grab(self):
+        if self._pos >= len(self):
+            return False
+        self._pos += 1
+        return True
+
+    def retrieve(self):
+        frame = self.get_frame(self._pos - 1)
+        return frame is not None, frame
+
+    def read(self):
+        frame = self.get_frame(self._pos)
+        if frame is None:
+            return False, None
+        self._pos += 1
+        return True, frame
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self._pos = max(0, int(value))
+            return True
+        return False
+
+    def get(self, prop):
+        return {cv2.CAP_PROP_POS_FRAMES: self._pos, cv2.CAP_PROP_FPS: self.fps,
+                cv2.CAP_PROP_FRAME_COUNT: len(self), cv2.CAP_PROP_FRAME_WIDTH: self.width,
+                cv2.CAP_PROP_FRAME_HEIGHT: self.height}.get(prop, 0.0)
+
+    def release(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = None
+
+
+def open_proxy(video_path, proxy_dir=None, allow_reduced=True):
+    """
+    ProxyCapture of an up-to-date proxy of the video, None if there is none.
+    allow_reduced=False accepts only proxies at the source resolution (for tools
+    that save frames, e.g. frame grabbers), review tools can take any proxy.
+    """
+    index = load_index(video_path, proxy_dir)
+    if index is None:
+        return None
+    if not allow_reduced and tuple(index['size'].tolist()) != tuple(index['src_size'].tolist()):
+        return None
+    return ProxyCapture(video_path, index, proxy_dir)
+
+
+def open_video(video_path, proxy_dir=None, allow_reduced=True):
+    """ProxyCapture when a suitable proxy exists (see open_proxy), cv2.VideoCapture otherwise"""
+    return open_proxy(video_path, proxy_dir, allow_reduced) or cv2.VideoCapture(video_path)
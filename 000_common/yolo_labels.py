@@ -0,0 +1,182 @@
+import math
+import os
+
+import numpy as np
+
+
+def read_yolo_label(label_path):
+    """
+    Read a YOLO label file with bbox and/or segmentation rows.
+
+    Returns a list of (class_id, coords) where coords is a flat float64
+    array: 4 values (x_center, y_center, w, h) for bbox rows or
+    2k values (x1, y1, ..., xk, yk) for segmentation rows.
+    """
+    rows = []
+    with open(label_path, 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            coords = np.array(parts[1:], dtype=np.float64)
+            if len(coords) != 4 and len(coords) % 2:
+                continue
+            rows.append((int(float(parts[0])), coords))
+    return rows
+
+
+def write_yolo_label(label_path, rows):
+    """Write rows returned by read_yolo_label / transform_yolo_rows"""
+    with open(label_path, 'w') as f:
+        for class_id, coords in rows:
+            f.write(f"{class_id} " + " ".join(f"{v:.6f}" for v in coords) + "\n")
+
+
+def box_corners(boxes):
+    """(n, 4) array of x_center, y_center, w, h -> (n, 4, 2) corner points"""
+    cx, cy, w, h = boxes.T
+    x1, y1, x2, y2 = cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2
+    return np.stack([
+        np.stack([x1, y1], axis=-1),
+        np.stack([x2, y1], axis=-1),
+        np.stack([x2, y2], axis=-1),
+        np.stack([x1, y2], axis=-1),
+    ], axis=1)
+
+
+def apply_affine(points, matrix):
+    """Apply 2x3 affine matrix to an (..., 2) array of points"""
+    return points @ matrix[:, :2].T + matrix[:, 2]
+
+
+def rotation_matrix(angle, src_size, dst_size):
+    """
+    2x3 pixel affine that rotates clockwise by `angle` degrees around the
+    center of the source image and puts it in the center of the destination
+    image. This matches cv2.warpAffine / PIL rotate(expand=True) geometry.
+    """
+    w, h = src_size
+    new_w, new_h = dst_size
+    rad = math.radians(angle)
+    # Округляем, чтобы 90/180/270 давали точные 0 и 1
+    cos, sin = round(math.cos(rad), 12), round(math.sin(rad), 12)
+    rot = np.array([[cos, -sin], [sin, cos]])
+    shift = np.array([new_w / 2, new_h / 2]) - rot @ np.array([w / 2, h / 2])
+    return np.hstack([rot, shift[:, None]])
+
+
+def transform_yolo_rows(rows, matrix, src_size, dst_size):
+    """
+    Apply pixel affine `matrix` to YOLO rows of an image of `src_size`
+    that becomes an image of `dst_size`.
+
+    All points of the file are transformed in one matrix product. Bbox rows
+    are transformed by their 4 corners and re-boxed axis-aligned, so any
+    rotation angle is supported. Coordinates are clipped to [0, 1]; boxes
+    and polygons that collapse to zero area are dropped.
+    """
+    if not rows:
+        return []
+
+    scale_in = np.array(src_size, dtype=np.float64)
+    scale_out = np.array(dst_size, dtype=np.float64)
+    box_idx = [i for i, (_, coords) in enumerate(rows) if len(coords) == 4]
+    seg_idx = [i for i, (_, coords) in enumerate(rows) if len(coords) != 4]
+    result = [None] * len(rows)
+
+    if box_idx:
+        boxes = np.stack([rows[i][1] for i in box_idx])
+        corners = apply_affine(box_corners(boxes) * scale_in, matrix) / scale_out
+        corners = np.clip(corners, 0.0, 1.0)
+        top_left, bottom_right = corners.min(axis=1), corners.max(axis=1)
+        new_boxes = np.hstack([(top_left + bottom_right) / 2, bottom_right - top_left])
+        for i, box in zip(box_idx, new_boxes):
+            if box[2] > 0 and box[3] > 0:
+                result[i] = (rows[i][0], box)
+
+    if seg_idx:
+        lengths = [len(rows[i][1]) // 2 for i in seg_idx]
+        points = np.concatenate([rows[i][1].reshape(-1, 2) for i in seg_idx])
+        points = np.clip(apply_affine(points * scale_in, matrix) / scale_out, 0.0, 1.0)
+        for i, polygon in zip(seg_idx, np.split(points, np.cumsum(lengths)[:-1])):
+            if np.ptp(polygon[:, 0]) > 0 and np.ptp(polygon[:, 1]) > 0:
+                result[i] = (rows[i][0], polygon.ravel())
+
+    return [row for row in result if row is not None]
+
+
+def transform_yolo_label_file(src_label, dst_label, matrix, src_size, dst_size):
+    """
+    Rewrite YOLO label file with pixel affine `matrix` (see transform_yolo_rows).
+
+    src_size / dst_size are (width, height) of the image before and after
+    the transform. Returns False if there is no source label file.
+    """
+    if not os.path.isfile(src_label):
+        return False
+    rows = read_yolo_label(src_label)
+    os.makedirs(os.path.dirname(dst_label) or '.', exist_ok=True)
+    write_yolo_label(dst_label, transform_yolo_rows(rows, matrix, src_size, dst_size))
+    return True
+
+
+def rotate_yolo_label_file(src_label, dst_label, angle, src_size, dst_size):
+    """Rotate YOLO label file clockwise by `angle` degrees together with its image"""
+    matrix = rotation_matrix(angle, src_size, dst_size)
+    return transform_yolo_label_file(src_label, dst_label, matrix, src_size, dst_size)
+
+
+def box_iou(boxes_a, boxes_b):
+    """IoU matrix (n, m) of two arrays of x_center, y_center, w, h boxes"""
+    a1, a2 = boxes_a[:, None, :2] - boxes_a[:, None, 2:] / 2, boxes_a[:, None, :2] + boxes_a[:, None, 2:] / 2
+    b1, b2 = boxes_b[None, :, :2] - boxes_b[None, :, 2:] / 2, boxes_b[None, :, :2] + boxes_b[None, :, 2:] / 2
+    inter = np.clip(np.minimum(a2, b2) - np.maximum(a1, b1), 0.0, None).prod(axis=-1)
+    union = boxes_a[:, None, 2:].prod(axis=-1) + boxes_b[None, :, 2:].prod(axis=-1) - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def _overlap_clusters(boxes, scores, classes, iou_threshold):
+    """
+    Greedy class-aware NMS clustering: boxes by descending score, every box not
+    yet taken keeps itself and takes all free boxes of its class with IoU above
+    the threshold. Returns (order, cluster) where cluster[i] is the position in
+    order of the box that took order[i].
+    """
+    order = np.argsort(-scores, kind='stable')
+    boxes, classes = boxes[order], classes[order]
+    overlap = (box_iou(boxes, boxes) > iou_threshold) & (classes[:, None] == classes[None, :])
+    # бокс всегда в своем кластере: у вырожденного (w или h = 0) self-IoU = 0,
+    # а при iou_threshold >= 1 IoU > порога не бывает вовсе
+    np.fill_diagonal(overlap, True)
+    cluster = np.full(len(order), -1)
+    for i in range(len(order)):
+        if cluster[i] < 0:
+            cluster[overlap[i] & (cluster < 0)] = i
+    return order, cluster
+
+
+def nms_boxes(boxes, scores, classes, iou_threshold=0.5):
+    """Indices of boxes kept by class-aware NMS, highest score first"""
+    if not len(boxes):
+        return np.array([], dtype=np.int64)
+    order, cluster = _overlap_clusters(boxes, scores, classes, iou_threshold)
+    return order[cluster == np.arange(len(order))]
+
+
+def fuse_boxes(boxes, scores, classes, iou_threshold=0.5):
+    """
+    Weighted box fusion over NMS clusters: each cluster becomes one box,
+    the score-weighted mean of its members. Returns (boxes, scores, classes),
+    score is the mean score of the cluster.
+    """
+    if not len(boxes):
+        return boxes, scores, classes
+    order, cluster = _overlap_clusters(boxes, scores, classes, iou_threshold)
+    keep, inverse = np.unique(cluster, return_inverse=True)
+    # нулевые score не должны обнулять весь кластер
+    weights = np.maximum(scores[order], 1e-9)
+    total = np.bincount(inverse, weights)
+    fused = np.stack([np.bincount(inverse, weights * column) for column in boxes[order].T], axis=1)
+    fused /= np.where(total > 0, total, 1.0)[:, None]
+    mean_scores = total / np.bincount(inverse)
+    return fused, mean_scores, classes[order][keep]
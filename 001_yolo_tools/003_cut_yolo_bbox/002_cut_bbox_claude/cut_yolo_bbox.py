@@ -1,9 +1,14 @@
 import glob
 import os
+import sys
 import cv2
 import yaml
+from pathlib import Path
 from tqdm import tqdm
 
+sys.path.append(str(Path(__file__).resolve().parents[3] / "000_common"))
+from image_probe import probe_image
+
 def load_config(config_path):
     """Загрузка конфигурации из YAML файла"""
     with open(config_path, 'r') as f:
@@ -11,9 +16,9 @@ def load_config(config_path):
     return config
 
 def is_valid_image(img_path):
-    """Проверка валидности изображения"""
-    img = cv2.imread(img_path)
-    return img is not None and img.size > 0
+    """Проверка валидности изображения по заголовку и концу файла, без декодирования"""
+    info = probe_image(img_path)
+    return info.valid and info.width > 0 and info.height > 0
 
 def is_valid_bbox(x1, y1, x2, y2, w, h):
     """Проверка валидности координат bbox"""
@@ -68,6 +73,9 @@ if __name__ == '__main__':
             continue
         
         img = cv2.imread(img_path)
+        if img is None:
+            no_image.append(name_file)
+            continue
         h, w, _ = img.shape
         
         # Чтение файла меток
@@ -1,12 +1,14 @@
 import os
+import sys
 import yaml
-import cv2
-import numpy as np
 from pathlib import Path
 from tqdm import tqdm
 import logging
 from collections import defaultdict
 
+sys.path.append(str(Path(__file__).resolve().parents[3] / "000_common"))
+from label_render import LabelStyle, render_labels, CACHE_NAME
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -23,14 +25,36 @@ class Statistics:
         self.boxes_per_class = defaultdict(int)
         self.failed_images = []
         self.missing_labels = []
+        self.cached_images = 0
+        self.invalid_boxes = 0
+
+    def add(self, result, name):
+        """Count one result of label_render.render_labels"""
+        if result['status'] == 'failed':
+            self.failed_images.append(name)
+            return
+        self.processed_images += 1
+        self.cached_images += result['status'] == 'cached'
+        self.invalid_boxes += result['skipped']
+        if result['has_label']:
+            self.images_with_labels += 1
+        else:
+            self.images_without_labels += 1
+            self.missing_labels.append(name)
+        for class_id, count in enumerate(result['counts']):
+            if count:
+                self.boxes_per_class[class_id] += int(count)
+                self.total_boxes += int(count)
     
     def print_report(self, class_names):
         print("\n=== Processing Statistics ===")
         print(f"Total images found: {self.total_images}")
         print(f"Successfully processed images: {self.processed_images}")
+        print(f"Unchanged since last run (not rendered again): {self.cached_images}")
         print(f"Images with labels: {self.images_with_labels}")
         print(f"Images without labels: {self.images_without_labels}")
         print(f"Total bounding boxes: {self.total_boxes}")
+        print(f"Skipped boxes (unknown class or coordinates out of [0, 1]): {self.invalid_boxes}")
         print("\nBoxes per class:")
         for class_id, count in self.boxes_per_class.items():
             print(f"class_id: {class_id}")
@@ -55,6 +79,10 @@ def load_config(config_path):
             config.setdefault('box_thickness', 2)
             config.setdefault('font_scale', 0.6)
             config.setdefault('font_thickness', 2)
+            config.setdefault('preview_max_side', None)
+            config.setdefault('jpeg_quality', 90)
+            config.setdefault('num_workers', None)
+            config.setdefault('use_render_cache', True)
             
             logging.info(f"Loaded configuration from {config_path}")
             return config
@@ -108,63 +136,8 @@ def validate_config(config):
             raise ValueError(f"Invalid color format for class {config['classes'][i]}: {color}")
         config['colors'][i] = [int(c) for c in color]
 
-def draw_boxes(image, boxes, class_names, colors, box_thickness, font_scale, font_thickness):
-    """Draw bounding boxes and labels on image"""
-    height, width = image.shape[:2]
-    
-    for box in boxes:
-        try:
-            class_id, x, y, w, h = box
-            class_id = int(class_id)
-            
-            if class_id >= len(class_names):
-                logging.warning(f"Invalid class ID {class_id}, skipping box")
-                continue
-            
-            if not all(0 <= coord <= 1 for coord in [x, y, w, h]):
-                logging.warning(f"Invalid coordinates {[x, y, w, h]}, skipping box")
-                continue
-            
-            # Convert normalized coordinates to pixel coordinates
-            x1 = int((x - w/2) * width)
-            y1 = int((y - h/2) * height)
-            x2 = int((x + w/2) * width)
-            y2 = int((y + h/2) * height)
-            
-            color = colors[class_id]
-            cv2.rectangle(image, (x1, y1), (x2, y2), color, box_thickness)
-            
-            label = class_names[class_id]
-            
-            (text_width, text_height), baseline = cv2.getTextSize(
-                label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, font_thickness
-            )
-            
-            cv2.rectangle(
-                image, 
-                (x1, y1 - text_height - baseline), 
-                (x1 + text_width, y1),
-                color, 
-                -1
-            )
-            
-            cv2.putText(
-                image, 
-                label,
-                (x1, y1 - baseline),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                font_scale,
-                (255, 255, 255),
-                font_thickness
-            )
-        except Exception as e:
-            logging.error(f"Error drawing box: {str(e)}, box data: {box}")
-            continue
-    
-    return image
-
 def process_images(config):
-    """Process all images and draw bounding boxes"""
+    """Render boxes on all images in a process pool, unchanged images are skipped"""
     stats = Statistics()
     
     try:
@@ -178,65 +151,21 @@ def process_images(config):
         logging.error(f"Error listing image files: {str(e)}")
         raise
 
-    colors = {i: tuple(config['colors'][i]) for i in range(len(config['classes']))}
-    
-    for img_file in tqdm(img_files, desc="Processing images"):
-        try:
-            # Load image
-            img_path = os.path.join(config['src_imgs'], img_file)
-            image = cv2.imread(img_path)
-            if image is None:
-                logging.error(f"Could not load image: {img_path}")
-                stats.failed_images.append(img_file)
-                continue
-            
-            # Get label file path
-            label_file = os.path.join(
-                config['src_labels'], 
-                os.path.splitext(img_file)[0] + '.txt'
-            )
-            
-            boxes = []
-            if os.path.exists(label_file):
-                stats.images_with_labels += 1
-                with open(label_file, 'r') as f:
-                    for line in f.readlines():
-                        try:
-                            values = list(map(float, line.strip().split()))
-                            if len(values) == 5:
-                                class_id = int(values[0])
+    # размеры подписей классов считаются один раз здесь, а не для каждого бокса
+    style = LabelStyle(config['classes'], config['colors'], config['box_thickness'],
+                       config['font_scale'], config['font_thickness'])
+    tasks = [(os.path.join(config['src_imgs'], img_file),
+              os.path.join(config['src_labels'], os.path.splitext(img_file)[0] + '.txt'),
+              os.path.join(config['dst_imgs'], img_file))
+             for img_file in img_files]
+    cache_path = os.path.join(config['dst_imgs'], CACHE_NAME) if config['use_render_cache'] else None
 
-                                boxes.append(values)
-                                stats.total_boxes += 1
-                                stats.boxes_per_class[class_id] += 1
-                            else:
-                                logging.warning(f"Invalid label format in {label_file}: {line}")
-                        except Exception as e:
-                            logging.error(f"Error parsing label in {label_file}: {str(e)}")
-            else:
-                stats.images_without_labels += 1
-                stats.missing_labels.append(img_file)
-                logging.warning(f"Label file not found: {label_file}")
-            
-            # Draw boxes
-            image = draw_boxes(
-                image, boxes, config['classes'], colors,
-                config['box_thickness'], config['font_scale'], config['font_thickness']
-            )
-            
-            # Save processed image
-            output_path = os.path.join(config['dst_imgs'], img_file)
-            if not cv2.imwrite(output_path, image):
-                logging.error(f"Failed to save image: {output_path}")
-                stats.failed_images.append(img_file)
-                continue
-            
-            stats.processed_images += 1
-            
-        except Exception as e:
-            logging.error(f"Error processing {img_file}: {str(e)}")
-            stats.failed_images.append(img_file)
-            continue
+    with tqdm(total=len(tasks), desc="Processing images") as bar:
+        for result in render_labels(tasks, style, config['preview_max_side'], config['jpeg_quality'],
+                                    config['num_workers'], cache_path, bar.update):
+            stats.add(result, os.path.basename(result['image']))
+            if result['status'] == 'failed':
+                logging.error(f"Could not load or save image: {result['image']}")
     
     return stats
 
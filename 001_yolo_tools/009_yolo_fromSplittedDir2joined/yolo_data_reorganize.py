@@ -1,10 +1,13 @@
 import os
-import shutil
+import sys
 import yaml
 import logging
 from pathlib import Path
 from tqdm import tqdm
 
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from materialize import materialize_files, LINK_MODES, MANIFEST_NAME
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -46,6 +49,11 @@ class DataReorganizer:
         if not os.path.exists(self.config['src_classes']):
             raise FileNotFoundError(f"Файл classes.txt не найден: {self.config['src_classes']}")
 
+        # copy | hardlink | reflink | symlink | manifest
+        self.config.setdefault('link_mode', 'copy')
+        if self.config['link_mode'] not in LINK_MODES:
+            raise ValueError(f"link_mode должен быть одним из {LINK_MODES}")
+
     def create_directory_structure(self):
         """Создание структуры директорий"""
         try:
@@ -74,9 +82,10 @@ class DataReorganizer:
             raise
 
     def copy_files(self, subdirs):
-        """Копирование файлов в новую структуру"""
+        """Копирование (или ссылки, см. link_mode) файлов в новую структуру"""
         try:
-            for subdir in tqdm(subdirs, desc="Копирование файлов"):
+            pairs = []
+            for subdir in subdirs:
                 # Пути к исходным директориям
                 src_img_dir = os.path.join(self.config['src_imgs'], subdir)
                 src_label_dir = os.path.join(self.config['src_labels'], subdir)
@@ -85,27 +94,27 @@ class DataReorganizer:
                 dst_img_dir = os.path.join(self.config['joined'], subdir, 'images')
                 dst_label_dir = os.path.join(self.config['joined'], subdir, 'labels')
                 
-                # Копирование изображений
+                # Изображения
                 for img in os.listdir(src_img_dir):
                     if img.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')):
-                        shutil.copy2(
-                            os.path.join(src_img_dir, img),
-                            os.path.join(dst_img_dir, img)
-                        )
+                        pairs.append((os.path.join(src_img_dir, img),
+                                      os.path.join(dst_img_dir, img)))
                 
-                # Копирование файлов разметки
+                # Файлы разметки
                 for label in os.listdir(src_label_dir):
                     if label.endswith('.txt'):
-                        shutil.copy2(
-                            os.path.join(src_label_dir, label),
-                            os.path.join(dst_label_dir, label)
-                        )
+                        pairs.append((os.path.join(src_label_dir, label),
+                                      os.path.join(dst_label_dir, label)))
                 
-                # Копирование classes.txt
-                shutil.copy2(
-                    self.config['src_classes'],
-                    os.path.join(self.config['joined'], subdir, 'classes.txt')
-                )
+                # classes.txt
+                pairs.append((self.config['src_classes'],
+                              os.path.join(self.config['joined'], subdir, 'classes.txt')))
+            
+            # Все файлы разом в пуле потоков
+            used = materialize_files(pairs, self.config['link_mode'],
+                                     manifest_path=os.path.join(self.config['joined'], MANIFEST_NAME),
+                                     desc="Копирование файлов")
+            logging.info(f"Файлы разложены: {dict(used)}")
                 
         except Exception as e:
             logging.error(f"Ошибка при копировании файлов: {str(e)}")
@@ -149,8 +158,9 @@ class DataReorganizer:
             # Копирование файлов
             self.copy_files(subdirs)
             
-            # Проверка результатов
-            self.verify_copy(subdirs)
+            # Проверка результатов (в режиме manifest файлов нет)
+            if self.config['link_mode'] != 'manifest':
+                self.verify_copy(subdirs)
             
             logging.info("Обработка данных завершена успешно")
             
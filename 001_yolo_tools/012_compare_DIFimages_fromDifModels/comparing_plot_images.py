@@ -1,100 +1,192 @@
+import os
+import sys
 import yaml
 import cv2
 import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from tqdm import tqdm
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from image_io import imread_fit, image_size
+from image_probe import list_images
+from tile_grid import TileGrid
+
+# images - по сетке на каждое имя изображения (как раньше)
+# mosaic - страницы mosaic_NNNN.jpg из mosaic_per_page сеток подряд, для быстрого пролистывания
+# video  - одно видео contact_sheet.mp4, кадр = сетка одного изображения
+OUTPUTS = ('images', 'mosaic', 'video')
+PADDING_HEIGHT = 40  # Высота области для текста
+# сколько сеток одновременно в работе на один процесс (для mosaic/video результаты идут по порядку)
+PENDING_PER_WORKER = 4
+
+# Состояние процесса-воркера: сетка и холст, выделенный один раз на процесс
+_GRID = None
+_CANVAS = None
+
 
 def read_config(config_path):
    """Чтение конфига и извлечение упорядоченных пар src-text"""
    with open(config_path, 'r') as f:
        config = yaml.safe_load(f)
-   
+
    # Извлекаем пары src-text
    pairs = []
    i = 1
    while True:
        src_key = f"{i:03d}_src"
        text_key = f"{i:03d}_printed_text"
-       
+
        if src_key not in config or text_key not in config:
            break
-           
+
        pairs.append((config[src_key], config[text_key]))
        i += 1
-   
+
    if len(pairs) < 2:
        raise ValueError("Need at least 2 source directories")
-       
-   return pairs, config['dst']
-
-def join_images_with_text(image_name, src_text_pairs, dst_path):
-   """Объединение изображений с текстом"""
-   images = []
-   texts = []
-   max_height = 0
-   total_width = 0
-   padding_height = 40  # Высота области для текста
-   
-   # Читаем все изображения
-   for src_path, text in src_text_pairs:
-       img_path = Path(src_path) / image_name
-       if not img_path.exists():
-           print(f"Warning: {img_path} not found")
-           return
-           
-       img = cv2.imread(str(img_path))
+
+   output = config.get('output', 'images')
+   if output not in OUTPUTS:
+       raise ValueError(f"Unknown output {output}, available: {OUTPUTS}")
+   return pairs, config['dst'], config
+
+def tile_size_from(first_image, tile_height=None, tile_width=None):
+   """Размер ячейки сетки: из конфига, иначе по первому изображению первой модели"""
+   width, height = image_size(str(first_image))
+   if tile_height and not tile_width:
+       tile_width = max(1, round(width * tile_height / height))
+   elif tile_width and not tile_height:
+       tile_height = max(1, round(height * tile_width / width))
+   return (tile_width or width), (tile_height or height)
+
+def _init_worker(grid):
+   global _GRID, _CANVAS
+   # параллельность уже по процессам, потоки OpenCV внутри только мешают
+   cv2.setNumThreads(1)
+   _GRID, _CANVAS = grid, grid.new_canvas()
+
+def join_images_with_text(image_name, src_dirs):
+   """Объединение изображений одной модели в сетку на холсте процесса.
+   JPEG декодируется сразу в уменьшенном размере под ячейку.
+   Возвращает (холст, None) или (None, путь, который не прочитался)"""
+   for idx, src_path in enumerate(src_dirs):
+       img_path = os.path.join(src_path, image_name)
+       img = imread_fit(img_path, _GRID.tile_size) if os.path.exists(img_path) else None
        if img is None:
-           print(f"Warning: Could not read {img_path}")
-           return
-           
-       images.append(img)
-       texts.append(text)
-       
-       h, w = img.shape[:2]
-       max_height = max(max_height, h)
-       total_width += w
-
-   # Создаем итоговое изображение с padding для текста
-   result = np.ones((max_height + padding_height, total_width, 3), dtype=np.uint8) * 255
-   
-   # Объединяем изображения и добавляем текст
-   x_offset = 0
-   font = cv2.FONT_HERSHEY_SIMPLEX
-   font_scale = 0.7
-   font_thickness = 2
-   
-   for idx, (img, text) in enumerate(zip(images, texts)):
-       h, w = img.shape[:2]
-       
-       # Размещаем изображение
-       result[padding_height:padding_height+h, x_offset:x_offset+w] = img
-       
-       # Добавляем текст
-       text_size = cv2.getTextSize(text, font, font_scale, font_thickness)[0]
-       text_x = x_offset + (w - text_size[0]) // 2
-       text_y = padding_height // 2 + text_size[1] // 2
-       
-       cv2.putText(result, text, (text_x, text_y), font, font_scale, (0, 0, 0), font_thickness)
-       
-       x_offset += w
-   
-   # Сохраняем результат
-   dst_path = Path(dst_path)
-   dst_path.mkdir(parents=True, exist_ok=True)
-   cv2.imwrite(str(dst_path / image_name), result)
+           return None, img_path
+       _GRID.place(_CANVAS, idx, img)
+   return _CANVAS, None
+
+def write_grid(image_name, src_dirs, dst_path, jpeg_quality=90):
+   """Воркер для output: images - сетка пишется на диск прямо из холста процесса"""
+   canvas, bad_path = join_images_with_text(image_name, src_dirs)
+   if canvas is None:
+       return image_name, bad_path
+   cv2.imwrite(os.path.join(dst_path, image_name), canvas, [cv2.IMWRITE_JPEG_QUALITY, int(jpeg_quality)])
+   return image_name, None
+
+def grid_array(image_name, src_dirs):
+   """Воркер для output: mosaic/video - сетка возвращается в главный процесс"""
+   canvas, bad_path = join_images_with_text(image_name, src_dirs)
+   return image_name, canvas, bad_path
+
+def ordered_results(pool, fn, items, window):
+   """pool.submit(fn, *item) для всех items, результаты по порядку, в работе не больше window"""
+   pending = deque()
+   for item in items:
+       pending.append(pool.submit(fn, *item))
+       if len(pending) >= window:
+           yield pending.popleft().result()
+   while pending:
+       yield pending.popleft().result()
+
+def put_name(canvas, image_name):
+   """Имя изображения в левом верхнем углу сетки (для mosaic/video)"""
+   cv2.putText(canvas, image_name, (10, PADDING_HEIGHT + 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8,
+               (0, 0, 255), 2, cv2.LINE_AA)
+
+class MosaicWriter:
+   """Страницы из per_page сеток друг под другом, страница собирается в одном заранее выделенном холсте"""
+
+   def __init__(self, dst_path, grid, per_page, jpeg_quality=90):
+      self.dst_path = dst_path
+      self.grid_h = grid.shape[0]
+      self.per_page = per_page
+      self.jpeg_quality = jpeg_quality
+      self.page = np.full((grid.shape[0] * per_page, *grid.shape[1:]), 255, dtype=np.uint8)
+      self.filled = 0
+      self.n_pages = 0
+
+   def write(self, canvas):
+      self.page[self.filled * self.grid_h:(self.filled + 1) * self.grid_h] = canvas
+      self.filled += 1
+      if self.filled == self.per_page:
+         self.flush()
+
+   def flush(self):
+      if not self.filled:
+         return
+      self.n_pages += 1
+      path = os.path.join(self.dst_path, f'mosaic_{self.n_pages:04d}.jpg')
+      cv2.imwrite(path, self.page[:self.filled * self.grid_h], [cv2.IMWRITE_JPEG_QUALITY, int(self.jpeg_quality)])
+      self.filled = 0
+
+   def release(self):
+      self.flush()
 
 def process_all_images(config_path):
    """Обработка всех изображений"""
    # Читаем конфиг
-   src_text_pairs, dst_path = read_config(config_path)
-   
+   src_text_pairs, dst_path, config = read_config(config_path)
+   src_dirs = [str(src) for src, _ in src_text_pairs]
+   output = config.get('output', 'images')
+   jpeg_quality = config.get('jpeg_quality', 90)
+   num_workers = config.get('num_workers') or os.cpu_count()
+
    # Получаем список изображений из первой директории
-   first_src = Path(src_text_pairs[0][0])
-   image_files = list(first_src.glob('*.[jp][pn][g]'))
-   
-   # Обрабатываем каждое изображение
-   for img_path in image_files:
-       print(f"Processing {img_path.name}")
-       join_images_with_text(img_path.name, src_text_pairs, dst_path)
+   image_files = sorted(os.path.basename(path) for path, _, _ in list_images(src_dirs[0]))
+   if not image_files:
+      print(f"No images in {src_dirs[0]}")
+      return
+
+   tile_size = tile_size_from(Path(src_dirs[0]) / image_files[0], config.get('tile_height'), config.get('tile_width'))
+   grid = TileGrid([text for _, text in src_text_pairs], tile_size, config.get('columns'), PADDING_HEIGHT)
+   print(f"Models: {len(src_dirs)}, images: {len(image_files)}, grid {grid.rows}x{grid.columns}, "
+         f"tile {tile_size[0]}x{tile_size[1]}, output: {output}")
+
+   dst_path = Path(dst_path)
+   dst_path.mkdir(parents=True, exist_ok=True)
+   skipped = 0
+   with ProcessPoolExecutor(num_workers, initializer=_init_worker, initargs=(grid,)) as pool:
+      if output == 'images':
+         # сетки пишут сами воркеры, в главный процесс возвращается только статус
+         results = pool.map(write_grid, image_files, [src_dirs] * len(image_files),
+                            [str(dst_path)] * len(image_files), [jpeg_quality] * len(image_files),
+                            chunksize=8)
+         for _, bad_path in tqdm(results, total=len(image_files)):
+            if bad_path:
+               print(f"Warning: Could not read {bad_path}")
+               skipped += 1
+      else:
+         if output == 'video':
+            writer = cv2.VideoWriter(str(dst_path / 'contact_sheet.mp4'), cv2.VideoWriter_fourcc(*'mp4v'),
+                                     config.get('video_fps', 2), grid.size)
+         else:
+            writer = MosaicWriter(str(dst_path), grid, config.get('mosaic_per_page', 20), jpeg_quality)
+         items = [(name, src_dirs) for name in image_files]
+         for image_name, canvas, bad_path in tqdm(ordered_results(pool, grid_array, items,
+                                                                  num_workers * PENDING_PER_WORKER),
+                                                  total=len(image_files)):
+            if canvas is None:
+               print(f"Warning: Could not read {bad_path}")
+               skipped += 1
+               continue
+            put_name(canvas, image_name)
+            writer.write(canvas)
+         writer.release()
+   print(f"Done: {len(image_files) - skipped} grids, skipped {skipped}, saved to {dst_path}")
 
 if __name__ == "__main__":
-   process_all_images('config.yaml')
\ No newline at end of file
+   process_all_images('config.yaml')
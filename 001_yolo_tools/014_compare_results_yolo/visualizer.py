@@ -2,13 +2,95 @@ import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 import numpy as np
+import yaml
 from pathlib import Path
+from typing import Dict, List, Tuple
 from yolo_processor import YOLOResultsProcessor
 
+MIN_ALPHA = 0.01  # Минимальное значение для alpha
+# Больше точек на графике - Scattergl (WebGL) вместо SVG
+WEBGL_THRESHOLD = 5000
+# Кривые длиннее - прореживаются LTTB до этого числа точек
+MAX_POINTS_PER_TRACE = 500
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of n_out points that keep the
+    visual shape of the curve (peaks and drops survive, unlike taking every k-th point).
+    First and last points are always kept.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # вершина треугольника справа - среднее следующей корзины (для последней - последняя точка)
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        nx, ny = x[end:next_end].mean(), y[end:next_end].mean()
+        bx, by = x[start:end], y[start:end]
+        area = np.abs((x[prev] - nx) * (by - y[prev]) - (x[prev] - bx) * (ny - y[prev]))
+        prev = start + int(np.argmax(area))
+        selected[i + 1] = prev
+    return selected
+
+
+def transform_curve(y: pd.Series, plot_type: str, ema_alpha: float) -> pd.Series:
+    """Values of one curve for the plot type: clipped to positive for log, EMA-smoothed for ema."""
+    if plot_type == 'log':
+        if (y <= 0).any():
+            min_positive = y[y > 0].min() if not y[y > 0].empty else 1e-10
+            y = y.clip(lower=min_positive)
+    elif plot_type == 'ema':
+        # Проверяем и корректируем alpha
+        y = y.ewm(alpha=max(MIN_ALPHA, ema_alpha), adjust=False).mean()
+    return y
+
+
+@st.cache_data(show_spinner="Loading experiments...")
+def load_results(config_path: str, fingerprint: tuple):
+    """
+    Summary table and training curves of all experiments. Streamlit reruns the
+    script on every widget click: while fingerprint (names and mtimes of
+    args.yaml/results.csv) is the same, the cached result is returned without
+    touching the files. Changed experiments are re-read by the results store.
+    """
+    processor = YOLOResultsProcessor(config_path)
+    return processor.create_summary_table(), processor.get_training_data()
+
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def prepare_traces(fingerprint: tuple, metric: str, plot_type: str, ema_alpha: float, max_points: int,
+                   _data: Dict[str, pd.DataFrame]) -> List[Tuple[str, np.ndarray, np.ndarray]]:
+    """
+    (experiment, x, y) of every curve of a metric: transformed on the full
+    curve, then downsampled. Computed once per (data, metric, plot type, alpha);
+    _data is not hashed, fingerprint stands for it.
+    """
+    traces = []
+    for exp_name, df in _data.items():
+        if metric not in df:
+            continue
+        x = df['epoch'].to_numpy(dtype=np.float64)
+        y = transform_curve(df[metric], plot_type, ema_alpha).to_numpy(dtype=np.float64)
+        keep = lttb(x, y, max_points)
+        traces.append((exp_name, x[keep], y[keep]))
+    return traces
+
+
 class YOLOVisualizer:
     def __init__(self, config_path: str):
         """Initialize visualizer with config file."""
+        self.config_path = config_path
         self.processor = YOLOResultsProcessor(config_path)
+        with open(config_path, 'r') as f:
+            config = yaml.safe_load(f)
+        self.webgl_threshold = config.get('webgl_threshold', WEBGL_THRESHOLD)
+        self.max_points = config.get('max_points_per_trace', MAX_POINTS_PER_TRACE)
         self.metrics = [
             'train/box_loss', 'train/cls_loss', 'train/dfl_loss',
             'metrics/precision(B)', 'metrics/recall(B)',
@@ -16,38 +98,32 @@ class YOLOVisualizer:
             'val/box_loss', 'val/cls_loss', 'val/dfl_loss',
             'lr/pg0', 'lr/pg1', 'lr/pg2'
         ]
+        # Графики, раскрытые при первом открытии
+        self.default_metrics = ['metrics/mAP50-95(B)']
         self.plot_types = ['normal', 'log', 'ema']
-        self.MIN_ALPHA = 0.01  # Минимальное значение для alpha
+        self.MIN_ALPHA = MIN_ALPHA
 
     def calculate_ema(self, data: pd.Series, alpha: float) -> pd.Series:
         """Calculate Exponential Moving Average."""
-        # Проверяем и корректируем alpha
-        alpha = max(self.MIN_ALPHA, alpha)
-        return data.ewm(alpha=alpha, adjust=False).mean()
+        return transform_curve(data, 'ema', alpha)
 
-    def create_plot(self, data: dict, metric: str, plot_type: str, ema_alpha: float = 0.1) -> go.Figure:
-        """Create plot for specific metric with selected transformation."""
+    def create_plot(self, traces: List[Tuple[str, np.ndarray, np.ndarray]], metric: str, plot_type: str) -> go.Figure:
+        """Create plot for specific metric from prepared (experiment, x, y) traces."""
         fig = go.Figure()
-        
-        for exp_name, df in data.items():
-            y_values = df[metric].copy()
-            
-            if plot_type == 'log':
-                if (y_values <= 0).any():
-                    min_positive = y_values[y_values > 0].min() if not y_values[y_values > 0].empty else 1e-10
-                    y_values = y_values.clip(lower=min_positive)
-            elif plot_type == 'ema':
-                y_values = self.calculate_ema(y_values, ema_alpha)
-            
-            fig.add_trace(go.Scatter(
-                x=df['epoch'],
+        # SVG-графики plotly тормозят на десятках тысяч точек, WebGL - нет
+        n_points = sum(len(x) for _, x, _ in traces)
+        scatter = go.Scattergl if n_points > self.webgl_threshold else go.Scatter
+
+        for exp_name, x, y_values in traces:
+            fig.add_trace(scatter(
+                x=x,
                 y=y_values,
                 name=exp_name,
                 mode='lines',
                 line=dict(width=2),
                 hovertemplate=f"epoch=%{{x}}<br>{metric}=%{{y:.4f}}<extra>{exp_name}</extra>"
             ))
-        
+
         fig.update_layout(
             title=f'{metric} vs Epoch',
             xaxis_title='Epoch',
@@ -72,12 +148,12 @@ class YOLOVisualizer:
 
         # Display summary table
         st.header('Summary Table')
-        summary_df = self.processor.create_summary_table()
+        fingerprint = self.processor.fingerprint()
+        summary_df, data = load_results(self.config_path, fingerprint)
         st.dataframe(summary_df)
 
         # Display plots
         st.header('Training Metrics')
-        data = self.processor.get_training_data()
 
         # Global plot type selection
         st.subheader("Global Plot Settings")
@@ -87,7 +163,7 @@ class YOLOVisualizer:
             horizontal=True,
             key="global_plot_type"
         )
-        
+
         # Show EMA slider only when EMA is selected
         global_ema_alpha = 0.1
         if global_plot_type == 'ema':
@@ -102,10 +178,12 @@ class YOLOVisualizer:
 
         # Plot each metric
         for metric in self.metrics:
-            st.subheader(f'{metric} Plot')
-            
+            # График строится только для раскрытых метрик: остальные не стоят ни сервер, ни браузер
+            if not st.checkbox(f'{metric} Plot', value=metric in self.default_metrics, key=f"show_{metric}"):
+                continue
+
             col1, col2 = st.columns([1, 3])
-            
+
             with col1:
                 # Local plot type selection
                 plot_type = st.radio(
@@ -115,7 +193,7 @@ class YOLOVisualizer:
                     key=f"plot_type_{metric}",
                     index=self.plot_types.index(global_plot_type)
                 )
-                
+
                 # Show EMA slider only when EMA is selected
                 ema_alpha = global_ema_alpha
                 if plot_type == 'ema':
@@ -129,8 +207,10 @@ class YOLOVisualizer:
                         help="Higher values give more weight to recent data (less smoothing). Minimum value is 0.01"
                     )
 
-            # Plot
-            fig = self.create_plot(data, metric, plot_type, ema_alpha)
+            # Plot: преобразование и прореживание считаются один раз на (метрику, тип, alpha)
+            traces = prepare_traces(fingerprint, metric, plot_type,
+                                    ema_alpha if plot_type == 'ema' else 0.0, self.max_points, data)
+            fig = self.create_plot(traces, metric, plot_type)
             st.plotly_chart(fig, use_container_width=True)
 
             # Add horizontal line for better separation
@@ -138,4 +218,4 @@ class YOLOVisualizer:
 
 if __name__ == '__main__':
     visualizer = YOLOVisualizer('config.yaml')
-    visualizer.run()
\ No newline at end of file
+    visualizer.run()
@@ -1,8 +1,114 @@
 import os
+import json
 import yaml
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, Tuple
+
+STORE_NAME = 'results_store.parquet'
+# Служебные столбцы хранилища: по ним определяется, изменился ли эксперимент
+STAMP_COLUMNS = ['experiment', '_args_mtime', '_results_mtime', '_args']
+
+
+class ResultsStore:
+    """
+    Parsed experiments (args.yaml + results.csv) keyed by directory name and
+    the mtimes of both files. Only new and changed experiments are parsed
+    (in a thread pool), the consolidated table of all epochs of all experiments
+    is kept in dst as Parquet (needs pyarrow) and read back on the next start.
+    """
+
+    def __init__(self, src_dir: Path, store_path: Path, num_threads: int = 16):
+        self.src_dir = src_dir
+        self.store_path = store_path
+        self.num_threads = num_threads
+        # experiment -> (stamps, args, results); читается при первом refresh
+        self.experiments: Dict[str, Tuple[Tuple[float, float], Dict, pd.DataFrame]] = None
+
+    def _load(self) -> Dict:
+        if not self.store_path.exists():
+            return {}
+        try:
+            table = pd.read_parquet(self.store_path)
+        except Exception as e:
+            print(f"Хранилище {self.store_path} не прочитано ({e}), эксперименты будут разобраны заново")
+            return {}
+        experiments = {}
+        for name, df in table.groupby('experiment', sort=False):
+            first = df.iloc[0]
+            stamps = (float(first['_args_mtime']), float(first['_results_mtime']))
+            results = df.drop(columns=STAMP_COLUMNS).dropna(axis=1, how='all').reset_index(drop=True)
+            experiments[name] = (stamps, json.loads(first['_args']), results)
+        return experiments
+
+    def _save(self):
+        frames = []
+        for name, (stamps, args, results) in self.experiments.items():
+            stamp_df = pd.DataFrame({'experiment': name, '_args_mtime': stamps[0], '_results_mtime': stamps[1],
+                                     '_args': json.dumps(args, default=str)}, index=results.index)
+            frames.append(pd.concat([stamp_df, results], axis=1))
+        if not frames:
+            self.store_path.unlink(missing_ok=True)
+            return
+        tmp = self.store_path.with_name(self.store_path.name + '.tmp')
+        pd.concat(frames, ignore_index=True).to_parquet(tmp, index=False)
+        os.replace(tmp, self.store_path)
+
+    def _scan(self) -> Dict[str, Tuple[float, float]]:
+        """Experiment directories that contain args.yaml and results.csv -> mtimes of both files."""
+        found = {}
+        with os.scandir(self.src_dir) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
+                try:
+                    found[entry.name] = (os.stat(os.path.join(entry.path, 'args.yaml')).st_mtime,
+                                         os.stat(os.path.join(entry.path, 'results.csv')).st_mtime)
+                except FileNotFoundError:
+                    continue
+        return found
+
+    def _parse(self, name: str) -> Tuple[Dict, pd.DataFrame]:
+        exp_dir = self.src_dir / name
+        with open(exp_dir / 'args.yaml', 'r') as f:
+            args = yaml.safe_load(f)
+        return args, pd.read_csv(exp_dir / 'results.csv')
+
+    def fingerprint(self) -> Tuple:
+        """Names and mtimes of all experiments: changes whenever any of them is added, removed or rewritten."""
+        return tuple(sorted(self._scan().items()))
+
+    def refresh(self) -> Dict[str, Tuple[Dict, pd.DataFrame]]:
+        """Bring the store up to date with src. Returns experiment -> (args, results) sorted by name."""
+        if self.experiments is None:
+            self.experiments = self._load()
+        found = self._scan()
+        changed = [name for name, stamps in found.items()
+                   if name not in self.experiments or self.experiments[name][0] != stamps]
+        removed = [name for name in self.experiments if name not in found]
+
+        if changed:
+            # results.csv пишется во время обучения: ошибки чтения не останавливают остальные эксперименты
+            def parse(name):
+                try:
+                    return name, self._parse(name)
+                except Exception as e:
+                    print(f"Эксперимент {name} пропущен: {e}")
+                    return name, None
+
+            with ThreadPoolExecutor(min(self.num_threads, len(changed))) as executor:
+                for name, parsed in executor.map(parse, changed):
+                    if parsed is None:
+                        self.experiments.pop(name, None)
+                    else:
+                        self.experiments[name] = (found[name], *parsed)
+        for name in removed:
+            del self.experiments[name]
+        if changed or removed:
+            self._save()
+        return {name: self.experiments[name][1:] for name in sorted(self.experiments)}
+
 
 class YOLOResultsProcessor:
     def __init__(self, config_path: str):
@@ -12,38 +118,20 @@ class YOLOResultsProcessor:
         self.src_dir = Path(config['src'])
         self.dst_dir = Path(config['dst'])
         self.dst_dir.mkdir(parents=True, exist_ok=True)
+        self.store = ResultsStore(self.src_dir, self.dst_dir / STORE_NAME, config.get('num_threads', 16))
 
-    def _read_yaml(self, file_path: Path) -> Dict:
-        """Read YAML file and return dictionary."""
-        with open(file_path, 'r') as f:
-            return yaml.safe_load(f)
-
-    def _get_experiment_dirs(self) -> List[Path]:
-        """Get all experiment directories that contain required files."""
-        experiment_dirs = []
-        for d in self.src_dir.iterdir():
-            if d.is_dir() and (d / 'args.yaml').exists() and (d / 'results.csv').exists():
-                experiment_dirs.append(d)
-        # Sort directories alphabetically
-        return sorted(experiment_dirs)
-
-    def _get_best_metrics(self, results_csv: Path) -> pd.Series:
+    def _get_best_metrics(self, df: pd.DataFrame) -> pd.Series:
         """Get metrics for epoch with best mAP50-95(B)."""
-        df = pd.read_csv(results_csv)
         return df.loc[df['metrics/mAP50-95(B)'].idxmax()]
 
     def create_summary_table(self) -> pd.DataFrame:
         """Create summary table from all experiment directories."""
         rows = []
-        for exp_dir in self._get_experiment_dirs():
-            args_path = exp_dir / 'args.yaml'
-            results_path = exp_dir / 'results.csv'
-            
-            args = self._read_yaml(args_path)
-            best_metrics = self._get_best_metrics(results_path)
+        for exp_name, (args, results) in self.store.refresh().items():
+            best_metrics = self._get_best_metrics(results)
 
             row = {
-                'experiment': exp_dir.name,
+                'experiment': exp_name,
                 'model': args['model'],
                 'imgsz': args['imgsz'],
                 'epochs': args['epochs'],
@@ -68,12 +156,12 @@ class YOLOResultsProcessor:
 
     def get_training_data(self) -> Dict[str, pd.DataFrame]:
         """Get training data from all experiments."""
-        data = {}
-        for exp_dir in self._get_experiment_dirs():
-            results_path = exp_dir / 'results.csv'
-            data[exp_dir.name] = pd.read_csv(results_path)
-        return data
+        return {exp_name: results for exp_name, (_, results) in self.store.refresh().items()}
+
+    def fingerprint(self) -> Tuple:
+        """Cheap stat-only key of the current state of src (used as the st.cache_data key)."""
+        return self.store.fingerprint()
 
 if __name__ == '__main__':
     processor = YOLOResultsProcessor('config.yaml')
-    processor.create_summary_table()
\ No newline at end of file
+    processor.create_summary_table()
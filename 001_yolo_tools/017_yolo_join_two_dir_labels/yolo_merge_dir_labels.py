@@ -1,102 +1,152 @@
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
+
+import numpy as np
 import yaml
+from tqdm import tqdm
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from yolo_labels import nms_boxes, fuse_boxes
+
+# none - строки всех источников просто объединяются
+# nms  - из пересекающихся боксов одного класса остается бокс с наибольшим score
+# wbf  - пересекающиеся боксы одного класса сливаются в один (среднее, взвешенное по score)
+DEDUP_MODES = ('none', 'nms', 'wbf')
+
+
+def _read_rows(path):
+    """Token lists of the non-empty lines of a label file, None if there is no file"""
+    try:
+        with open(path, 'r') as f:
+            return [line.split() for line in f if line.strip()]
+    except FileNotFoundError:
+        return None
+
+
+def merge_file(filename, dirs, luts, weights, output_dir, dedup='none', iou_threshold=0.5):
+    """
+    Merge one label file of all sources. Returns (rows read, rows written).
+
+    Classes are remapped through the lookup table of each source.
+    bbox rows (5 values, or 6 with confidence of a pre-label) take part in
+    deduplication with score = confidence (1 if absent) * source weight;
+    segmentation rows are only remapped.
+    """
+    lines, box_rows, box_lines, box_classes, box_scores = [], [], [], [], []
+    for directory, lut, weight in zip(dirs, luts, weights):
+        path = os.path.join(directory, filename)
+        rows = _read_rows(path)
+        if not rows:
+            continue
+        old = np.array([int(float(row[0])) for row in rows])
+        if (old < 0).any() or (old >= len(lut)).any() or (lut[np.clip(old, 0, len(lut) - 1)] < 0).any():
+            raise ValueError(f"{path}: классы {sorted(set(old.tolist()))}, в конфиге источника нет части из них")
+        new = lut[old]
+        for row, class_id in zip(rows, new):
+            line = f"{class_id} {' '.join(row[1:])}\n"
+            if dedup != 'none' and len(row) in (5, 6):
+                box_rows.append(row[1:5])
+                box_lines.append(line)
+                box_classes.append(class_id)
+                box_scores.append((float(row[5]) if len(row) == 6 else 1.0) * weight)
+            else:
+                lines.append(line)
+    n_read = len(lines) + len(box_lines)
+
+    if box_rows:
+        boxes = np.array(box_rows, dtype=np.float64)
+        scores, classes = np.array(box_scores), np.array(box_classes)
+        if dedup == 'nms':
+            # при равных score остается бокс источника, указанного в конфиге раньше
+            lines = [box_lines[i] for i in nms_boxes(boxes, scores, classes, iou_threshold)] + lines
+        else:
+            fused, _, fused_classes = fuse_boxes(boxes, scores, classes, iou_threshold)
+            lines = [f"{c} " + " ".join(f"{v:.6f}" for v in box) + "\n"
+                     for c, box in zip(fused_classes, fused)] + lines
+
+    if lines:  # Только если есть содержимое
+        with open(os.path.join(output_dir, filename), 'w') as f:
+            f.writelines(lines)
+    return n_read, len(lines)
+
 
 class YoloLabelsMerger:
     def __init__(self, config_path='config.yaml'):
         self.config = self._load_config(config_path)
-        
-        # Создание атрибутов путей
-        self.dir_labels1 = Path(self.config['dir_labels1'])
-        self.dir_labels2 = Path(self.config['dir_labels2'])
+
+        # Источники: список sources или старый формат dir_labels1/dir_labels2
+        self.sources = self._read_sources()
         self.output_dir = Path(self.config['dst_save_labels'])
-        
-        self.output_dir.mkdir(exist_ok=True)
-        self.class_remapping = self._build_class_remapping()
-    
+        self.dedup = self.config.get('dedup', 'none')
+        self.iou_threshold = self.config.get('iou_threshold', 0.5)
+        self.num_workers = self.config.get('num_workers') or os.cpu_count()
+        if self.dedup not in DEDUP_MODES:
+            raise ValueError(f"Неизвестный dedup {self.dedup}, доступны: {DEDUP_MODES}")
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.luts = self._build_class_luts()
+
     def _load_config(self, config_path):
         """Загрузка конфигурации из YAML файла"""
         with open(config_path, 'r') as f:
             return yaml.safe_load(f)
-    
-    def _build_class_remapping(self):
-        """Создание маппинга для переназначения классов"""
-        remapping = {}
-        
-        # Маппинг для первой папки
-        for old_class, class_name in self.config['as_is_labels1_classes'].items():
-            new_class = self._find_new_class_id(class_name)
-            remapping[('labels1', old_class)] = new_class
-        
-        # Маппинг для второй папки
-        for old_class, class_name in self.config['as_is_labels2_classes'].items():
-            new_class = self._find_new_class_id(class_name)
-            remapping[('labels2', old_class)] = new_class
-            
-        return remapping
-    
-    def _find_new_class_id(self, class_name):
-        """Поиск нового ID класса по имени"""
-        for class_id, name in self.config['to_be_joined_classes'].items():
-            if name == class_name:
-                return class_id
-        raise ValueError(f"Класс {class_name} не найден в to_be_joined_classes")
-    
-    def _process_txt_file(self, file_path, source_folder):
-        """Обработка одного txt файла с переназначением классов"""
-        if not file_path.exists():
-            return []
-        
-        processed_lines = []
-        with open(file_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    parts = line.split()
-                    old_class = int(parts[0])
-                    new_class = self.class_remapping[(source_folder, old_class)]
-                    parts[0] = str(new_class)
-                    processed_lines.append(' '.join(parts) + '\n')
-        return processed_lines
-    
+
+    def _read_sources(self):
+        if 'sources' in self.config:
+            return self.config['sources']
+        return [{'dir': self.config['dir_labels1'], 'classes': self.config['as_is_labels1_classes']},
+                {'dir': self.config['dir_labels2'], 'classes': self.config['as_is_labels2_classes']}]
+
+    def _build_class_luts(self):
+        """
+        Таблица переназначения классов для каждого источника:
+        lut[старый id] = новый id, -1 - класса нет в конфиге источника
+        """
+        # имя -> новый id один раз, а не поиск по списку для каждого класса
+        new_ids = {name: int(class_id) for class_id, name in self.config['to_be_joined_classes'].items()}
+        luts = []
+        for source in self.sources:
+            classes = {int(old): name for old, name in source['classes'].items()}
+            missing = [name for name in classes.values() if name not in new_ids]
+            if missing:
+                raise ValueError(f"Классы {missing} не найдены в to_be_joined_classes")
+            lut = np.full(max(classes) + 1, -1, dtype=np.int64)
+            for old, name in classes.items():
+                lut[old] = new_ids[name]
+            luts.append(lut)
+        return luts
+
     def _get_all_txt_files(self):
-        """Получение списка всех txt файлов из обеих папок"""
-        files1 = set(f.name for f in self.dir_labels1.glob('*.txt'))
-        files2 = set(f.name for f in self.dir_labels2.glob('*.txt'))
-        
-        return files1.union(files2)
-    
-    def _merge_file_content(self, filename):
-        """Мерж содержимого файла из обеих папок"""
-        merged_lines = []
-        
-        # Обработка из первой папки
-        file1_path = self.dir_labels1 / filename
-        merged_lines.extend(self._process_txt_file(file1_path, 'labels1'))
-        
-        # Обработка из второй папки
-        file2_path = self.dir_labels2 / filename
-        merged_lines.extend(self._process_txt_file(file2_path, 'labels2'))
-        
-        return merged_lines
-    
-    def _write_merged_file(self, filename, lines):
-        """Запись объединенного файла"""
-        output_file = self.output_dir / filename
-        with open(output_file, 'w') as f:
-            f.writelines(lines)
-    
+        """Получение списка всех txt файлов из всех папок"""
+        names = set()
+        for source in self.sources:
+            with os.scandir(source['dir']) as entries:
+                names.update(e.name for e in entries if e.name.endswith('.txt') and e.is_file())
+        return sorted(names)
+
     def merge_all_labels(self):
         """Основной метод для мержа всех разметок"""
         all_files = self._get_all_txt_files()
-        
-        for filename in all_files:
-            merged_content = self._merge_file_content(filename)
-            if merged_content:  # Только если есть содержимое
-                self._write_merged_file(filename, merged_content)
-        
+        dirs = [str(source['dir']) for source in self.sources]
+        weights = [float(source.get('weight', 1.0)) for source in self.sources]
+        print(f"Источников: {len(dirs)}, файлов: {len(all_files)}, dedup: {self.dedup}")
+
+        worker = partial(merge_file, dirs=dirs, luts=self.luts, weights=weights, output_dir=str(self.output_dir),
+                         dedup=self.dedup, iou_threshold=self.iou_threshold)
+        # файлы маленькие: пачками по chunksize, чтобы не гонять каждый через очередь процессов
+        with ProcessPoolExecutor(self.num_workers) as executor:
+            counts = list(tqdm(executor.map(worker, all_files, chunksize=256), total=len(all_files)))
+        n_read = sum(r for r, _ in counts)
+        n_written = sum(w for _, w in counts)
+
+        print(f"Боксов прочитано: {n_read}, записано: {n_written}, удалено дублей: {n_read - n_written}")
         print(f"Объединение завершено. Результат сохранен в папке: {self.output_dir}")
 
-# Использование:
-merger = YoloLabelsMerger('config.yaml')
-merger.merge_all_labels()
\ No newline at end of file
+
+if __name__ == "__main__":
+    # Использование:
+    merger = YoloLabelsMerger('config.yaml')
+    merger.merge_all_labels()
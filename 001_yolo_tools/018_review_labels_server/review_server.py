@@ -0,0 +1,359 @@
+import html
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import cv2
+import numpy as np
+import pandas as pd
+import yaml
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from dir_index import DirIndex
+from image_io import imread_preview, resize_max_side
+from image_probe import IMAGE_EXTENSIONS
+from label_render import LabelStyle, read_label, valid_boxes, draw_labels, draw_polygons
+
+INDEX_NAME = '.review_index.pkl'
+INDEX_VERSION = 2
+
+
+def load_config(config_path='config.yaml'):
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    config.setdefault('host', '127.0.0.1')
+    config.setdefault('port', 8765)
+    config.setdefault('thumb_side', 320)
+    config.setdefault('image_side', 1600)
+    config.setdefault('per_page', 60)
+    config.setdefault('cache_mb', 512)
+    config.setdefault('jpeg_quality', 85)
+    config.setdefault('use_index_cache', True)
+    return config
+
+
+def read_class_names(config):
+    if config.get('classes'):
+        return [str(c) for c in config['classes']]
+    with open(config['classes_txt'], 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def class_colors(n, colors=None):
+    """Colors from the config, otherwise evenly spread hues"""
+    if colors:
+        return [tuple(int(v) for v in c) for c in colors]
+    hsv = np.array([[[int(180 * i / max(n, 1)), 230, 230] for i in range(n)]], dtype=np.uint8)
+    return [tuple(int(v) for v in c) for c in cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)[0]]
+
+
+class LRUCache:
+    """Encoded images by key, the least recently used are dropped above max_bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            data = self.items.get(key)
+            if data is not None:
+                self.items.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self.lock:
+            if key in self.items:
+                return
+            self.items[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes and self.items:
+                _, old = self.items.popitem(last=False)
+                self.size -= len(old)
+
+
+def _label_classes(label_path):
+    """
+    Class ids present in a label file (first token of each row), None if there is no file.
+    Unparseable rows are skipped, the valid rows of the file still count.
+    """
+    classes = set()
+    try:
+        with open(label_path, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    classes.add(int(float(line.split(maxsplit=1)[0])))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        return None
+    return classes
+
+
+class DatasetIndex:
+    """
+    Images of src_imgs (nested dirs, listings cached by dir mtime, see dir_index.py)
+    and the classes of their labels: (images x classes) presence matrix for the filters.
+    Classes of a label file are cached in src_labels/.review_index.pkl by its mtime.
+    """
+
+    def __init__(self, src_imgs, src_labels, n_classes, use_cache=True, num_threads=16):
+        self.src_imgs = os.path.abspath(src_imgs)
+        self.src_labels = os.path.abspath(src_labels)
+        index = DirIndex(self.src_imgs, use_cache).scan()
+        start = len(os.path.join(self.src_imgs, ''))
+        self.images = sorted(os.path.join(root, f)[start:] for root, _, files in index.walk()
+                             for f in files if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS)
+        self.dir_codes, self.dirs = pd.factorize(pd.Series([os.path.dirname(p) for p in self.images], dtype=object))
+        self.labels = [os.path.join(self.src_labels, os.path.splitext(p)[0] + '.txt') for p in self.images]
+
+        cache_path = os.path.join(self.src_labels, INDEX_NAME) if use_cache else None
+        cached = self._load(cache_path)
+        with ThreadPoolExecutor(num_threads) as executor:
+            mtimes = list(executor.map(_mtime, self.labels))
+            todo = [i for i, (path, m) in enumerate(zip(self.labels, mtimes))
+                    if cached.get(path, (None,))[0] != m or m is None]
+            fresh = dict(zip(todo, executor.map(_label_classes, [self.labels[i] for i in todo])))
+
+        self.has_label = np.zeros(len(self.images), dtype=bool)
+        self.presence = np.zeros((len(self.images), n_classes), dtype=bool)
+        entries = {}
+        for i, (path, m) in enumerate(zip(self.labels, mtimes)):
+            classes = fresh[i] if i in fresh else cached[path][1]
+            if classes is None:
+                continue
+            entries[path] = (m, classes)
+            self.has_label[i] = True
+            known = [c for c in classes if 0 <= c < n_classes]
+            self.presence[i, known] = True
+        self._save(cache_path, entries)
+        print(f"Изображений: {len(self.images)}, с разметкой: {int(self.has_label.sum())}, "
+              f"прочитано разметок: {len(todo)}")
+
+    def _load(self, cache_path):
+        if not cache_path or not os.path.exists(cache_path):
+            return {}
+        try:
+            with open(cache_path, 'rb') as f:
+                data = pickle.load(f)
+            return data['entries'] if data.get('version') == INDEX_VERSION else {}
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError):
+            return {}
+
+    def _save(self, cache_path, entries):
+        if not cache_path:
+            return
+        try:
+            with open(cache_path, 'wb') as f:
+                pickle.dump({'version': INDEX_VERSION, 'entries': entries}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            print(f"Не удалось сохранить индекс {cache_path}: {e}")
+
+    def select(self, directory='', class_id=None, label=''):
+        """
+        Indices of images passing the filters:
+        directory - relative dir ('' - all), class_id - contains the class,
+        label - 'missing' (no label file), 'empty' (label without objects), '' - any
+        """
+        mask = np.ones(len(self.images), dtype=bool)
+        if directory:
+            codes = np.flatnonzero(self.dirs == directory)
+            mask &= self.dir_codes == (codes[0] if len(codes) else -2)
+        if class_id is not None:
+            mask &= self.presence[:, class_id]
+        if label == 'missing':
+            mask &= ~self.has_label
+        elif label == 'empty':
+            mask &= self.has_label & ~self.presence.any(axis=1)
+        return np.flatnonzero(mask)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+class Reviewer:
+    """Lazy overlay rendering with an LRU cache of encoded JPEGs and next page prefetch"""
+
+    def __init__(self, config):
+        self.config = config
+        self.class_names = read_class_names(config)
+        colors = class_colors(len(self.class_names), config.get('colors'))
+        self.index = DatasetIndex(config['src_imgs'], config['src_labels'], len(self.class_names),
+                                  config['use_index_cache'])
+        self.styles = {
+            'thumb': (config['thumb_side'], LabelStyle(self.class_names, colors, 1, 0.4, 1)),
+            'image': (config['image_side'], LabelStyle(self.class_names, colors,
+                                                       config.get('box_thickness', 2),
+                                                       config.get('font_scale', 0.7),
+                                                       config.get('font_thickness', 2))),
+        }
+        self.cache = LRUCache(config['cache_mb'] * 1024 * 1024)
+        self.prefetcher = ThreadPoolExecutor(2)
+
+    def _key(self, i, kind):
+        # mtime разметки в ключе: исправленный файл рисуется заново без перезапуска сервера
+        return kind, i, _mtime(self.index.labels[i])
+
+    def render(self, i, kind):
+        """Encoded JPEG of image i with its labels, kind: 'thumb' | 'image'"""
+        key = self._key(i, kind)
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+        side, style = self.styles[kind]
+        path = os.path.join(self.index.src_imgs, self.index.images[i])
+        # JPEG декодируется сразу в уменьшенном размере
+        image = imread_preview(path, side)
+        if image is None:
+            image = np.zeros((side // 2, side, 3), dtype=np.uint8)
+        else:
+            image = resize_max_side(image, side)
+        labels = read_label(self.index.labels[i])
+        if labels is not None:
+            classes, boxes, polygons = labels
+            valid = valid_boxes(classes, boxes, len(self.class_names))
+            draw_polygons(image, polygons, style)
+            draw_labels(image, classes[valid], boxes[valid], style)
+        data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.config['jpeg_quality']])[1].tobytes()
+        self.cache.put(key, data)
+        return data
+
+    def prefetch(self, indices):
+        """Thumbnails of the next page are rendered in the background while the current one is viewed"""
+        for i in indices:
+            if self.cache.get(self._key(i, 'thumb')) is None:
+                self.prefetcher.submit(self.render, i, 'thumb')
+
+
+def _filters(query):
+    class_id = query.get('cls', [''])[0]
+    return {'dir': query.get('dir', [''])[0],
+            'cls': int(class_id) if class_id.lstrip('-').isdigit() else None,
+            'label': query.get('label', [''])[0]}
+
+
+def _query(filters, **extra):
+    params = {'dir': filters['dir'], 'cls': '' if filters['cls'] is None else filters['cls'],
+              'label': filters['label'], **extra}
+    return urlencode({k: v for k, v in params.items() if v != ''})
+
+
+def _options(values, selected):
+    return ''.join(f'<option value="{html.escape(str(v))}"{" selected" if str(v) == str(selected) else ""}>'
+                   f'{html.escape(str(text))}</option>' for v, text in values)
+
+
+PAGE_STYLE = ('body{font-family:sans-serif;background:#222;color:#ddd;margin:8px}'
+              'a{color:#8cf}.grid{display:flex;flex-wrap:wrap;gap:4px}'
+              '.grid a{display:block;width:%dpx;font-size:11px;overflow:hidden;white-space:nowrap}'
+              '.grid img{max-width:100%%;display:block}')
+
+
+def gallery_page(reviewer, filters, page):
+    index, per_page = reviewer.index, reviewer.config['per_page']
+    selected = index.select(filters['dir'], filters['cls'], filters['label'])
+    pages = max(1, -(-len(selected) // per_page))
+    page = min(max(page, 0), pages - 1)
+    shown = selected[page * per_page:(page + 1) * per_page]
+    reviewer.prefetch(selected[(page + 1) * per_page:(page + 2) * per_page])
+
+    dirs = [('', 'all dirs')] + [(d, d or '.') for d in index.dirs]
+    classes = [('', 'any class')] + [(i, f'{i}: {name}') for i, name in enumerate(reviewer.class_names)]
+    labels = [('', 'any label'), ('missing', 'no label file'), ('empty', 'empty label')]
+    cells = ''.join(
+        f'<a href="/view?{_query(filters, i=i)}" title="{html.escape(index.images[i])}">'
+        f'<img src="/thumb?i={i}" loading="lazy">{html.escape(os.path.basename(index.images[i]))}</a>'
+        for i in shown)
+    nav = (f'<a href="/?{_query(filters, page=page - 1)}">&larr; prev</a> ' if page > 0 else '') + \
+          f'page {page + 1}/{pages}, {len(selected)} images' + \
+          (f' <a href="/?{_query(filters, page=page + 1)}">next &rarr;</a>' if page + 1 < pages else '')
+    return (f'<html><head><meta charset="utf-8"><style>{PAGE_STYLE % reviewer.config["thumb_side"]}</style>'
+            f'</head><body><form action="/">'
+            f'<select name="dir">{_options(dirs, filters["dir"])}</select> '
+            f'<select name="cls">{_options(classes, "" if filters["cls"] is None else filters["cls"])}</select> '
+            f'<select name="label">{_options(labels, filters["label"])}</select> '
+            f'<button>filter</button></form><p>{nav}</p><div class="grid">{cells}</div><p>{nav}</p></body></html>')
+
+
+def view_page(reviewer, filters, i):
+    index = reviewer.index
+    selected = index.select(filters['dir'], filters['cls'], filters['label'])
+    pos = int(np.searchsorted(selected, i))
+    links = []
+    if pos > 0:
+        links.append(f'<a href="/view?{_query(filters, i=selected[pos - 1])}">&larr; prev</a>')
+    links.append(f'<a href="/?{_query(filters, page=pos // reviewer.config["per_page"])}">gallery</a>')
+    if pos + 1 < len(selected):
+        links.append(f'<a href="/view?{_query(filters, i=selected[pos + 1])}">next &rarr;</a>')
+        reviewer.prefetcher.submit(reviewer.render, int(selected[pos + 1]), 'image')
+    present = [reviewer.class_names[c] for c in np.flatnonzero(index.presence[i])]
+    return (f'<html><head><meta charset="utf-8"><style>{PAGE_STYLE % 0}</style></head><body>'
+            f'<p>{" | ".join(links)} &nbsp; {html.escape(index.images[i])} &nbsp; {html.escape(", ".join(present))}</p>'
+            f'<img src="/image?i={i}" style="max-width:100%"></body></html>')
+
+
+def make_handler(reviewer):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, body, content_type):
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            try:
+                if url.path in ('/thumb', '/image'):
+                    i = int(query['i'][0])
+                    if not 0 <= i < len(reviewer.index.images):
+                        raise IndexError(i)
+                    self._send(reviewer.render(i, url.path[1:]), 'image/jpeg')
+                elif url.path == '/view':
+                    page = view_page(reviewer, _filters(query), int(query['i'][0]))
+                    self._send(page.encode('utf-8'), 'text/html; charset=utf-8')
+                elif url.path == '/':
+                    page = gallery_page(reviewer, _filters(query), int(query.get('page', ['0'])[0]))
+                    self._send(page.encode('utf-8'), 'text/html; charset=utf-8')
+                else:
+                    self.send_error(404)
+            except (KeyError, ValueError, IndexError):
+                self.send_error(400)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    config = load_config('config.yaml')
+    reviewer = Reviewer(config)
+    server = ThreadingHTTPServer((config['host'], config['port']), make_handler(reviewer))
+    print(f"Просмотр: http://{config['host']}:{config['port']}/  (Ctrl+C - остановить)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        reviewer.prefetcher.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import os
+import sys
+import time
+import yaml
+import cv2 as cv
+import numpy as np
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool, cpu_count
+from pathlib import Path
+from PIL import Image
+from tqdm import tqdm
+
+from resize_with_pad import letterbox_geometry, new_canvas, resize_into
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from image_io import imread_reduced
+from yolo_labels import transform_yolo_label_file
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+
+def load_config(config_path):
+    """Загрузка конфигурации из YAML файла"""
+    with open(config_path, 'r') as file:
+        config = yaml.safe_load(file)
+    config.setdefault('src_labels', None)
+    config.setdefault('dst_labels', None)
+    config.setdefault('pad_value', 0)
+    config.setdefault('jpeg_quality', 95)
+    config.setdefault('reduced_decode', True)
+    config.setdefault('num_processes', None)
+    config.setdefault('chunk_size', 64)
+    return config
+
+
+def collect_image_files(src_dir):
+    """Относительные пути всех изображений во вложенных папках"""
+    image_files = []
+    for root, _, files in os.walk(src_dir):
+        for file in files:
+            if os.path.splitext(file)[1].lower() in IMAGE_EXTENSIONS:
+                image_files.append(os.path.relpath(os.path.join(root, file), src_dir))
+    return image_files
+
+
+def read_size(path):
+    """Размер изображения по заголовку, без декодирования пикселей"""
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def group_by_resolution(src_dir, image_files, num_threads=16):
+    """
+    Группирует изображения по исходному разрешению, чтобы геометрия
+    resize with pad считалась один раз на группу
+    """
+    groups = defaultdict(list)
+    failed = []
+    paths = [os.path.join(src_dir, rel_path) for rel_path in image_files]
+    with ThreadPoolExecutor(num_threads) as executor:
+        for rel_path, size in zip(image_files, executor.map(read_size, paths)):
+            if size is None:
+                failed.append(f"Не удалось прочитать заголовок {rel_path}")
+            else:
+                groups[size].append(rel_path)
+    return groups, failed
+
+
+def make_tasks(groups, config):
+    """Делит группы на чанки для пула процессов"""
+    chunk_size = config['chunk_size']
+    tasks = []
+    for size, files in groups.items():
+        for i in range(0, len(files), chunk_size):
+            tasks.append((size, files[i:i + chunk_size], config))
+    return tasks
+
+
+def process_chunk(task):
+    """
+    Обработка чанка изображений одного разрешения: один холст на чанк,
+    resize сразу в его срез, разметка пересчитывается тем же letterbox
+    """
+    size, rel_paths, config = task
+    new_size = tuple(config['size'])
+    canvas = new_canvas(new_size, config['pad_value'])
+    canvas_geometry = None
+    write_params = [cv.IMWRITE_JPEG_QUALITY, config['jpeg_quality']]
+    processed, failed = 0, []
+
+    for rel_path in rel_paths:
+        src_path = os.path.join(config['src_imgs'], rel_path)
+        try:
+            if config['reduced_decode']:
+                img = imread_reduced(src_path, size, letterbox_geometry(size, new_size)[:2])
+            else:
+                img = cv.imread(src_path)
+            if img is None:
+                failed.append(f"Не удалось прочитать {src_path}")
+                continue
+
+            # cv.imread применяет EXIF поворот, размер по заголовку может быть повернут
+            src_size = size
+            if (img.shape[1] > img.shape[0]) != (size[0] > size[1]):
+                src_size = (size[1], size[0])
+
+            geometry = letterbox_geometry(src_size, new_size)
+            if geometry != canvas_geometry:
+                canvas[:] = config['pad_value']
+                canvas_geometry = geometry
+            resized_w, resized_h, shift_x, shift_y = geometry
+            interpolation = cv.INTER_AREA if resized_w < img.shape[1] else cv.INTER_LINEAR
+            resize_into(img, canvas, geometry, interpolation)
+
+            dst_path = os.path.join(config['dst_imgs'], rel_path)
+            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            params = write_params if os.path.splitext(dst_path)[1].lower() in ('.jpg', '.jpeg') else []
+            if not cv.imwrite(dst_path, canvas, params):
+                failed.append(f"Не удалось сохранить {dst_path}")
+                continue
+
+            if config['src_labels']:
+                rel_label = os.path.splitext(rel_path)[0] + '.txt'
+                matrix = np.array([[resized_w / src_size[0], 0, shift_x],
+                                   [0, resized_h / src_size[1], shift_y]])
+                transform_yolo_label_file(os.path.join(config['src_labels'], rel_label),
+                                          os.path.join(config['dst_labels'], rel_label),
+                                          matrix, src_size, new_size)
+            processed += 1
+        except Exception as e:
+            failed.append(f"Ошибка при обработке {src_path}: {str(e)}")
+
+    return processed, failed
+
+
+def resize_dataset(config):
+    """Параллельный resize with pad всего датасета (изображения + yolo разметка)"""
+    Path(config['dst_imgs']).mkdir(parents=True, exist_ok=True)
+
+    print("Сканирование директорий...")
+    image_files = collect_image_files(config['src_imgs'])
+    if not image_files:
+        print("Изображения не найдены!")
+        return
+
+    start_time = time.time()
+    groups, failed = group_by_resolution(config['src_imgs'], image_files)
+    print(f"Найдено {len(image_files)} изображений, {len(groups)} разных разрешений")
+
+    tasks = make_tasks(groups, config)
+    num_processes = config['num_processes'] or min(cpu_count(), 8)
+    print(f"Запуск обработки на {num_processes} процессах...")
+
+    processed = 0
+    with Pool(num_processes) as pool, tqdm(total=len(image_files), desc="Resize with pad") as pbar:
+        for chunk_processed, chunk_failed in pool.imap_unordered(process_chunk, tasks):
+            processed += chunk_processed
+            failed.extend(chunk_failed)
+            pbar.update(chunk_processed + len(chunk_failed))
+
+    duration = time.time() - start_time
+    print("\nСтатистика обработки:")
+    print(f"Всего изображений: {len(image_files)}")
+    print(f"Успешно: {processed}")
+    print(f"С ошибками: {len(failed)}")
+    print(f"Время обработки: {duration:.2f} секунд")
+
+    if failed:
+        print("\nСписок ошибок:")
+        for error in failed:
+            print(error)
+
+
+def main():
+    config = load_config('config.yaml')
+
+    required_params = ['src_imgs', 'dst_imgs', 'size']
+    missing_params = [param for param in required_params if param not in config]
+    if missing_params:
+        raise ValueError(f"В конфигурационном файле отсутствуют параметры: {missing_params}")
+    if config['src_labels'] and not config['dst_labels']:
+        raise ValueError("Для пересчета разметки нужен параметр dst_labels")
+
+    resize_dataset(config)
+
+
+if __name__ == "__main__":
+    main()
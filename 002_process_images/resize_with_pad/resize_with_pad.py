@@ -1,18 +1,44 @@
-def resize_with_pad(img: np.array, new_size):
-    old_ratio = img.shape[1]/img.shape[0]
-    new_ratio = new_size[0]/new_size[1]
+import cv2 as cv
+import numpy as np
+from functools import lru_cache
 
-    if(new_ratio < old_ratio):
-        new_h = new_size[0]
-        new_w = int(new_h / old_ratio)
+
+@lru_cache(maxsize=None)
+def letterbox_geometry(src_size, new_size):
+    """
+    Geometry of resize with pad, computed once per (source, target) resolution.
+
+    src_size, new_size: (width, height)
+    Returns (resized_w, resized_h, shift_x, shift_y): size of the resized image
+    and its top-left corner on the padded canvas.
+    """
+    old_ratio = src_size[0] / src_size[1]
+    new_ratio = new_size[0] / new_size[1]
+
+    if new_ratio < old_ratio:
+        resized_w = new_size[0]
+        resized_h = int(resized_w / old_ratio)
     else:
-        new_w = new_size[1]
-        new_h = int(new_w * old_ratio)
+        resized_h = new_size[1]
+        resized_w = int(resized_h * old_ratio)
+
+    shift_x = (new_size[0] - resized_w) // 2
+    shift_y = (new_size[1] - resized_h) // 2
+    return resized_w, resized_h, shift_x, shift_y
+
+
+def new_canvas(new_size, pad_value=0):
+    return np.full((new_size[1], new_size[0], 3), pad_value, np.uint8)
+
+
+def resize_into(img, canvas, geometry, interpolation=cv.INTER_LINEAR):
+    """Resize img straight into its slice of a preallocated padded canvas"""
+    resized_w, resized_h, shift_x, shift_y = geometry
+    dst = canvas[shift_y:shift_y + resized_h, shift_x:shift_x + resized_w]
+    cv.resize(img, (resized_w, resized_h), dst=dst, interpolation=interpolation)
+    return canvas
 
-    img = cv.resize(img, (new_h, new_w))
 
-    f = np.zeros((new_size[1],new_size[0],3),np.uint8)
-    shift_x = int((new_size[1] - img.shape[0])/2)
-    shift_y = int((new_size[0] - img.shape[1])/2)
-    f[shift_x:img.shape[0]+shift_x,shift_y:img.shape[1]+shift_y] = img
-    return f
\ No newline at end of file
+def resize_with_pad(img: np.array, new_size, pad_value=0):
+    geometry = letterbox_geometry((img.shape[1], img.shape[0]), tuple(new_size))
+    return resize_into(img, new_canvas(new_size, pad_value), geometry)
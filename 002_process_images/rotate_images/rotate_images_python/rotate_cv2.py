@@ -4,8 +4,13 @@ import os
 import textwrap
 import argparse
 import math
+import sys
+from pathlib import Path
 from tqdm import tqdm
 
+sys.path.append(str(Path(__file__).resolve().parents[3] / "000_common"))
+from yolo_labels import rotate_yolo_label_file
+
 def rotation(image, angleInDegrees):
     h, w = image.shape[:2]
     img_c = (w / 2, h / 2)
@@ -32,6 +37,8 @@ parser = argparse.ArgumentParser(prog='Grab frame from video/videos',
 parser.add_argument('-s', '--src', type=str, required=True)
 parser.add_argument('-d','--dst', type=str, required=True)
 parser.add_argument('-r', '--rotate-angle', type=int, default=25) # how often take frame
+parser.add_argument('--src-labels', type=str, default=None) # yolo labels of src images (optional)
+parser.add_argument('--dst-labels', type=str, default=None) # where to save rotated labels
 
 args = parser.parse_args()
 print(args)
@@ -40,11 +47,23 @@ print(args)
 src=args.src
 dst=args.dst
 rotate_angle=args.rotate_angle
+src_labels=args.src_labels
+dst_labels=args.dst_labels or src_labels and f"{src_labels.rstrip(os.sep)}_rotated"
 
 for pth_image in tqdm(os.listdir(src)):
     print(f"{pth_image}")
     img_np = cv.imread(os.path.join(src,pth_image))
+    src_h, src_w = img_np.shape[:2]
     img_np=rotation(img_np, rotate_angle)
 
     pth_image_save=os.path.join(dst,pth_image)
     cv.imwrite(pth_image_save, img_np)
+
+    if src_labels:
+        # cv2 поворачивает против часовой стрелки, yolo_labels - по часовой
+        label_name = os.path.splitext(pth_image)[0] + ".txt"
+        rotate_yolo_label_file(os.path.join(src_labels, label_name),
+                               os.path.join(dst_labels, label_name),
+                               -rotate_angle,
+                               (src_w, src_h),
+                               (img_np.shape[1], img_np.shape[0]))
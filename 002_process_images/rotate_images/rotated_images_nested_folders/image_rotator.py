@@ -1,8 +1,12 @@
 import os
+import sys
 import yaml
 from PIL import Image
 from pathlib import Path
 
+sys.path.append(str(Path(__file__).resolve().parents[3] / "000_common"))
+from yolo_labels import rotate_yolo_label_file
+
 def load_config(config_path):
     """
     Загрузка конфигурации из YAML файла
@@ -10,9 +14,10 @@ def load_config(config_path):
     with open(config_path, 'r') as file:
         return yaml.safe_load(file)
 
-def process_images(src_dir, dst_dir, angle):
+def process_images(src_dir, dst_dir, angle, src_labels=None, dst_labels=None):
     """
-    Рекурсивная обработка изображений во всех подпапках
+    Рекурсивная обработка изображений во всех подпапках.
+    Если задан src_labels, yolo разметка (та же структура папок) поворачивается вместе с изображением
     """
     # Создаем корневую папку назначения, если она не существует
     Path(dst_dir).mkdir(parents=True, exist_ok=True)
@@ -43,6 +48,15 @@ def process_images(src_dir, dst_dir, angle):
                         
                         # Сохраняем изображение
                         rotated_img.save(dst_path, quality=100, subsampling=0)
+
+                        # Поворачиваем разметку
+                        if src_labels:
+                            label_name = os.path.splitext(file)[0] + '.txt'
+                            rotate_yolo_label_file(os.path.join(src_labels, rel_path, label_name),
+                                                   os.path.join(dst_labels, rel_path, label_name),
+                                                   angle,
+                                                   img.size,
+                                                   rotated_img.size)
                         
                     print(f"Обработано: {src_path} -> {dst_path}")
                     
@@ -61,12 +75,16 @@ def main():
         required_params = ['src', 'dst', 'angle']
         if not all(param in config for param in required_params):
             raise ValueError("В конфигурационном файле отсутствуют необходимые параметры")
+        if config.get('src_labels') and not config.get('dst_labels'):
+            raise ValueError("Для поворота разметки нужен параметр dst_labels")
         
         # Обрабатываем изображения
         process_images(
             src_dir=config['src'],
             dst_dir=config['dst'],
-            angle=config['angle']
+            angle=config['angle'],
+            src_labels=config.get('src_labels'),
+            dst_labels=config.get('dst_labels')
         )
         
         print("Обработка завершена успешно!")
@@ -1,4 +1,5 @@
 import os
+import sys
 import yaml
 from PIL import Image
 from pathlib import Path
@@ -7,6 +8,9 @@ from functools import partial
 from tqdm import tqdm
 import time
 
+sys.path.append(str(Path(__file__).resolve().parents[3] / "000_common"))
+from yolo_labels import rotate_yolo_label_file
+
 def load_config(config_path):
     """
     Загрузка конфигурации из YAML файла
@@ -18,7 +22,7 @@ def process_single_image(args):
     """
     Обработка одного изображения
     """
-    src_path, dst_path, angle = args
+    src_path, dst_path, angle, src_label, dst_label = args
     try:
         # Создаем родительскую директорию если её нет
         Path(os.path.dirname(dst_path)).mkdir(parents=True, exist_ok=True)
@@ -30,7 +34,12 @@ def process_single_image(args):
                 rotated_img = img.rotate(-angle, expand=True)  # Отрицательный угол для поворота по часовой стрелке
                 rotated_img.save(dst_path, quality=95, subsampling=0)
             else:
+                rotated_img = img
                 img.save(dst_path, quality=95, subsampling=0)
+
+            # Поворачиваем разметку в том же процессе
+            if src_label:
+                rotate_yolo_label_file(src_label, dst_label, angle, img.size, rotated_img.size)
                 
         return True, src_path
     except Exception as e:
@@ -51,7 +60,7 @@ def collect_image_files(src_dir):
     
     return image_files
 
-def prepare_tasks(src_dir, dst_dir, image_files, angle):
+def prepare_tasks(src_dir, dst_dir, image_files, angle, src_labels=None, dst_labels=None):
     """
     Подготовка списка задач для параллельной обработки
     """
@@ -60,12 +69,17 @@ def prepare_tasks(src_dir, dst_dir, image_files, angle):
         # Создаем соответствующий путь в dst_dir
         rel_path = os.path.relpath(src_path, src_dir)
         dst_path = os.path.join(dst_dir, rel_path)
-        tasks.append((src_path, dst_path, angle))
+        src_label = dst_label = None
+        if src_labels:
+            rel_label = os.path.splitext(rel_path)[0] + '.txt'
+            src_label = os.path.join(src_labels, rel_label)
+            dst_label = os.path.join(dst_labels, rel_label)
+        tasks.append((src_path, dst_path, angle, src_label, dst_label))
     return tasks
 
-def process_images_parallel(src_dir, dst_dir, angle, num_processes=None):
+def process_images_parallel(src_dir, dst_dir, angle, num_processes=None, src_labels=None, dst_labels=None):
     """
-    Параллельная обработка изображений
+    Параллельная обработка изображений (и yolo разметки, если задан src_labels)
     """
     # Создаем корневую папку назначения
     Path(dst_dir).mkdir(parents=True, exist_ok=True)
@@ -82,7 +96,7 @@ def process_images_parallel(src_dir, dst_dir, angle, num_processes=None):
     print(f"Найдено {total_files} изображений")
     
     # Подготавливаем задачи
-    tasks = prepare_tasks(src_dir, dst_dir, image_files, angle)
+    tasks = prepare_tasks(src_dir, dst_dir, image_files, angle, src_labels, dst_labels)
     
     # Определяем количество процессов
     if num_processes is None:
@@ -132,6 +146,8 @@ def main():
         required_params = ['src', 'dst', 'angle']
         if not all(param in config for param in required_params):
             raise ValueError("В конфигурационном файле отсутствуют необходимые параметры")
+        if config.get('src_labels') and not config.get('dst_labels'):
+            raise ValueError("Для поворота разметки нужен параметр dst_labels")
         
         # Получаем количество процессов из конфига или используем значение по умолчанию
         num_processes = config.get('num_processes', None)
@@ -141,7 +157,9 @@ def main():
             src_dir=config['src'],
             dst_dir=config['dst'],
             angle=config['angle'],
-            num_processes=num_processes
+            num_processes=num_processes,
+            src_labels=config.get('src_labels'),
+            dst_labels=config.get('dst_labels')
         )
         
     except Exception as e:
@@ -1,62 +1,369 @@
+import os
+import sys
+import json
+import pickle
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
 import cv2
-from matplotlib import pyplot as plt
 import numpy as np
+import yaml
+from natsort import natsorted
+from tqdm import tqdm
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from image_io import imread_fit, image_size
+from image_probe import list_images
+
+METHODS = ('SIFT', 'ORB')
+# homography - полная перспектива; affine - сдвиг + поворот + масштаб, меньше дрейф на длинных рядах
+MODELS = ('homography', 'affine')
+CACHE_VERSION = 1
+PAIRS_NAME = 'pairs.pkl'
+# меньше совпадений после ratio test - пара считается не сшитой
+MIN_MATCHES = 10
+# панорама целиком в один файл, только если она не больше (пикселей)
+MAX_FULL_PIXELS = 100_000_000
+FLANN_INDEX_KDTREE = 1
+FLANN_INDEX_LSH = 6
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime
+
+
+def detect_features(path, method='SIFT', max_features=4000, feature_max_side=1600):
+    """
+    Keypoints (n, 2) in full-resolution pixels and descriptors of an image.
+    Detection runs on a gray image decoded at reduced scale (feature_max_side).
+    """
+    width, height = image_size(path)
+    img = imread_fit(path, (feature_max_side, feature_max_side))
+    scale = min(1.0, feature_max_side / max(width, height))
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if img.shape[1::-1] != size:
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    detector = cv2.SIFT_create(nfeatures=max_features) if method == 'SIFT' else cv2.ORB_create(nfeatures=max_features)
+    keypoints, descriptors = detector.detectAndCompute(gray, None)
+    pts = np.float32([kp.pt for kp in keypoints]).reshape(-1, 2) * [width / size[0], height / size[1]]
+    if descriptors is None:
+        descriptors = np.zeros((0, 128 if method == 'SIFT' else 32), np.float32 if method == 'SIFT' else np.uint8)
+    return pts.astype(np.float32), descriptors, (width, height)
+
+
+class FeatureCache:
+    """
+    Keypoints and descriptors of every image on disk (<cache_dir>/<name>.<params>.npz),
+    keyed by size/mtime of the image and detection parameters: features of a
+    frame are computed once, adding frames to a row only computes the new ones.
+    """
+
+    def __init__(self, cache_dir, method='SIFT', max_features=4000, feature_max_side=1600):
+        self.cache_dir = cache_dir
+        self.method, self.max_features, self.feature_max_side = method, max_features, feature_max_side
+        self.suffix = f".{method}_{max_features}_{feature_max_side}.npz"
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, image_path):
+        return os.path.join(self.cache_dir, os.path.basename(image_path) + self.suffix)
+
+    def load(self, image_path):
+        """(pts, descriptors, (width, height)) or None if not cached / outdated"""
+        path = self.path(image_path)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                if int(data['version']) != CACHE_VERSION or tuple(data['stamp'].tolist()) != _stamp(image_path):
+                    return None
+                return data['pts'], data['des'], tuple(int(v) for v in data['size'])
+        except (OSError, ValueError, KeyError):
+            return None
 
-def stitch_images(image1, image2, method="SIFT"):
-    # Загрузка изображений
-    img1 = cv2.imread(image1)
-    img2 = cv2.imread(image2)
-    
-    # Преобразование цветовых пространств
-    img1 = cv2.cvtColor(img1, cv2.COLOR_BGR2GRAY)
-    img2 = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
-    
-    if method == "SIFT":
-        # Поиск ключевых точек с помощью SIFT
-        sift = cv2.SIFT_create()
-        kp1, des1 = sift.detectAndCompute(img1, None)
-        kp2, des2 = sift.detectAndCompute(img2, None)
-
-        # Создание BFMatcher
-        bf = cv2.BFMatcher()
-        matches = bf.knnMatch(des1, des2, k=2)
-
-        # Фильтрация дубликатов
-        good = []
-        for m, n in matches:
-            if m.distance < 0.75 * n.distance:
-                good.append([m])
-
-        src_pts = np.float32([kp1[m.queryIdx].pt for m in good]).reshape(-1, 1, 2)
-        dst_pts = np.float32([kp2[m.trainIdx].pt for m in good]).reshape(-1, 1, 2)
-
-        M, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 5.0)
-        pts = np.float32([[0, 0], [img1.shape[1], 0], [0, img1.shape[0]], [img1.shape[1], img1.shape[0]]]).reshape(-1, 1, 2)
-        dst = cv2.perspectiveTransform(pts, M)
-
-        # Изменение размера для отображения
-        h, w = img2.shape
-        trapezoid = np.max((dst[:, 1, 0] - dst[:, 0, 0]), (dst[:, 3, 0] - dst[:, 2, 0])) / 2
-        center = (np.min((dst[:, 0, 0] + dst[:, 1, 0]) / 2, (dst[:, 2, 0] + dst[:, 3, 0]) / 2), h / 2)
-        pts = np.float32([[0, 0], [w, 0], [trapezoid, h], [w - trapezoid, h]])
-        M = cv2.getPerspectiveTransform(dst, pts)
-        result = cv2.warpPerspective(img2, M, (int(w), int(h)))
+    def compute(self, image_path):
+        """Worker: detect and save. Returns number of keypoints"""
+        pts, des, size = detect_features(image_path, self.method, self.max_features, self.feature_max_side)
+        tmp = self.path(image_path) + '.tmp.npz'
+        np.savez(tmp, version=CACHE_VERSION, stamp=np.array(_stamp(image_path), dtype=np.float64),
+                 pts=pts, des=des, size=np.array(size))
+        os.replace(tmp, self.path(image_path))
+        return len(pts)
+
+    def update(self, image_paths, num_workers=None):
+        """Compute features of images that are not cached yet, in a process pool"""
+        todo = [path for path in image_paths if self.load(path) is None]
+        if todo:
+            with ProcessPoolExecutor(num_workers or os.cpu_count()) as executor:
+                list(tqdm(executor.map(self.compute, todo, chunksize=4), total=len(todo), desc='features'))
+        return len(todo)
+
+
+def _matcher(method):
+    """FLANN: KD-деревья для SIFT (float), LSH для ORB (бинарные дескрипторы)"""
+    if method == 'SIFT':
+        return cv2.FlannBasedMatcher(dict(algorithm=FLANN_INDEX_KDTREE, trees=5), dict(checks=50))
+    return cv2.FlannBasedMatcher(dict(algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12, multi_probe_level=1),
+                                 dict(checks=50))
+
+
+def match_pair(features_a, features_b, method='SIFT', model='homography', ratio=0.75, ransac_threshold=5.0,
+               min_inliers=30):
+    """
+    Transform (3x3) from image b to image a estimated from FLANN matches with
+    Lowe's ratio test and RANSAC, and the number of inliers. (None, inliers)
+    if the pair does not match or the transform is degenerate.
+    """
+    pts_a, des_a, _ = features_a
+    pts_b, des_b, _ = features_b
+    if len(des_a) < 2 or len(des_b) < 2:
+        return None, 0
+    knn = _matcher(method).knnMatch(des_b, des_a, k=2)
+    # LSH может вернуть меньше двух соседей
+    good = [pair[0] for pair in knn if len(pair) == 2 and pair[0].distance < ratio * pair[1].distance]
+    if len(good) < MIN_MATCHES:
+        return None, len(good)
+    src = pts_b[[m.queryIdx for m in good]]
+    dst = pts_a[[m.trainIdx for m in good]]
+    if model == 'homography':
+        transform, mask = cv2.findHomography(src, dst, cv2.RANSAC, ransac_threshold)
     else:
-        # Ваш метод
-        pass
+        affine, mask = cv2.estimateAffinePartial2D(src, dst, method=cv2.RANSAC, ransacReprojThreshold=ransac_threshold)
+        transform = None if affine is None else np.vstack([affine, [0, 0, 1]])
+    inliers = int(mask.sum()) if mask is not None else 0
+    if transform is None or inliers < min_inliers:
+        return None, inliers
+    # соседние кадры ряда почти одного масштаба: сильное сжатие/растяжение - ложное совпадение
+    det = np.linalg.det(transform[:2, :2])
+    if not 0.5 < det < 2.0:
+        return None, inliers
+    return transform, inliers
+
+
+class PairCache:
+    """(frame a, frame b, their stamps, feature and matching params) -> (transform b->a or None, inliers), one pickle"""
+
+    def __init__(self, cache_dir):
+        self.path = os.path.join(cache_dir, PAIRS_NAME)
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'rb') as f:
+                    data = pickle.load(f)
+                if data.get('version') == CACHE_VERSION:
+                    self.entries = data['entries']
+            except (OSError, pickle.UnpicklingError, EOFError):
+                pass
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump({'version': CACHE_VERSION, 'entries': self.entries}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+
+def chain_transforms(image_paths, features, params, pair_cache=None, num_threads=None, features_id=''):
+    """
+    Match only neighbours (i, i+1) and chain their transforms into transforms
+    to the first frame of a segment. A pair that does not match starts a new
+    segment. features: callable(path) -> features, features_id: detection
+    parameters of these features (FeatureCache.suffix), part of the pair cache key.
+    Returns a list of segments, each a list of (image path, 3x3 transform into
+    the segment's first frame).
+    """
+    def key(a, b):
+        # другие max_features/feature_max_side - другие признаки, прежний результат пары не годится
+        return (os.path.basename(a), _stamp(a), os.path.basename(b), _stamp(b), features_id,
+                tuple(sorted(params.items())))
+
+    pairs = list(zip(image_paths[:-1], image_paths[1:]))
+    todo = [(a, b) for a, b in pairs if pair_cache is None or key(a, b) not in pair_cache.entries]
+
+    def match(pair):
+        return match_pair(features(pair[0]), features(pair[1]), **params)
+
+    results = {}
+    if todo:
+        with ThreadPoolExecutor(num_threads or os.cpu_count()) as executor:
+            for pair, result in zip(todo, tqdm(executor.map(match, todo), total=len(todo), desc='matching')):
+                results[pair] = result
+                if pair_cache is not None:
+                    pair_cache.entries[key(*pair)] = result
+        if pair_cache is not None:
+            pair_cache.save()
+
+    segments = [[(image_paths[0], np.eye(3))]]
+    for a, b in pairs:
+        transform, inliers = results[(a, b)] if (a, b) in results else pair_cache.entries[key(a, b)]
+        if transform is None:
+            print(f"Не сшивается {os.path.basename(a)} -> {os.path.basename(b)} (inliers: {inliers}), новый сегмент")
+            segments.append([(b, np.eye(3))])
+        else:
+            segments[-1].append((b, segments[-1][-1][1] @ transform))
+    return segments
+
+
+@lru_cache(maxsize=8)
+def _feather(width, height):
+    """Blend weight of a frame: distance to its border, 1 in the middle"""
+    mask = np.zeros((height, width), np.uint8)
+    mask[1:-1, 1:-1] = 1
+    weight = cv2.distanceTransform(mask, cv2.DIST_L2, 3)
+    return (weight / max(float(weight.max()), 1.0)).astype(np.float32) + 1e-3
+
+
+@lru_cache(maxsize=32)
+def _load_frame(path, scale):
+    """Frame for the output scale (reduced JPEG decode) + matrix from its pixels to full-resolution pixels"""
+    width, height = image_size(path)
+    img = imread_fit(path, (max(1, round(width * scale)), max(1, round(height * scale))))
+    to_full = np.diag([width / img.shape[1], height / img.shape[0], 1.0])
+    return img, to_full
+
+
+def segment_layout(segment, scale):
+    """
+    Canvas placement of a segment at the output scale: matrices frame (full
+    resolution) -> canvas pixels, bounding boxes of frames on the canvas, canvas size.
+    """
+    scaling = np.diag([scale, scale, 1.0])
+    matrices, boxes = [], []
+    for path, transform in segment:
+        width, height = image_size(path)
+        corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]]).reshape(-1, 1, 2)
+        warped = cv2.perspectiveTransform(corners, scaling @ transform).reshape(-1, 2)
+        matrices.append(scaling @ transform)
+        boxes.append(np.hstack([warped.min(axis=0), warped.max(axis=0)]))
+    boxes = np.array(boxes)
+    origin = boxes[:, :2].min(axis=0)
+    shift = np.array([[1, 0, -origin[0]], [0, 1, -origin[1]], [0, 0, 1]])
+    matrices = [shift @ m for m in matrices]
+    boxes = boxes - np.tile(origin, 2)
+    size = tuple(int(np.ceil(v)) for v in boxes[:, 2:].max(axis=0))
+    return matrices, boxes, size
+
+
+def render_tile(tile_rect, frames, scale):
+    """
+    One canvas tile: every frame that overlaps it is warped straight into the
+    tile and blended with feather weights. frames: list of (path, frame -> canvas matrix).
+    """
+    x, y, w, h = tile_rect
+    shift = np.array([[1, 0, -x], [0, 1, -y], [0, 0, 1]], dtype=np.float64)
+    acc = np.zeros((h, w, 3), np.float32)
+    weight_sum = np.zeros((h, w), np.float32)
+    for path, matrix in frames:
+        img, to_full = _load_frame(path, scale)
+        m = shift @ matrix @ to_full
+        warped = cv2.warpPerspective(img, m, (w, h), flags=cv2.INTER_LINEAR)
+        weight = cv2.warpPerspective(_feather(img.shape[1], img.shape[0]), m, (w, h), flags=cv2.INTER_LINEAR)
+        acc += warped * weight[..., None]
+        weight_sum += weight
+    tile = acc / np.maximum(weight_sum, 1e-6)[..., None]
+    return np.clip(tile, 0, 255).astype(np.uint8)
+
+
+def render_segment(segment, dst_dir, scale=0.5, tile_size=2048, preview_max_side=4000, num_threads=None,
+                   jpeg_quality=92):
+    """
+    Blend a segment into a canvas tile by tile: only tiles covered by frames
+    are rendered and written to dst_dir/tiles/, memory does not depend on the
+    panorama size. Also writes a downscaled preview, the full panorama if it is
+    not larger than MAX_FULL_PIXELS, and transforms.json (frame -> canvas matrix).
+    """
+    matrices, boxes, (width, height) = segment_layout(segment, scale)
+    tiles_dir = os.path.join(dst_dir, 'tiles')
+    os.makedirs(tiles_dir, exist_ok=True)
+
+    tiles = []
+    for row in range(int(np.ceil(height / tile_size))):
+        for col in range(int(np.ceil(width / tile_size))):
+            x, y = col * tile_size, row * tile_size
+            w, h = min(tile_size, width - x), min(tile_size, height - y)
+            hit = np.nonzero((boxes[:, 0] < x + w) & (boxes[:, 2] > x) & (boxes[:, 1] < y + h) & (boxes[:, 3] > y))[0]
+            if len(hit):
+                tiles.append(((row, col), (x, y, w, h), hit))
+    # тайлы по порядку кадров: соседние тайлы берут одни и те же кадры из кэша
+    tiles.sort(key=lambda t: t[2][0])
+
+    preview_scale = min(1.0, preview_max_side / max(width, height))
+    preview = np.zeros((max(1, round(height * preview_scale)), max(1, round(width * preview_scale)), 3), np.uint8)
+    full = np.zeros((height, width, 3), np.uint8) if width * height <= MAX_FULL_PIXELS else None
+    params = [cv2.IMWRITE_JPEG_QUALITY, int(jpeg_quality)]
+
+    def work(tile):
+        (row, col), rect, hit = tile
+        image = render_tile(rect, [(segment[i][0], matrices[i]) for i in hit], scale)
+        cv2.imwrite(os.path.join(tiles_dir, f"tile_{row:04d}_{col:04d}.jpg"), image, params)
+        return rect, image
+
+    with ThreadPoolExecutor(num_threads or os.cpu_count()) as executor:
+        for (x, y, w, h), image in tqdm(executor.map(work, tiles), total=len(tiles), desc='tiles'):
+            if full is not None:
+                full[y:y + h, x:x + w] = image
+            px, py = round(x * preview_scale), round(y * preview_scale)
+            pw = min(max(1, round(w * preview_scale)), preview.shape[1] - px)
+            ph = min(max(1, round(h * preview_scale)), preview.shape[0] - py)
+            if pw > 0 and ph > 0:
+                preview[py:py + ph, px:px + pw] = cv2.resize(image, (pw, ph), interpolation=cv2.INTER_AREA)
+
+    cv2.imwrite(os.path.join(dst_dir, 'preview.jpg'), preview, params)
+    if full is not None:
+        cv2.imwrite(os.path.join(dst_dir, 'panorama.jpg'), full, params)
+    with open(os.path.join(dst_dir, 'transforms.json'), 'w') as f:
+        json.dump({'scale': scale, 'size': [width, height], 'tile_size': tile_size,
+                   'frames': {os.path.basename(path): m.tolist() for (path, _), m in zip(segment, matrices)}}, f, indent=1)
+    return width, height, len(tiles)
+
+
+def stitch_images(image1, image2, method="SIFT", model='homography'):
+    """Two images into one panorama (BGR) at full resolution, without caches"""
+    features = {path: detect_features(path, method) for path in (image1, image2)}
+    transform, inliers = match_pair(features[image1], features[image2], method, model)
+    if transform is None:
+        raise ValueError(f"Изображения не сшиваются (inliers: {inliers})")
+    segment = [(image1, np.eye(3)), (image2, transform)]
+    matrices, _, (width, height) = segment_layout(segment, 1.0)
+    return render_tile((0, 0, width, height), [(path, m) for (path, _), m in zip(segment, matrices)], 1.0)
+
+
+def main():
+    with open('config.yaml', 'r') as f:
+        config = yaml.safe_load(f)
+    method = config.get('method', 'SIFT')
+    model = config.get('model', 'homography')
+    if method not in METHODS or model not in MODELS:
+        raise ValueError(f"method: {METHODS}, model: {MODELS}")
+    src, dst = config['src'], config['dst']
+    cache_dir = config.get('cache_dir') or os.path.join(src, '.features')
+    num_workers = config.get('num_workers') or os.cpu_count()
+
+    # кадры ряда по порядку имен: {video_stem}_{idx}.jpg из граббера
+    image_paths = natsorted(path for path, _, _ in list_images(src))
+    if len(image_paths) < 2:
+        raise ValueError(f"В {src} меньше двух изображений")
+    print(f"Кадров: {len(image_paths)}, {method}, {model}, кэш признаков: {cache_dir}")
+
+    cache = FeatureCache(cache_dir, method, config.get('max_features', 4000), config.get('feature_max_side', 1600))
+    print(f"Признаки посчитаны для {cache.update(image_paths, num_workers)} новых кадров")
 
-    return result
+    loaded = lru_cache(maxsize=64)(cache.load)
+    params = dict(method=method, model=model, ratio=config.get('ratio', 0.75),
+                  ransac_threshold=config.get('ransac_threshold', 5.0), min_inliers=config.get('min_inliers', 30))
+    segments = chain_transforms(image_paths, loaded, params, PairCache(cache_dir), num_workers, cache.suffix)
 
-# Загрузка изображений
-image1 = "/Volumes/Orico/projetcs_sbs/001_green-houses/001_DS_models/002_tops/001_raw_data/009_joined_20_11_24_TkPodmoskovie_video/001_raw_vids/002_tomatos/IMG_2913_new_start/IMG_2913_new_start_10.jpg"
-image2 = "/Volumes/Orico/projetcs_sbs/001_green-houses/001_DS_models/002_tops/001_raw_data/009_joined_20_11_24_TkPodmoskovie_video/001_raw_vids/002_tomatos/IMG_5823_new_start/IMG_5823_new_start_10.jpg"
+    min_frames = config.get('min_segment_frames', 2)
+    for idx, segment in enumerate(segments):
+        if len(segment) < min_frames:
+            continue
+        segment_dir = os.path.join(dst, f"segment_{idx:03d}")
+        width, height, n_tiles = render_segment(segment, segment_dir, config.get('output_scale', 0.5),
+                                                config.get('tile_size', 2048), config.get('preview_max_side', 4000),
+                                                num_workers, config.get('jpeg_quality', 92))
+        print(f"{segment_dir}: кадров {len(segment)}, панорама {width}x{height}, тайлов {n_tiles}")
 
-# Сшивание изображений
-stitched_image = stitch_images(image1, image2, method="SIFT")
 
-# Показ результата
-plt.figure(figsize=(15, 15))
-plt.axis("off")
-plt.title("Stitched Image")
-plt.imshow(stitched_image)
-plt.show()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any
+
+from tqdm import tqdm
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from ffmpeg_jobs import job_threads
+from video_proxy import build_proxy, PROXY_DIR
+
+
+def load_config(config_path: str) -> Dict[str, Any]:
+    """Загрузка конфигурации из YAML файла"""
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    config.setdefault('max_height', 720)
+    config.setdefault('quality', 5)
+    config.setdefault('use_ffmpeg', True)
+    config.setdefault('video_formats', ['.mp4', '.avi', '.MOV', '.asf'])
+    return config
+
+
+def list_videos(src: str, video_formats, recursive=False) -> list:
+    if os.path.isfile(src):
+        return [Path(src)]
+    vid_formats = tuple('.' + fmt.lower().lstrip('.') for fmt in video_formats)
+    paths = Path(src).rglob('*') if recursive else Path(src).iterdir()
+    return sorted(path for path in paths
+                  if path.suffix.lower() in vid_formats and not path.name.startswith('.')
+                  and PROXY_DIR not in path.parts)
+
+
+def main():
+    config = load_config('config.yaml')
+    videos = list_videos(config['src'], config['video_formats'], config.get('recursive', False))
+    num_jobs, threads = job_threads(config.get('num_jobs'), config.get('threads_per_job'))
+    print(f"Видео: {len(videos)}, прокси {config['max_height'] or 'исходного'}p, одновременно: {num_jobs}")
+
+    def build(path):
+        try:
+            return build_proxy(str(path), config.get('proxy_dir'), config['max_height'], config['quality'],
+                               threads, config['use_ffmpeg'])
+        except Exception as e:
+            tqdm.write(f"Ошибка {path}: {e}")
+            return 'failed'
+
+    with ThreadPoolExecutor(num_jobs) as executor:
+        statuses = list(tqdm(executor.map(build, videos), total=len(videos)))
+    print(f"Собрано: {statuses.count('built')}, уже актуальны: {statuses.count('up_to_date')}, "
+          f"ошибок: {statuses.count('failed')}")
+
+
+if __name__ == '__main__':
+    main()
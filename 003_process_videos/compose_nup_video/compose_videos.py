@@ -0,0 +1,220 @@
+import os
+import sys
+import queue
+import shutil
+import subprocess
+import threading
+from pathlib import Path
+from typing import Dict, Any, List
+
+import cv2
+import yaml
+from natsort import natsorted
+from tqdm import tqdm
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from tile_grid import TileGrid
+from video_proxy import open_video
+
+# opencv - кадры декодируются потоками-читателями и собираются в один заранее выделенный холст
+# ffmpeg - фильтр xstack, пиксели вообще не проходят через Python
+BACKENDS = ('opencv', 'ffmpeg')
+# сколько готовых кадров может ждать в очереди каждого читателя
+QUEUE_SIZE = 8
+_END = None
+
+
+def load_config(config_path: str) -> Dict[str, Any]:
+    """Загрузка конфигурации из YAML файла"""
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    config.setdefault('backend', 'opencv')
+    config.setdefault('columns', None)
+    config.setdefault('header_height', 0)
+    config.setdefault('stop_at', 'shortest')
+    config.setdefault('video_formats', ['.mp4', '.avi', '.MOV', '.asf'])
+    if config['backend'] not in BACKENDS:
+        raise ValueError(f"Неизвестный backend {config['backend']}, доступны: {BACKENDS}")
+    if config['stop_at'] not in ('shortest', 'longest'):
+        raise ValueError("stop_at: shortest или longest")
+    if len(config['inputs']) < 2:
+        raise ValueError("Нужно минимум 2 источника в inputs")
+    return config
+
+
+def make_grid(config: Dict[str, Any], labels: List[str]) -> TileGrid:
+    return TileGrid(labels, (config['tile_width'], config['tile_height']), config['columns'],
+                    config['header_height'], config.get('background', 255), config.get('font_scale', 1.0),
+                    config.get('font_thickness', 2), tuple(config.get('label_color', (255, 0, 0))))
+
+
+class FrameReader(threading.Thread):
+    """
+    Reads one video strictly sequentially (no seeking) and puts frames already
+    fitted to the tile into a bounded queue. cv2 decode and resize release
+    the GIL, so N readers decode N videos in parallel.
+    """
+
+    def __init__(self, path: str, grid: TileGrid, use_proxy: bool = False):
+        super().__init__(daemon=True)
+        self.path = path
+        self.grid = grid
+        self.use_proxy = use_proxy
+        self.frames = queue.Queue(QUEUE_SIZE)
+        self.stopped = threading.Event()
+
+    def run(self):
+        # прокси (build_proxies) декодируется быстрее исходника и уже меньше, тайлу хватает
+        video = open_video(self.path) if self.use_proxy else cv2.VideoCapture(self.path)
+        try:
+            while not self.stopped.is_set():
+                ret, frame = video.read()
+                if not ret:
+                    break
+                self.frames.put(self.grid.fit(frame))
+        finally:
+            video.release()
+            self.frames.put(_END)
+
+    def stop(self):
+        self.stopped.set()
+        # освобождаем место, если читатель ждет в put
+        while not self.frames.empty():
+            self.frames.get_nowait()
+
+
+def compose_opencv(paths: List[str], out_path: str, grid: TileGrid, config: Dict[str, Any]) -> int:
+    """Compose same-length videos frame by frame into the canvas of grid. Returns the number of written frames."""
+    probe = open_video(paths[0]) if config.get('use_proxy') else cv2.VideoCapture(paths[0])
+    fps = probe.get(cv2.CAP_PROP_FPS) or 25
+    total = int(probe.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+    probe.release()
+
+    readers = [FrameReader(path, grid, config.get('use_proxy', False)) for path in paths]
+    for reader in readers:
+        reader.start()
+    out = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*config.get('fourcc', 'mp4v')), fps, grid.size)
+    canvas = grid.new_canvas()
+    alive = [True] * len(readers)
+    n_frames = 0
+    try:
+        with tqdm(total=total, desc=os.path.basename(out_path), leave=False) as progress:
+            while True:
+                for idx, reader in enumerate(readers):
+                    if not alive[idx]:
+                        continue
+                    frame = reader.frames.get()
+                    if frame is _END:
+                        alive[idx] = False
+                        # закончившийся источник - пустой тайл (для stop_at: longest)
+                        grid.clear(canvas, idx)
+                    else:
+                        grid.place(canvas, idx, frame)
+                if not all(alive) and (config['stop_at'] == 'shortest' or not any(alive)):
+                    break
+                out.write(canvas)
+                n_frames += 1
+                progress.update(1)
+    finally:
+        for reader in readers:
+            reader.stop()
+        out.release()
+    return n_frames
+
+
+def _filter_path(path: str) -> str:
+    """Путь внутри filtergraph ffmpeg: обратные слеши и двоеточия экранируются"""
+    return path.replace('\\', '/').replace(':', '\\:').replace("'", "\\'")
+
+
+def xstack_command(paths: List[str], out_path: str, grid: TileGrid, label_files: List[str],
+                   config: Dict[str, Any]) -> List[str]:
+    """
+    ffmpeg command: every input is scaled into its tile (keeping aspect ratio,
+    padded with the background), labelled with drawtext and placed by xstack
+    at the pixel positions of the TileGrid layout.
+    """
+    tile_w, tile_h, header = grid.tile_w, grid.tile_h, grid.header_height
+    bg = 'white' if grid.background == 255 else 'black'
+    b, g, r = grid.text_color
+    color = f'0x{r:02x}{g:02x}{b:02x}' if not header else 'black'
+    fontsize = max(8, int(30 * grid.font_scale))
+    chains, layout = [], []
+    for idx, label_file in enumerate(label_files):
+        chain = (f"[{idx}:v]scale={tile_w}:{tile_h}:force_original_aspect_ratio=decrease,"
+                 f"pad={tile_w}:{tile_h + header}:({tile_w}-iw)/2:{header}+({tile_h}-ih)/2:color={bg},setsar=1")
+        if label_file:
+            if header:
+                position = f"x=(w-text_w)/2:y=({header}-text_h)/2"
+            else:
+                position = "x=20:y=20"
+            chain += f",drawtext=textfile='{_filter_path(label_file)}':{position}:fontsize={fontsize}:fontcolor={color}"
+        chains.append(chain + f"[v{idx}]")
+        x, y = grid.tile_origin(idx)
+        layout.append(f"{x}_{y - header}")
+    inputs = ''.join(f"[v{idx}]" for idx in range(len(paths)))
+    shortest = 1 if config['stop_at'] == 'shortest' else 0
+    chains.append(f"{inputs}xstack=inputs={len(paths)}:layout={'|'.join(layout)}:fill={bg}:shortest={shortest}[out]")
+
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error', '-stats']
+    for path in paths:
+        cmd += ['-i', path]
+    cmd += ['-filter_complex', ';'.join(chains), '-map', '[out]', '-an']
+    cmd += config.get('ffmpeg_output_args', ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-pix_fmt', 'yuv420p'])
+    return cmd + [out_path]
+
+
+def compose_ffmpeg(paths: List[str], out_path: str, grid: TileGrid, config: Dict[str, Any]) -> None:
+    # подписи через textfile: не нужно экранировать запятые, кавычки и двоеточия в тексте
+    label_files = []
+    try:
+        for idx, label in enumerate(grid.labels):
+            if not label:
+                label_files.append(None)
+                continue
+            label_file = f"{out_path}.label{idx}.txt"
+            with open(label_file, 'w') as f:
+                f.write(label)
+            label_files.append(label_file)
+        subprocess.run(xstack_command(paths, out_path, grid, label_files, config), check=True)
+    finally:
+        for label_file in label_files:
+            if label_file:
+                os.remove(label_file)
+
+
+def main():
+    config = load_config('config.yaml')
+    inputs = config['inputs']
+    dst = Path(config['dst'])
+    dst.mkdir(parents=True, exist_ok=True)
+    grid = make_grid(config, [str(item.get('label', '')) for item in inputs])
+    if config['backend'] == 'ffmpeg' and shutil.which('ffmpeg') is None:
+        raise RuntimeError("ffmpeg не найден в PATH, используйте backend: opencv")
+
+    vid_formats = tuple('.' + fmt.lower().lstrip('.') for fmt in config['video_formats'])
+    names = natsorted(name for name in os.listdir(inputs[0]['dir'])
+                      if name.lower().endswith(vid_formats) and not name.startswith('.'))
+    print(f"Источников: {len(inputs)}, видео: {len(names)}, сетка {grid.rows}x{grid.columns}, "
+          f"кадр {grid.size[0]}x{grid.size[1]}, backend: {config['backend']}")
+
+    for name in tqdm(names):
+        paths = [os.path.join(item['dir'], name) for item in inputs]
+        missing = [path for path in paths if not os.path.exists(path)]
+        if missing:
+            print(f"Пропуск {name}: нет {missing}")
+            continue
+        out_path = str(dst / name)
+        if config['backend'] == 'ffmpeg':
+            try:
+                compose_ffmpeg(paths, out_path, grid, config)
+            except subprocess.CalledProcessError as e:
+                print(f"ffmpeg завершился с ошибкой для {name}: {e.returncode}")
+        else:
+            n_frames = compose_opencv(paths, out_path, grid, config)
+            if not n_frames:
+                print(f"{name}: ни одного кадра не прочитано")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,15 @@
 import os
+import sys
 import cv2
 import ffmpeg
 from concurrent.futures import ThreadPoolExecutor
 import multiprocessing
+from pathlib import Path
 from typing import Optional, Dict
 
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from video_proxy import open_proxy
+
 def extract_frames_ffmpeg(video_path: str, output_dir: str, frame_rate: int, base_name: str, 
                          hw_params: dict = None) -> None:
     try:
@@ -38,7 +43,7 @@ def extract_frames_ffmpeg(video_path: str, output_dir: str, frame_rate: int, bas
 
 def grab_frame_optimized(src_loc: str, dst_loc: str, rate_loc: int, 
                         base_name_file: str, hw_accel: Optional[str] = None,
-                        use_ffmpeg: bool = True) -> None:
+                        use_ffmpeg: bool = True, use_proxy: bool = False) -> None:
     
     if use_ffmpeg:
         try:
@@ -51,6 +56,24 @@ def grab_frame_optimized(src_loc: str, dst_loc: str, rate_loc: int,
         except Exception as e:
             print(f"FFmpeg failed, falling back to OpenCV: {e}")
     
+    # Прокси исходного разрешения (build_proxies), только по use_proxy: кадры прокси уже
+    # сжаты MJPEG, и сохраненный кадр датасета будет сжат JPEG второй раз.
+    # Каждый кадр читается по индексу, get_frame потокобезопасен
+    proxy = open_proxy(src_loc, allow_reduced=False) if use_proxy else None
+    if proxy is not None:
+        encode_params = [cv2.IMWRITE_JPEG_QUALITY, 85]
+
+        def save_proxy_frame(frame_idx):
+            frame = proxy.get_frame(frame_idx)
+            if frame is not None:
+                name_out = os.path.join(dst_loc, f"{base_name_file}_{frame_idx//rate_loc}.jpg")
+                cv2.imwrite(name_out, frame, encode_params)
+
+        with ThreadPoolExecutor(max_workers=multiprocessing.cpu_count() * 2) as executor:
+            list(executor.map(save_proxy_frame, range(0, len(proxy), rate_loc)))
+        proxy.release()
+        return
+
     # Оптимизация для OpenCV
     cap_params = {'buffersize': 10240}  # Увеличиваем буфер
     
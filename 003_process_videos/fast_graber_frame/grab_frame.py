@@ -50,6 +50,7 @@ def load_config(config_path: str) -> Dict[str, Any]:
     config.setdefault('hardware', {}).setdefault('force_cpu', False)
     config.setdefault('processing', {}).setdefault('max_workers', None)
     config.setdefault('processing', {}).setdefault('use_ffmpeg', True)
+    config.setdefault('processing', {}).setdefault('use_proxy', False)
     config.setdefault('video_formats', ['.mp4', '.avi', '.MOV', '.asf'])
     
     return config
@@ -73,8 +74,8 @@ def validate_config(config: Dict[str, Any]) -> None:
 
 def process_video(args):
     """Обработка одного видео"""
-    src_loc, dst_loc, rate, base_name_file, hw_accel, use_ffmpeg = args
-    grab_frame_optimized(src_loc, dst_loc, rate, base_name_file, hw_accel, use_ffmpeg)
+    src_loc, dst_loc, rate, base_name_file, hw_accel, use_ffmpeg, use_proxy = args
+    grab_frame_optimized(src_loc, dst_loc, rate, base_name_file, hw_accel, use_ffmpeg, use_proxy)
 
 def main():
 
@@ -103,7 +104,8 @@ def main():
             rate, 
             base_name_file, 
             hw_accel,
-            use_ffmpeg=config['processing']['use_ffmpeg']
+            use_ffmpeg=config['processing']['use_ffmpeg'],
+            use_proxy=config['processing']['use_proxy']
         )
     
     elif os.path.isdir(src_path):
@@ -124,7 +126,8 @@ def main():
                     rate,
                     base_name_file,
                     hw_accel,
-                    config['processing']['use_ffmpeg']
+                    config['processing']['use_ffmpeg'],
+                    config['processing']['use_proxy']
                 ))
             else:
                 print(f"Skipping file: {file_path}")
@@ -1,14 +1,24 @@
 import os
+import sys
 import cv2
 import textwrap
 import argparse
 import tqdm
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from video_proxy import open_video
 
 
 
 if __name__ == '__main__':
-    def grab_frame(src_loc,dst_loc,rate_loc,base_name_file):
-        video = cv2.VideoCapture(src_loc)  #  Захватываем фрагмент видеофайла
+    def grab_frame(src_loc,dst_loc,rate_loc,base_name_file,use_proxy=False):
+        # --use-proxy: прокси исходного разрешения (build_proxies), перемотка без декодирования от ключевого кадра,
+        # но кадры прокси уже сжаты MJPEG - по умолчанию кадры датасета берутся из исходника
+        if use_proxy:
+            video = open_video(src_loc, allow_reduced=False)
+        else:
+            video = cv2.VideoCapture(src_loc)  #  Захватываем фрагмент видеофайла
         currentframe = 0
 
         total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
@@ -31,6 +41,7 @@ if __name__ == '__main__':
     parser.add_argument('-s', '--src', type=str, required=True)
     parser.add_argument('-d','--dst', type=str, required=True)
     parser.add_argument('-r', '--rate', type=int, default=25) # how often take frame
+    parser.add_argument('--use-proxy', action='store_true') # read frames from a full-resolution proxy of build_proxies
 
     args = parser.parse_args()
     print(args)
@@ -46,7 +57,7 @@ if __name__ == '__main__':
         print("Processing: "+base_name_file)
 
         base_name_file=base_name_file[:base_name_file.rfind(".")] 
-        grab_frame(src,dst,rate,base_name_file)
+        grab_frame(src,dst,rate,base_name_file,args.use_proxy)
     elif os.path.isdir(src): # Если несколько видеофайлов
         for i in tqdm.tqdm(os.listdir(src)):
             vid_formats=('.mp4', '.avi', '.MOV', '.asf')   
@@ -58,4 +69,4 @@ if __name__ == '__main__':
                 if not os.path.exists(dst_loc):
                     os.makedirs(dst_loc)
 
-                grab_frame(src_loc,dst_loc,rate,base_name_file)
\ No newline at end of file
+                grab_frame(src_loc,dst_loc,rate,base_name_file,args.use_proxy)
\ No newline at end of file
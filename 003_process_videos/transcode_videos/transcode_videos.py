@@ -0,0 +1,84 @@
+import os
+import sys
+import shutil
+import yaml
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Any
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from ffmpeg_jobs import PRESETS, TranscodeState, job_threads, make_job, run_jobs
+
+
+def load_config(config_path: str) -> Dict[str, Any]:
+    """Загрузка конфигурации из YAML файла"""
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    config.setdefault('preset', 'h264')
+    config.setdefault('retries', 1)
+    config.setdefault('strip_spaces', True)
+    config.setdefault('video_formats', ['.mp4', '.avi', '.MOV', '.asf'])
+    if config['preset'] not in PRESETS:
+        raise ValueError(f"Неизвестный preset {config['preset']}, доступны: {list(PRESETS)}")
+    return config
+
+
+def list_videos(src: str, video_formats) -> list:
+    if os.path.isfile(src):
+        return [Path(src)]
+    vid_formats = tuple('.' + fmt.lower().lstrip('.') for fmt in video_formats)
+    return sorted(path for path in Path(src).iterdir()
+                  if path.suffix.lower() in vid_formats and not path.name.startswith('.'))
+
+
+def output_names(paths: list, strip_spaces: bool) -> list:
+    """
+    Имена результатов без расширения. Разные исходники не должны писать в один файл:
+    при совпадении (x.mp4 и x.avi, "a b.mp4" и "ab.mp4" при strip_spaces) к имени
+    добавляется расширение исходника, если и это не помогло - порядковый номер
+    """
+    stems = [path.stem.replace(' ', '') if strip_spaces else path.stem for path in paths]
+    counts = Counter(stems)
+    # имена без совпадений не меняются, переименовываются только совпавшие
+    names = [stem if counts[stem] == 1 else None for stem in stems]
+    taken = set(stems)
+    for idx, path in enumerate(paths):
+        if names[idx] is None:
+            name = f"{stems[idx]}_{path.suffix.lstrip('.')}"
+            k = 1
+            while (f"{name}_{k}" if k > 1 else name) in taken:
+                k += 1
+            names[idx] = f"{name}_{k}" if k > 1 else name
+            taken.add(names[idx])
+    for path, stem, name in zip(paths, stems, names):
+        if name != stem:
+            print(f"Совпадение имен: {path.name} -> {name}")
+    return names
+
+
+def main():
+    config = load_config('config.yaml')
+    if shutil.which('ffmpeg') is None:
+        raise RuntimeError("ffmpeg не найден в PATH")
+    dst = Path(config['dst'])
+    dst.mkdir(parents=True, exist_ok=True)
+
+    num_jobs, threads = job_threads(config.get('num_jobs'), config.get('threads_per_job'))
+    ext = PRESETS[config['preset']]['ext']
+    jobs = []
+    paths = list_videos(config['src'], config['video_formats'])
+    for path, name in zip(paths, output_names(paths, config['strip_spaces'])):
+        jobs.append(make_job(path, dst / (name + ext), config['preset'], threads,
+                             config.get('input_args', ()), config.get('extra_args', ())))
+    print(f"Видео: {len(jobs)}, preset: {config['preset']}, одновременно ffmpeg: {num_jobs}, потоков на каждый: {threads}")
+
+    report = run_jobs(jobs, num_jobs, TranscodeState(str(dst)), config['retries'])
+    print(f"Готово: {report['done']}, уже актуальны: {report['skipped']}, ошибок: {len(report['failed'])}")
+    for src, error in report['failed']:
+        print(f"  {src}: {error.splitlines()[-1] if error else ''}")
+    if report['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import os
+import sys
 import yaml
 import csv
 import pandas as pd
@@ -6,25 +7,23 @@ from pathlib import Path
 from tabulate import tabulate
 from natsort import natsorted
 
-def count_images_in_directory(directory):
+sys.path.append(str(Path(__file__).resolve().parents[3] / "000_common"))
+from dir_index import DirIndex
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp'}
+
+def count_images_in_directory(directory, index=None):
     """
     Подсчитывает количество изображений в указанной директории.
     Изображениями считаются файлы с расширениями jpg, jpeg, png, gif, bmp.
+    С index листинг берется из общего индекса, а не из os.listdir + isfile на каждый файл.
     """
-    image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp']
-    count = 0
-    
     assert os.path.exists(directory), f"Директория {directory} не существует"
     assert os.path.isdir(directory), f"{directory} не является директорией"
     
-    for file in os.listdir(directory):
-        file_path = os.path.join(directory, file)
-        if os.path.isfile(file_path):
-            file_ext = os.path.splitext(file)[1].lower()
-            if file_ext in image_extensions:
-                count += 1
-    
-    return count
+    if index is None:
+        index = DirIndex(directory, use_cache=False)
+    return index.count(directory, IMAGE_EXTENSIONS)
 
 def main():
     # Загрузка конфигурации из YAML
@@ -52,13 +51,16 @@ def main():
     # Сбор данных о количестве изображений в каждой директории
     image_counts = {}
     
+    # Один проход scandir по всем классам, листинги кэшируются по mtime папок
+    index = DirIndex(src_dir, use_cache=config.get('use_cache', True)).scan()
+    
     # Получение списка директорий и их естественная сортировка
-    dirs = [d for d in os.listdir(src_dir) if os.path.isdir(os.path.join(src_dir, d))]
+    dirs = index.dirs(src_dir)
     sorted_dirs = natsorted(dirs)
     
     for class_dir in sorted_dirs:
         class_path = os.path.join(src_dir, class_dir)
-        count = count_images_in_directory(class_path)
+        count = count_images_in_directory(class_path, index)
         image_counts[class_dir] = count
     
     assert image_counts, "Не найдено классов с изображениями в указанной директории"
@@ -1,8 +1,13 @@
 import os
+import sys
 import pandas as pd
 
 import argparse
 import textwrap
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[3] / "000_common"))
+from dir_index import DirIndex
 
 # python3 count_images_indir.py -s /home/arch/Documents/project/angel/image_classification/dataset/prepare_data -c collector_black_case collector_case collector_no_case person undefined
 
@@ -52,6 +57,8 @@ if __name__ == '__main__':
     parser.add_argument('-s', '--src', type=str, required=True)
     parser.add_argument('-c', '--classes', nargs='+', help='<Required> Set flag', required=True)
     parser.add_argument('-o', '--out', type=str,  default='out.csv', required=False)
+    parser.add_argument('--no-cache', action='store_true',
+                        help='do not read/write .dir_index_cache.pkl with listings keyed by dir mtime')
 
     args = parser.parse_args()
 
@@ -67,17 +74,17 @@ if __name__ == '__main__':
     # Main program  
     df = pd.DataFrame(columns=[  'name_set' ] + list_classes )
 
+    # one parallel scandir pass over all image sets
+    index = DirIndex(src, use_cache=not args.no_cache).scan()
 
-    for name_set in os.listdir(src):
+    for name_set in index.dirs(src):
        pth_nameset=os.path.join(src, name_set)
-       if not os.path.isdir(pth_nameset):
-          continue
-       list_inside_dir = os.listdir(pth_nameset)
+       list_inside_dir = index.listdir(pth_nameset)
        if "sorted" in list_inside_dir:
           slovr2pandas={'name_set':name_set}
           for name_class in get_empty_dict(list_classes):
                 end_pth=os.path.join(pth_nameset, "sorted", name_class)
-                amount_img=len(os.listdir(end_pth))
+                amount_img=len(index.listdir(end_pth))
                 slovr2pandas[name_class]=amount_img
           slovr2pandas = pd.DataFrame([slovr2pandas])
           df = pd.concat([df, slovr2pandas], ignore_index=True)
@@ -1,38 +1,78 @@
 import os
+import sys
 import pandas as pd
 
 import argparse
 import textwrap
 
 import random
-import shutil
 import glob
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from materialize import materialize_files, LINK_MODES
+from dataset_manifest import new_manifest, save_manifest, MANIFEST_NAME
+from dedup_index import build_dedup_index, drop_duplicates, MAX_DISTANCE
 
 
 '''
 python3 001_recollect_dataset.py --src-csv "/home/arch/Документы/project/angel/incass_classification/dataset/trains/003_train/train_set.csv" \
 --src-data /home/arch/Документы/project/angel/incass_classification/dataset/prepared_data_001/ \
---dst-data /home/arch/Документы/project/angel/incass_classification/dataset/trains/003_train/tmp_collect/
+--dst-data /home/arch/Документы/project/angel/incass_classification/dataset/trains/003_train/tmp_collect/ \
+--link-mode hardlink
 '''
 
 
-def copyFiles2dir(lst_imgs, dst):
-    os.makedirs(dst, exist_ok=True)
-    for img_pth in lst_imgs:
-        shutil.copy(img_pth, dst)
+def copyFiles2dir(pairs, dst_data, link_mode="copy"):
+    used = materialize_files(pairs, link_mode)
+    print(f"Files: {dict(used)}")
+
+def save_manifest_recollect(pairs, sources, classes, dst_data):
+    # manifest.csv: исходный путь, источник (main_dir), класс
+    df_manifest = new_manifest([src for src, _ in pairs], source=sources, classes=classes)
+    save_manifest(df_manifest, os.path.join(dst_data, MANIFEST_NAME))
+
+def drop_duplicate_samples(cells, dedup_index, max_distance=MAX_DISTANCE):
+    """Из всех ячеек разом убираются точные и почти дубли, первая копия по порядку csv остается"""
+    paths = [img for _, _, imgs in cells for img in imgs]
+    keep = drop_duplicates(paths, build_dedup_index(dedup_index, paths=paths), max_distance)
+    kept, start = [], 0
+    for main_dir, name_class, imgs in cells:
+        kept.append((main_dir, name_class, [img for img, k in zip(imgs, keep[start:start + len(imgs)]) if k]))
+        start += len(imgs)
+    return kept
 
-def recollect_dataset(dframe_csv,src_data,dst_data):
+def recollect_dataset(dframe_csv,src_data,dst_data,link_mode="copy",dedup_index=None,dedup_distance=MAX_DISTANCE):
+    # сначала все кандидаты по ячейкам csv, чтобы дубли искать между всеми источниками
+    cells, amounts = [], []
     for main_dir, row in dframe_csv.iterrows():
         current_main_dir=os.path.join(src_data, main_dir, "sorted")
         for name_class, cell_value  in zip(row.index,row):
             current_class_dir = os.path.join(current_main_dir, name_class)
             if not os.path.exists(current_class_dir):
                 continue
-            all_dir_sampels = glob.glob(f"{current_class_dir}/*")
-            selected_imgs = random.sample(all_dir_sampels, cell_value)
-            curent_dst=os.path.join(dst_data,main_dir,name_class)
-            
-            copyFiles2dir(selected_imgs,curent_dst)
+            cells.append((main_dir, name_class, sorted(glob.glob(f"{current_class_dir}/*"))))
+            amounts.append(cell_value)
+    if dedup_index:
+        cells = drop_duplicate_samples(cells, dedup_index, dedup_distance)
+
+    pairs, sources, classes = [], [], []
+    for (main_dir, name_class, all_dir_sampels), cell_value in zip(cells, amounts):
+        if cell_value > len(all_dir_sampels):
+            print(f"Warning: {main_dir}/{name_class} need {cell_value}, "
+                  f"only {len(all_dir_sampels)} without duplicates")
+            cell_value = len(all_dir_sampels)
+        selected_imgs = random.sample(all_dir_sampels, cell_value)
+        curent_dst=os.path.join(dst_data,main_dir,name_class)
+        
+        pairs.extend((img_pth, os.path.join(curent_dst, os.path.basename(img_pth)))
+                     for img_pth in selected_imgs)
+        sources.extend([main_dir] * len(selected_imgs))
+        classes.extend([name_class] * len(selected_imgs))
+
+    save_manifest_recollect(pairs, sources, classes, dst_data)
+    if link_mode != "manifest":
+        copyFiles2dir(pairs, dst_data, link_mode)
     print(f"Process done!")
 
 if __name__ == '__main__':
@@ -69,6 +109,12 @@ if __name__ == '__main__':
     parser.add_argument('--src-csv', type=str, required=True)
     parser.add_argument('--src-data', type=str, required=True, help='path with initiall data with files')
     parser.add_argument('--dst-data', type=str, required=True, help='path to create dir and copy fiels')
+    parser.add_argument('--link-mode', type=str, default='copy', choices=LINK_MODES,
+                        help='copy, or link files instead of copying (fallback to copy on other device)')
+    parser.add_argument('--dedup-index', type=str, default=None,
+                        help='path to dedup index (.npz): drop exact and near duplicate images before sampling')
+    parser.add_argument('--dedup-distance', type=int, default=MAX_DISTANCE,
+                        help='max differing bits of 64-bit dHash for near duplicates')
 
 
     args = parser.parse_args()
@@ -76,7 +122,8 @@ if __name__ == '__main__':
     src_csv=args.src_csv
     src_data=args.src_data
     dst_data=args.dst_data
+    link_mode=args.link_mode
 
 
     df_csv = pd.read_csv(src_csv, delimiter=";",index_col="Name")
-    recollect_dataset(df_csv, src_data, dst_data)
\ No newline at end of file
+    recollect_dataset(df_csv, src_data, dst_data, link_mode, args.dedup_index, args.dedup_distance)
\ No newline at end of file
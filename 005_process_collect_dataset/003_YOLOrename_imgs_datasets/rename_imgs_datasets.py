@@ -2,7 +2,7 @@ import os
 from utils import path_to_dict, compare_sets_common, renamer, read_yaml
 
 
-def rename_collection(path_in, path_out, prefix):
+def rename_collection(path_in, path_out, prefix, naming="random", link_mode="copy"):
     """
     input to function: path: str
     path contain dirs: images and labels
@@ -35,13 +35,19 @@ def rename_collection(path_in, path_out, prefix):
             labels_dict,
             images_dict,
             common_items,
-            prefix)
+            prefix,
+            naming,
+            link_mode)
     
 data = read_yaml(config='config.yaml')
 print(data)
 path_in = data["path_in"]
 path_out = data["path_out"]
 prefix = data["prefix"]
+# random | content - имена из хэша содержимого, повторный запуск дает те же имена
+naming = data.get("naming", "random")
+# copy | hardlink | reflink | symlink
+link_mode = data.get("link_mode", "copy")
 
 
-rename_collection(path_in, path_out, prefix)
\ No newline at end of file
+rename_collection(path_in, path_out, prefix, naming, link_mode)
\ No newline at end of file
@@ -1,12 +1,24 @@
 import os
-import shutil
+import sys
+import hashlib
 import secrets
 import string
-import cv2 as cv
 import yaml
 
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from tqdm import tqdm
 
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from image_probe import is_valid_image
+from file_ops import execute_plan, overwrite_plan, JOURNAL_NAME
+
+# random  - {prefix}_{idx}_{случайные 8 символов}, при каждом запуске новые имена
+# content - {prefix}_{хэш содержимого изображения}: те же файлы всегда получают те же имена
+NAMINGS = ('random', 'content')
+CHUNK = 1 << 20
+
 
 def read_yaml(config='config.yaml'):
     with open(config) as fh:
@@ -19,16 +31,24 @@ def get_hash():
     return rand_hash
 
 def split_name(name):
-    end_point = name.rfind(".")
-    base_name, ext = name[:end_point], name[end_point:]
+    # как os.path.splitext: "abc" -> ("abc", ""), ".DS_Store" -> (".DS_Store", ""),
+    # rfind(".") отрезал от имени без точки последний символ
+    base_name, ext = os.path.splitext(name)
     return base_name, ext
 
 
 def path_to_dict(path):
     base_names=dict()
+    duplicates=[]
     for i in os.listdir(path):
         base_name, ext = split_name(i)
+        if base_name in base_names:
+            duplicates.append(i)
         base_names[base_name] = ext
+    if duplicates:
+        # один stem с разными расширениями: в словаре остается только одно,
+        # полная сверка - 012_reconcile_images_labels
+        print(f"same name with other extension in {path}: {duplicates}")
     return base_names
 
 def compare_sets_common(label_dict, image_dict):
@@ -64,64 +84,98 @@ def src_dst_copy(path_in,
                  path_out,
                  slovr,
                  item,
-                 hash_name,
-                 idx,
-                 type_dir,
-                 not_oppened_imgs_OBJ,
-                 prefix):
+                 name,
+                 type_dir):
     
     ext = slovr[item]
-    src_name = f"{item}{ext}"
-    src_path = os.path.join(path_in, type_dir, src_name)
-    
-    ## cheking image by oppening it
-    if type_dir=="images" and cv.imread(src_path, 0) is None:
-        not_oppened_imgs_OBJ.append(src_name)
-    
-    dst_name = f"{prefix}_{idx}_{hash_name}{ext}"
-    dst_path = os.path.join(path_out, type_dir, dst_name)
-    
-    shutil.copy(src_path, dst_path)
+    src_path = os.path.join(path_in, type_dir, f"{item}{ext}")
+    dst_path = os.path.join(path_out, type_dir, f"{name}{ext}")
     
-    return src_path, dst_path, not_oppened_imgs_OBJ
+    # само копирование - пакетом в renamer, здесь только план
+    return src_path, dst_path
+
+
+def naming_hash(path):
+    """
+    64-bit blake2b of the file bytes. Always blake2b: names must not depend on
+    optional packages (dedup_index.content_hash switches to xxh3 with xxhash installed)
+    """
+    h = hashlib.blake2b(digest_size=8)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK), b''):
+            h.update(chunk)
+    return int.from_bytes(h.digest(), 'big')
+
+
+def probe_pair(src_img, naming):
+    """Image check by header and file end without decoding + content hash for naming=content"""
+    return is_valid_image(src_img), naming_hash(src_img) if naming == "content" else None
+
+
+def content_names(items, hashes, prefix):
+    """
+    {prefix}_{hash}: одинаковые изображения под разными именами получают
+    суффиксы _1, _2... по порядку имен, так что результат тоже детерминирован
+    """
+    seen = Counter()
+    names = []
+    for item, value in zip(items, hashes):
+        name = f"{prefix}_{value:016x}"
+        if seen[name]:
+            print(f"same image content: {item} -> {name}_{seen[name]}")
+            names.append(f"{name}_{seen[name]}")
+        else:
+            names.append(name)
+        seen[name] += 1
+    return names
 
-    
 
 def renamer(path_in,
             path_out,
             labels_dict,
             images_dict,
             common_items,
-            prefix):
+            prefix,
+            naming="random",
+            link_mode="copy",
+            num_threads=16):
     
+    if naming not in NAMINGS:
+        raise ValueError(f"Неизвестный naming {naming}, доступны: {NAMINGS}")
     dst_labels, dst_imgs =  create_path_out (path_out) 
-    not_oppened_imgs=[]
-    
-    for idx, item in tqdm(enumerate(common_items)):
-        # hash_name = secrets.token_urlsafe(6)
-        hash_name = get_hash()
-        
-        
-        src_img, dst_img, not_oppened_imgs = src_dst_copy( path_in, 
-                                         path_out, 
-                                         images_dict, 
-                                         item,  
-                                         hash_name, 
-                                         idx,
-                                         "images",
-                                         not_oppened_imgs,
-                                         prefix)
-        
-        src_label, dst_label, _ = src_dst_copy(path_in,
-                                         path_out,
-                                         labels_dict, 
-                                         item, 
-                                         hash_name, 
-                                         idx,
-                                         "labels",
-                                         None,
-                                         prefix)
+    # сортировка: порядок set меняется от запуска к запуску
+    items = sorted(common_items)
+    src_imgs = [os.path.join(path_in, "images", f"{item}{images_dict[item]}") for item in items]
+
+    # проверка заголовков и хэши содержимого - в потоках
+    with ThreadPoolExecutor(num_threads) as executor:
+        probed = list(tqdm(executor.map(lambda src: probe_pair(src, naming), src_imgs),
+                           total=len(items), desc="check"))
+    not_oppened_imgs = [os.path.basename(src) for src, (valid, _) in zip(src_imgs, probed) if not valid]
+
+    if naming == "content":
+        names = content_names(items, [value for _, value in probed], prefix)
+    else:
+        names = [f"{prefix}_{idx}_{get_hash()}" for idx in range(len(items))]
+
+    operations = []
+    for item, name in zip(items, names):
+        src_img, dst_img = src_dst_copy(path_in, path_out, images_dict, item, name, "images")
+        src_label, dst_label = src_dst_copy(path_in, path_out, labels_dict, item, name, "labels")
+        operations += [(link_mode, src_img, dst_img), (link_mode, src_label, dst_label)]
+
+    if naming == "content":
+        # повторный запуск: уже разложенные в том же link_mode файлы с тем же содержимым
+        # пропускаются, устаревшие (другое содержимое под тем же именем, или ссылка на
+        # path_in от запуска с другим link_mode) заменяются через журнал - rollback их вернет
+        operations, done, stale = overwrite_plan(operations, num_threads)
+        print(f"already in path_out: {done} files, replaced stale: {stale}")
+
+    # файлы пишутся одним пакетом с журналом в path_out: после падения
+    # python 000_common/file_ops.py resume|rollback <path_out>/.file_ops_journal.jsonl
+    if operations:
+        used = execute_plan(operations, os.path.join(path_out, JOURNAL_NAME), num_threads, desc=link_mode,
+                            replace=naming == "content")
+        print(f"Files: {dict(used)}")
     print(f"not_oppened_imgs: {not_oppened_imgs}")
     print(f"Task has done! 🎉")
-        
-        
\ No newline at end of file
@@ -1,12 +1,16 @@
 import os
-import shutil
+import sys
 import secrets
 import string
 import cv2 as cv
 import yaml
 
+from pathlib import Path
 from tqdm import tqdm
 
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from file_ops import execute_plan, JOURNAL_NAME
+
 
 def read_yaml(config='config.yaml'):
     with open(config) as fh:
@@ -15,16 +19,24 @@ def read_yaml(config='config.yaml'):
 
 
 def split_name(name):
-    end_point = name.rfind(".")
-    base_name, ext = name[:end_point], name[end_point:]
+    # как os.path.splitext: "abc" -> ("abc", ""), ".DS_Store" -> (".DS_Store", ""),
+    # rfind(".") отрезал от имени без точки последний символ
+    base_name, ext = os.path.splitext(name)
     return base_name, ext
 
 
 def path_to_dict(path):
     base_names=dict()
+    duplicates=[]
     for i in os.listdir(path):
         base_name, ext = split_name(i)
+        if base_name in base_names:
+            duplicates.append(i)
         base_names[base_name] = ext
+    if duplicates:
+        # один stem с разными расширениями: в словаре остается только одно,
+        # полная сверка - 012_reconcile_images_labels
+        print(f"same name with other extension in {path}: {duplicates}")
     return base_names
 
 def compare_sets_dif(label_dict, image_dict):
@@ -57,13 +69,19 @@ def delete_dif_labels(dif, path_in, labels_dict):
     if not os.path.isdir(path_del_lbl):
         os.mkdir(path_del_lbl)
 
+    operations = []
     for i in dif:
         if labels_dict[i]==".txt":
             i=i+".txt"
             src_lbl = os.path.join(path_in, "labels", i)
             dst_lbl = os.path.join(path_del_lbl, i)
             # shutil.copy(src_lbl, dst_lbl)
-            shutil.move(src_lbl, dst_lbl)
+            operations.append(("move", src_lbl, dst_lbl))
+
+    # одним пакетом с журналом в path_in, после падения: file_ops.py resume|rollback.
+    # Разметка, уже лежащая в deleted_labels от прошлого запуска, заменяется (как делал shutil.move),
+    # прежняя версия уходит в резервную копию журнала и возвращается при rollback
+    execute_plan(operations, os.path.join(path_in, JOURNAL_NAME), desc="move labels", replace=True)
 
     print(f"Task has done! 🎉")
         
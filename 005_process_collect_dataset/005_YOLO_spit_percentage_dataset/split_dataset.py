@@ -1,8 +1,74 @@
 import os
+import sys
+import pandas as pd
+from pathlib import Path
 from utils import path_to_dict, compare_sets_common, mover_ImgsLabls, read_yaml
 
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from dataset_manifest import (build_yolo_manifest, split_random, save_manifest,
+                              write_yolo_lists, split_summary, MANIFEST_NAME)
+from stratified_split import (stratified_split, stratification_report, add_groups,
+                              group_leakage, GROUP_PATTERN)
+from dedup_index import build_dedup_index, duplicate_mask, MAX_DISTANCE
 
-def split_dataset(path_in, path_out, transfer_percentage):
+
+def labeled_manifest(path_in, group_by=None, group_pattern=GROUP_PATTERN):
+    """
+    Manifest of path_in/images + path_in/labels with only image + label pairs,
+    with the group column when group_by is set (see stratified_split.add_groups)
+    """
+    df = build_yolo_manifest(os.path.join(path_in, "images"), os.path.join(path_in, "labels"),
+                             source=os.path.basename(os.path.normpath(path_in)))
+    # как и при перемещении, в выборку идут только пары изображение + разметка
+    print(f"images without labels: {int((df['label'] == '').sum())}")
+    df = df[df['label'] != ''].reset_index(drop=True)
+    if group_by:
+        df = add_groups(df, group_by, group_pattern)
+        print(f"groups: {df['group'].nunique()}")
+    return df
+
+
+def duplicate_clusters(df, dedup_index, max_distance=MAX_DISTANCE):
+    """Cluster id of exact/near duplicate images of the manifest (see 000_common/dedup_index.py)"""
+    images = df['image'].tolist()
+    clusters = build_dedup_index(dedup_index, paths=images).clusters(images, max_distance)
+    print(f"duplicates: {int(duplicate_mask(clusters).sum())} of {len(images)}")
+    return clusters
+
+
+def duplicate_stems(path_in, dedup_index, max_distance=MAX_DISTANCE):
+    """
+    Base names of all images that have a duplicate: when files are moved they stay
+    in path_in, so no copy of an image ends up both in train and val
+    """
+    df = labeled_manifest(path_in)
+    shared = pd.Series(duplicate_clusters(df, dedup_index, max_distance)).duplicated(keep=False).to_numpy()
+    return {os.path.splitext(os.path.basename(p))[0] for p in df.loc[shared, 'image']}
+
+
+def print_split_report(df, group_by=None):
+    print(stratification_report(df))
+    if group_by:
+        print(f"groups in more than one split: {len(group_leakage(df))}")
+
+
+def stratified_items(path_in, transfer_percentage, seed=None, group_by=None, group_pattern=GROUP_PATTERN,
+                     excluded=None):
+    """
+    Base names to move, chosen so every class gets ~transfer_percentage of its images.
+    With group_by whole groups (videos) are moved. Base names from excluded are never moved.
+    """
+    df = labeled_manifest(path_in, group_by, group_pattern)
+    if excluded:
+        df = df[[os.path.splitext(os.path.basename(p))[0] not in excluded for p in df['image']]]
+    df = stratified_split(df.reset_index(drop=True), {'val': transfer_percentage},
+                          seed, groups='group' if group_by else None)
+    print_split_report(df, group_by)
+    return [os.path.splitext(os.path.basename(p))[0] for p in df.loc[df['split'] == 'val', 'image']]
+
+
+def split_dataset(path_in, path_out, transfer_percentage, stratify=False, seed=None,
+                  group_by=None, group_pattern=GROUP_PATTERN, dedup_index=None, dedup_distance=MAX_DISTANCE):
     """
     input to function: path: str
     path contain dirs: images and labels
@@ -28,6 +94,14 @@ def split_dataset(path_in, path_out, transfer_percentage):
     images_dict = path_to_dict(path_images)
     
     common_items=compare_sets_common(labels_dict, images_dict)
+    excluded = None
+    if dedup_index:
+        # изображения с дублями остаются в train вместе со всеми своими копиями
+        excluded = duplicate_stems(path_in, dedup_index, dedup_distance)
+        common_items = set(common_items) - excluded
+    moved_items = None
+    if stratify or group_by:
+        moved_items = stratified_items(path_in, transfer_percentage, seed, group_by, group_pattern, excluded)
     
     # rename
     mover_ImgsLabls(path_in,
@@ -35,13 +109,56 @@ def split_dataset(path_in, path_out, transfer_percentage):
             labels_dict,
             images_dict,
             common_items,
-            transfer_percentage)
-    
+            transfer_percentage,
+            moved_items)
+
+
+def split_manifest(path_in, path_out, transfer_percentage, seed=None, stratify=False,
+                   group_by=None, group_pattern=GROUP_PATTERN, dedup_index=None, dedup_distance=MAX_DISTANCE):
+    """
+    Virtual split: files stay in path_in, path_out gets
+    manifest.csv + train.txt/val.txt + data.yaml for Ultralytics.
+    With dedup_index only the first image of every group of duplicates goes to the lists
+    """
+    df = labeled_manifest(path_in, group_by, group_pattern)
+    if dedup_index:
+        df = df[~duplicate_mask(duplicate_clusters(df, dedup_index, dedup_distance))].reset_index(drop=True)
+
+    if stratify or group_by:
+        df = stratified_split(df, {'train': 1 - transfer_percentage, 'val': transfer_percentage},
+                              seed=seed or 0, groups='group' if group_by else None)
+        print_split_report(df, group_by)
+    else:
+        df = split_random(df, transfer_percentage, seed=seed)
+    save_manifest(df, os.path.join(path_out, MANIFEST_NAME))
+
+    classes_txt = os.path.join(path_in, "classes.txt")
+    yaml_path = write_yolo_lists(df, path_out, classes_txt if os.path.exists(classes_txt) else None)
+    print(split_summary(df))
+    print(f"Dataset yaml: {yaml_path}")
+    print(f"Task has done! 🎉")
+
+
 data = read_yaml(config='config.yaml')
 print(data)
 path_in = data["path_in"]
 path_out = data["path_out"]
 transfer_percentage = data["transfer_percentage"]
+# move - перемещение файлов, manifest - только списки train.txt/val.txt
+mode = data.get("mode", "move")
+# True - доля transfer_percentage выдерживается для каждого класса, а не только в целом
+stratify = data.get("stratify", False)
+# pattern | parent | <столбец манифеста>: кадры одной группы (видео) не разделяются между выборками
+group_by = data.get("group_by")
+group_pattern = data.get("group_pattern", GROUP_PATTERN)
+# индекс хэшей: точные и почти дубли не разделяются между train и val
+dedup_index = data.get("dedup_index")
+dedup_distance = data.get("dedup_distance", MAX_DISTANCE)
 
 
-split_dataset(path_in, path_out, transfer_percentage)
\ No newline at end of file
+if mode == "manifest":
+    split_manifest(path_in, path_out, transfer_percentage, data.get("seed"), stratify,
+                   group_by, group_pattern, dedup_index, dedup_distance)
+else:
+    split_dataset(path_in, path_out, transfer_percentage, stratify, data.get("seed"),
+                  group_by, group_pattern, dedup_index, dedup_distance)
\ No newline at end of file
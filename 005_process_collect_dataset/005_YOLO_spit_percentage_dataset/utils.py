@@ -1,13 +1,17 @@
 import os
-import shutil
+import sys
 import secrets
 import string
-import cv2 as cv
 import yaml
 import random
 
+from pathlib import Path
 from tqdm import tqdm
 
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from image_probe import is_valid_image
+from file_ops import execute_plan, JOURNAL_NAME
+
 
 def read_yaml(config='config.yaml'):
     with open(config) as fh:
@@ -20,16 +24,24 @@ def get_hash():
     return rand_hash
 
 def split_name(name):
-    end_point = name.rfind(".")
-    base_name, ext = name[:end_point], name[end_point:]
+    # как os.path.splitext: "abc" -> ("abc", ""), ".DS_Store" -> (".DS_Store", ""),
+    # rfind(".") отрезал от имени без точки последний символ
+    base_name, ext = os.path.splitext(name)
     return base_name, ext
 
 
 def path_to_dict(path):
     base_names=dict()
+    duplicates=[]
     for i in os.listdir(path):
         base_name, ext = split_name(i)
+        if base_name in base_names:
+            duplicates.append(i)
         base_names[base_name] = ext
+    if duplicates:
+        # один stem с разными расширениями: в словаре остается только одно,
+        # полная сверка - 012_reconcile_images_labels
+        print(f"same name with other extension in {path}: {duplicates}")
     return base_names
 
 def compare_sets_common(label_dict, image_dict):
@@ -73,14 +85,13 @@ def src_dst_move(path_in,
     SrcDst_name = f"{item}{ext}"
     src_path = os.path.join(path_in, type_dir, SrcDst_name)
     
-    ## cheking image by oppening it
-    if type_dir=="images" and cv.imread(src_path, 0) is None:
+    ## cheking image by header and file end, without decoding
+    if type_dir=="images" and not is_valid_image(src_path):
         not_oppened_imgs_OBJ.append(SrcDst_name)
     
     dst_path = os.path.join(path_out, type_dir, SrcDst_name)
     
-    shutil.move(src_path, dst_path)
-    
+    # сам перенос - пакетом в mover_ImgsLabls, здесь только план
     return src_path, dst_path, not_oppened_imgs_OBJ
 
     
@@ -90,16 +101,21 @@ def mover_ImgsLabls(path_in,
             labels_dict,
             images_dict,
             common_items,
-            transfer_percentage):
+            transfer_percentage,
+            moved_items=None):
     
     dst_labels, dst_imgs =  create_path_out (path_out) 
     not_oppened_imgs=[]
 
 
-    amount_selected = int(transfer_percentage*len(common_items))
-    moved_items = random.sample(list(common_items), amount_selected)
+    # moved_items можно выбрать заранее (стратифицированно), иначе случайная выборка
+    if moved_items is None:
+        amount_selected = int(transfer_percentage*len(common_items))
+        moved_items = random.sample(list(common_items), amount_selected)
+    amount_selected = len(moved_items)
     print(f"Moved amount: {amount_selected} items ({transfer_percentage}%) of {len(common_items)}")
     
+    operations = []
     for item in tqdm(moved_items):
         # hash_name = secrets.token_urlsafe(6)
 
@@ -116,6 +132,11 @@ def mover_ImgsLabls(path_in,
                                          item, 
                                          "labels",
                                          None)
+        operations += [("move", src_img, dst_img), ("move", src_label, dst_label)]
+
+    # все пары переносятся одним пакетом с журналом: после падения
+    # python 000_common/file_ops.py resume|rollback <path_out>/.file_ops_journal.jsonl
+    execute_plan(operations, os.path.join(path_out, JOURNAL_NAME), desc="move")
         
     print(f"not_oppened_imgs: {not_oppened_imgs}")
     print(f"Task has done! 🎉")
@@ -1,10 +1,29 @@
+import os
+import sys
+from pathlib import Path
 from utils import  read_yaml
 import pandas as pd
 from utils import copy_files
 
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from dataset_manifest import (build_yolo_manifest, concat_manifests, save_manifest, write_yolo_lists,
+                              materialize_manifest, split_summary, MANIFEST_NAME)
+
+def build_manifest(path_in_raw, df, sets):
+    """Manifest of all source dirs marked with + in the csv, split = column name"""
+    manifests = []
+    for s in sets: # sets = ["train","val"]
+        for dir_name in list(df[df[s]=="+"].names):
+            manifests.append(build_yolo_manifest(os.path.join(path_in_raw, dir_name, "images"),
+                                                 os.path.join(path_in_raw, dir_name, "labels"),
+                                                 source=dir_name, split=s))
+    return concat_manifests(manifests)
+
 def split4train(path_in_raw, 
                 path_out_train,
-                csv_file):
+                csv_file,
+                link_mode="copy",
+                classes=None):
     
     df = pd.read_csv(csv_file, sep='\t')
 
@@ -12,12 +31,22 @@ def split4train(path_in_raw,
     print(sets)
     sets.remove('names')
 
-    list(df[df["train"]=="+"].names)
+    if link_mode == "copy":
+        for s in sets: # sets = ["train","val"]
+            list_dirs = list(df[df[s]=="+"].names)
+            for dir_name in list_dirs:
+                copy_files(dir_name, s, path_in_raw, path_out_train)
+        print(f"Task has done! 🎉")
+        return
 
-    for s in sets: # sets = ["train","val"]
-        list_dirs = list(df[df[s]=="+"].names)
-        for dir_name in list_dirs:
-            copy_files(dir_name, s, path_in_raw, path_out_train)
+    manifest = build_manifest(path_in_raw, df, sets)
+    if link_mode == "manifest":
+        # Файлы остаются в path_in_raw, для обучения только списки и yaml
+        save_manifest(manifest, os.path.join(path_out_train, MANIFEST_NAME))
+        print(f"Dataset yaml: {write_yolo_lists(manifest, path_out_train, classes)}")
+    else:
+        print(dict(materialize_manifest(manifest, path_out_train, link_mode)))
+    print(split_summary(manifest))
 
     print(f"Task has done! 🎉")
 
@@ -29,8 +58,14 @@ print(data)
 path_in_raw = data["path_in_raw"]
 path_out_train = data["path_out_train"]
 csv_file = data["csv_file"]
+# copy | hardlink | reflink | symlink | manifest
+link_mode = data.get("link_mode", "copy")
+# classes.txt или список имен классов для data.yaml
+classes = data.get("classes")
 
 split4train(path_in_raw, 
             path_out_train,
-            csv_file)
+            csv_file,
+            link_mode,
+            classes)
 
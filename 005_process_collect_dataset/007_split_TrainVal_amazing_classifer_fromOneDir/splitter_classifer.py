@@ -1,10 +1,15 @@
 import os
-import shutil
+import sys
 import random
 import yaml
 from pathlib import Path
 from typing import Dict, List, Tuple
 
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from materialize import materialize_files
+from dataset_manifest import new_manifest, save_manifest, MANIFEST_NAME
+from stratified_split import stratified_split, add_groups, group_leakage, GROUP_PATTERN
+
 def load_config(config_path: str) -> Dict:
     """
     Загрузка конфигурации из YAML файла
@@ -33,13 +38,13 @@ def get_class_files(class_path: str) -> List[str]:
     return [f for f in os.listdir(class_path) 
             if os.path.splitext(f)[1].lower() in valid_extensions]
 
-def split_and_copy_files(src_class_path: str, 
-                        train_class_path: str,
-                        val_class_path: str,
-                        files: List[str],
-                        train_percent: float) -> None:
+def split_files(src_class_path: str,
+                train_class_path: str,
+                val_class_path: str,
+                files: List[str],
+                train_percent: float) -> List[Tuple[str, str]]:
     """
-    Разделение и копирование файлов в train и val директории
+    Разделение файлов класса на train и val, возвращает пары (src, dst)
     """
     # Определяем количество файлов для train
     num_files = len(files)
@@ -52,22 +57,43 @@ def split_and_copy_files(src_class_path: str,
     train_files = files[:num_train]
     val_files = files[num_train:]
     
-    # Создаем директории для классов
-    os.makedirs(train_class_path, exist_ok=True)
-    os.makedirs(val_class_path, exist_ok=True)
-    
-    # Копируем файлы
-    for f in train_files:
-        shutil.copy2(
-            os.path.join(src_class_path, f),
-            os.path.join(train_class_path, f)
-        )
-    
-    for f in val_files:
-        shutil.copy2(
-            os.path.join(src_class_path, f),
-            os.path.join(val_class_path, f)
-        )
+    pairs = [(os.path.join(src_class_path, f), os.path.join(train_class_path, f))
+             for f in train_files]
+    pairs += [(os.path.join(src_class_path, f), os.path.join(val_class_path, f))
+              for f in val_files]
+    return pairs
+
+def split_grouped(class_files: Dict[str, Tuple[str, List[str]]],
+                  train_path: str,
+                  val_path: str,
+                  train_percent: float,
+                  group_by: str,
+                  group_pattern: str = GROUP_PATTERN,
+                  seed: int = 0) -> List[Tuple[str, str]]:
+    """
+    Разделение всех классов разом по группам (кадры одного видео): группа целиком
+    уходит в train или в val, доля train выдерживается для каждого класса.
+    class_files: {class_name: (src_class_path, files)}
+    """
+    images, classes = [], []
+    for class_name, (src_class_path, files) in class_files.items():
+        images += [os.path.join(src_class_path, f) for f in files]
+        classes += [class_name] * len(files)
+    df = add_groups(new_manifest(images, classes=classes), group_by, group_pattern)
+
+    # класс изображения как one-hot столбцы n_<id> для стратификации
+    class_ids = {name: i for i, name in enumerate(class_files)}
+    ids = df['class'].map(class_ids).to_numpy()
+    for name, i in class_ids.items():
+        df[f'n_{i}'] = (ids == i).astype(int)
+
+    df = stratified_split(df, {'train': train_percent / 100, 'val': 1 - train_percent / 100},
+                          seed, groups='group')
+    print(f"Groups: {df['group'].nunique()}, in both train and val: {len(group_leakage(df))}")
+
+    return [(image, os.path.join(train_path if split == 'train' else val_path,
+                                 class_name, os.path.basename(image)))
+            for image, class_name, split in zip(df['image'], df['class'], df['split'])]
 
 def main(config_path: str):
     """
@@ -79,6 +105,11 @@ def main(config_path: str):
     src_path = config['src_path']
     dst_path = config['dst_path']
     train_percent = config['train_percent']
+    # copy | hardlink | reflink | symlink | manifest
+    link_mode = config.get('link_mode', 'copy')
+    # pattern | parent: кадры одного видео не попадают и в train, и в val
+    group_by = config.get('group_by')
+    group_pattern = config.get('group_pattern', GROUP_PATTERN)
     
     # Проверяем входные данные
     if not os.path.exists(src_path):
@@ -89,6 +120,8 @@ def main(config_path: str):
     
     # Создаем структуру директорий
     train_path, val_path = create_directory_structure(dst_path)
+    pairs = []
+    class_files = {}
     
     # Обрабатываем каждый класс
     for class_name in os.listdir(src_path):
@@ -109,8 +142,18 @@ def main(config_path: str):
             print(f"Warning: No valid images found in {src_class_path}")
             continue
             
-        # Разделяем и копируем файлы
-        split_and_copy_files(
+        # Создаем директории для классов, даже если в val не попадет ни одного файла
+        if link_mode != 'manifest':
+            os.makedirs(train_class_path, exist_ok=True)
+            os.makedirs(val_class_path, exist_ok=True)
+
+        if group_by:
+            # делим после сбора всех классов: одно видео может быть в нескольких классах
+            class_files[class_name] = (src_class_path, files)
+            continue
+
+        # Разделяем файлы
+        pairs += split_files(
             src_class_path,
             train_class_path,
             val_class_path,
@@ -120,6 +163,22 @@ def main(config_path: str):
         
         print(f"Processed class {class_name}")
 
+    if group_by:
+        pairs = split_grouped(class_files, train_path, val_path, train_percent,
+                              group_by, group_pattern, config.get('seed', 0))
+
+    # manifest.csv: исходный путь, класс и split, dst = dst_path/<split>/<class>/<file>
+    df_manifest = new_manifest([src for src, _ in pairs],
+                               source=os.path.basename(os.path.normpath(src_path)),
+                               split=[Path(dst).parent.parent.name for _, dst in pairs],
+                               classes=[Path(dst).parent.name for _, dst in pairs])
+    save_manifest(df_manifest, os.path.join(dst_path, MANIFEST_NAME))
+
+    # Копируем (или линкуем) файлы всех классов разом в несколько потоков
+    if link_mode != 'manifest':
+        used = materialize_files(pairs, link_mode)
+        print(f"Files: {dict(used)}")
+
 if __name__ == "__main__":
 
    path_config = "config.yaml"
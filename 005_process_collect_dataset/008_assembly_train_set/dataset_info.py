@@ -3,7 +3,7 @@ import pandas as pd
 from natsort import natsorted, ns
 
 
-from utils.tools import remove_ds_store, get_yaml_config, prep_columns, create_df_asis, count_totalsum
+from utils.tools import remove_ds_store, get_yaml_config, prep_columns, create_df_asis, count_totalsum, get_dir_index
 from utils.recount_distribute_sum import recount_distribute_sum
 from utils.save_trainset import save_trainset
 
@@ -26,15 +26,18 @@ print(f"classes {classes}")
 columns = prep_columns(classes)
 
 
+## Index all sources once
+index = get_dir_index(path_data, config.get("use_index_cache", True))
+
 ## Remove .DS_Store
-remove_ds_store(path_data)
+remove_ds_store(path_data, index)
 
 ## List sources
-list_sources = os.listdir(path_data)
+list_sources = index.dirs(path_data)
 list_sources = natsorted(list_sources, alg=ns.IGNORECASE) 
 
 ## Create df_asis for ALL sources
-df_asis = create_df_asis(columns, list_sources, path_data, path_final_data, classes)
+df_asis = create_df_asis(columns, list_sources, path_data, path_final_data, classes, index)
 print(f"As is initial data")
 
 
@@ -1,7 +1,8 @@
 import os
 import pandas as pd
 
-from utils.tools import remove_ds_store, get_yaml_config, prep_columns, create_df_asis
+from utils.tools import (remove_ds_store, get_yaml_config, prep_columns, create_df_asis, get_dir_index,
+                         find_duplicates)
 from utils.recount_distribute_sum import recount_distribute_sum
 from utils.save_trainset import save_trainset
 
@@ -17,6 +18,14 @@ path_out = config["path_out"]
 name_dir = config["name_dir"]
 classes = config["classes"]
 classes = list(map(str, classes))
+# copy | hardlink | reflink | symlink | manifest
+link_mode = config.get("link_mode", "copy")
+# кэш листингов папок по mtime, повторный запуск не перечитывает неизмененные папки
+use_index_cache = config.get("use_index_cache", True)
+# индекс хэшей для удаления точных и почти дублей (None - без дедупликации)
+dedup_index = config.get("dedup_index")
+dedup_distance = config.get("dedup_distance", 3)
+dedup_against = config.get("dedup_against")
 print(f"classes {classes}")
 
 
@@ -24,16 +33,27 @@ print(f"classes {classes}")
 columns = prep_columns(classes)
 
 
+## Index all sources once
+index = get_dir_index(path_data, use_index_cache)
+
 ## Remove .DS_Store
-remove_ds_store(path_data)
+remove_ds_store(path_data, index)
+
+## Duplicates across sources
+excluded = None
+if dedup_index:
+    excluded = find_duplicates(list_sources, path_data, path_final_data, dedup_index, index,
+                               dedup_distance, dedup_against)
 
 ## Create df_asis
-df_asis = create_df_asis(columns, list_sources, path_data, path_final_data, classes)
+df_asis = create_df_asis(columns, list_sources, path_data, path_final_data, classes, index, excluded)
 print(f"As is initial data")
 print(df_asis)
 
 ## Recount distribute sum
-df_redistribute = recount_distribute_sum(df_asis, amount_in_class)
+df_redistribute = recount_distribute_sum(df_asis, amount_in_class,
+                                         source_weights=config.get("source_weights"),
+                                         min_quota=config.get("min_quota"))
 
 print(f"\n\n\n")
 print(f"Redistribute data")
@@ -41,5 +61,6 @@ print(df_redistribute)
 
 
 ## Save data
-save_trainset(df_redistribute, path_data, path_final_data, path_out, name_dir, classes)
+save_trainset(df_redistribute, path_data, path_final_data, path_out, name_dir, classes, link_mode, index,
+              excluded)
 
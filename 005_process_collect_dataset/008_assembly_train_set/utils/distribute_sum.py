@@ -1,61 +1,110 @@
+import numpy as np
 
 
-def distribute_sum(list_init, amount_in_class):
-   n = len(list_init)
-   list_new = [0] * n
-   
-   # Шаг 1: Находим маленькие элементы (≤ amount_in_class/n)
-   threshold = amount_in_class / n
-   small_indices = [i for i, x in enumerate(list_init) if x <= threshold]
-   
-   # Копируем маленькие элементы в новый список
-   remaining_sum = amount_in_class
-   for i in small_indices:
-       list_new[i] = list_init[i]
-       remaining_sum -= list_init[i]
-   
-   # Находим индексы элементов для распределения
-   distribute_indices = [i for i in range(n) if i not in small_indices]
-   
-   if distribute_indices:  # Если есть элементы для распределения
-       # Начальное равномерное распределение
-       equal_share = remaining_sum / len(distribute_indices)
-       
-       # Распределяем, учитывая ограничения исходного списка
-       while True:
-           over_limit = []  # Элементы, превышающие лимит
-           under_limit = [] # Элементы с запасом
-           
-           # Проверяем каждый элемент
-           for i in distribute_indices:
-               if equal_share > list_init[i]:
-                   over_limit.append(i)
-               else:
-                   under_limit.append(i)
-                   
-           if not over_limit:  # Если нет превышений
-               break
-               
-           # Фиксируем превышающие элементы
-           extra_sum = 0
-           for i in over_limit:
-               list_new[i] = list_init[i]
-               extra_sum += equal_share - list_init[i]
-               distribute_indices.remove(i)
-               
-           if distribute_indices:  # Если остались элементы для распределения
-               equal_share += extra_sum / len(distribute_indices)
-           else:
-               break
-       
-       # Записываем финальные значения c округлением
-       for i in distribute_indices:
-           list_new[i] = round(min(equal_share, list_init[i]))
-           
-   # Финальное округление всех элементов
-   list_new = [round(x) for x in list_new]
-   
-   return list_new
+def _as_column_array(value, n_rows, n_cols, default):
+   """Scalar / per-row / per-column / full matrix -> (n_rows, n_cols) float array"""
+   if value is None:
+      value = default
+   value = np.asarray(value, dtype=np.float64)
+   if value.ndim == 1 and value.shape[0] == n_rows:
+      value = value[:, None]
+   return np.broadcast_to(value, (n_rows, n_cols))
+
+
+def water_fill(counts, amount_in_class, weights=None, min_quota=None):
+   """
+   Fair split of amount_in_class between sources, for every column (class) at once.
+
+   counts: (sources, classes) - сколько изображений есть в источнике
+   amount_in_class: int, или массив по классам - сколько нужно всего в классе
+   weights: вес источника (по строкам) или матрица, по умолчанию все 1
+   min_quota: минимум от источника (если у него столько есть), скаляр/строки/матрица
+
+   Each source gets clip(weight * level, min_quota, count), the level of a
+   class is found in closed form: breakpoints of this piecewise linear sum are
+   sorted once (O(n log n) per class, all classes in one numpy pass).
+   Returns float matrix, the sum per class is min(amount, total count)
+   (or the quotas sum if quotas alone exceed the amount).
+   """
+   counts = np.asarray(counts, dtype=np.float64)
+   if counts.ndim == 1:
+      counts = counts[:, None]
+   n_rows, n_cols = counts.shape
+   amount = np.broadcast_to(np.asarray(amount_in_class, dtype=np.float64), (n_cols,))
+   weights = _as_column_array(weights, n_rows, n_cols, 1.0)
+   quota = np.minimum(_as_column_array(min_quota, n_rows, n_cols, 0.0), counts)
+
+   # Уровни, на которых источник начинает расти (quota/w) и упирается в свой count (count/w).
+   # Источник с весом 0 получает только квоту
+   active = weights > 0
+   safe_w = np.where(active, weights, 1.0)
+   start = np.where(active, quota / safe_w, np.inf)
+   stop = np.where(active, counts / safe_w, np.inf)
+
+   # События: в start наклон суммы растет на w (константа -quota), в stop падает (константа +count).
+   # В точке события сумма одинакова при любом порядке событий с одним уровнем
+   levels = np.concatenate([start, stop])
+   d_slope = np.concatenate([np.where(active, weights, 0.0), np.where(active, -weights, 0.0)])
+   d_const = np.concatenate([np.where(active, -quota, 0.0), np.where(active, counts, 0.0)])
+
+   order = np.argsort(levels, axis=0, kind='stable')
+   levels = np.take_along_axis(levels, order, axis=0)
+   slope = np.cumsum(np.take_along_axis(d_slope, order, axis=0), axis=0)
+   const = quota.sum(axis=0) + np.cumsum(np.take_along_axis(d_const, order, axis=0), axis=0)
+
+   # Сумма выделенного в каждой точке излома (после всех событий наклон 0),
+   # k - сколько точек еще не дотягивают до amount
+   finite = np.isfinite(levels)
+   total_at = const + slope * np.where(finite, levels, 0.0)
+   k = (total_at < amount).sum(axis=0)
+
+   cols = np.arange(n_cols)
+   prev = np.maximum(k - 1, 0)
+   with np.errstate(divide='ignore', invalid='ignore'):
+      level = (amount - const[prev, cols]) / slope[prev, cols]
+   # k == 0: квот уже хватает; k == все точки: amount больше, чем есть, берем все
+   level = np.where(k == 0, 0.0, level)
+   level = np.where(k >= finite.sum(axis=0), np.inf, level)
+
+   with np.errstate(invalid='ignore'):
+      fill = np.where(active, weights * level[None, :], 0.0)
+   return np.clip(fill, quota, counts)
+
+
+def round_largest_remainder(values, totals=None):
+   """
+   Integer matrix with the same column sums: floor, then +1 to the largest
+   fractional parts. Values never exceed ceil(value), so limits stay satisfied.
+   """
+   values = np.asarray(values, dtype=np.float64)
+   floor = np.floor(values + 1e-9)
+   if totals is None:
+      totals = np.round(values.sum(axis=0))
+   remainder = (np.asarray(totals) - floor.sum(axis=0)).astype(np.int64)
+   frac = values - floor
+   # ранг дробной части в своем столбце: 0 - самая большая
+   order = np.argsort(-frac, axis=0, kind='stable')
+   rank = np.empty_like(order)
+   np.put_along_axis(rank, order, np.arange(values.shape[0])[:, None], axis=0)
+   return (floor + (rank < remainder[None, :])).astype(np.int64)
+
+
+def distribute_matrix(counts, amount_in_class, weights=None, min_quota=None):
+   """water_fill + largest remainder rounding: ints, sum per class is exact"""
+   counts = np.asarray(counts, dtype=np.float64)
+   fill = water_fill(counts, amount_in_class, weights, min_quota)
+   return round_largest_remainder(fill)
+
+
+def distribute_sum(list_init, amount_in_class, weights=None, min_quota=None):
+   """
+   Один класс: list_init - сколько есть в каждом источнике.
+   Маленькие источники берутся целиком, остаток делится поровну (или по весам)
+   между большими, сумма ровно amount_in_class (или все, что есть)
+   """
+   list_new = distribute_matrix(np.asarray(list_init, dtype=np.float64)[:, None],
+                                amount_in_class, weights, min_quota)
+   return list_new[:, 0].tolist()
 
 
 # def distribute_sum(list_init, s):
@@ -1,27 +1,43 @@
 import numpy as np
 import pandas as pd
-from utils.distribute_sum import distribute_sum
+from utils.distribute_sum import distribute_matrix
 
-def recount_distribute_sum(df_asis, amount_in_class):
-    # Create a new empty DataFrame with the same structure
-    df_redistribute = pd.DataFrame()
-    
-    # Copy the 'name' column
-    df_redistribute['name'] = df_asis['name']
-    
-    # Process each numeric column
-    for col in df_asis.columns:
-        if col != 'name':  # Skip the name column
-            # Convert column to numeric type and handle NaN values
-            column_data = pd.to_numeric(df_asis[col], errors='coerce').fillna(0)
-            list_init = column_data.tolist()
-            
-            # Apply distribute_sum function
-            list_new = distribute_sum(list_init, amount_in_class)
-            
-            # Add the redistributed values to the new DataFrame
-            df_redistribute[col] = list_new
-    
+
+def _per_source(value, names, default):
+    """Scalar or {source name: value} -> array by rows of df_asis"""
+    if value is None:
+        return np.full(len(names), default, dtype=np.float64)
+    if isinstance(value, dict):
+        return np.array([value.get(name, default) for name in names], dtype=np.float64)
+    return np.full(len(names), value, dtype=np.float64)
+
+
+def recount_distribute_sum(df_asis, amount_in_class, source_weights=None, min_quota=None):
+    """
+    Все классы разом: матрица источники x классы распределяется water_fill,
+    сумма в каждом классе ровно amount_in_class (или все, что есть).
+
+    amount_in_class: int или {класс: количество}
+    source_weights: {источник: вес}, по умолчанию все 1
+    min_quota: int или {источник: минимум} - взять из источника не меньше (если есть)
+    """
+    numeric_columns = [col for col in df_asis.columns if col != 'name']
+    names = df_asis['name'].tolist()
+
+    # Convert columns to numeric type and handle NaN values
+    counts = df_asis[numeric_columns].apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy()
+
+    if isinstance(amount_in_class, dict):
+        amount = [amount_in_class.get(col, amount_in_class.get(str(col), 0)) for col in numeric_columns]
+    else:
+        amount = amount_in_class
+
+    matrix = distribute_matrix(counts, amount,
+                               weights=_per_source(source_weights, names, 1.0),
+                               min_quota=_per_source(min_quota, names, 0.0))
+
+    df_redistribute = pd.DataFrame(matrix, columns=numeric_columns, index=df_asis.index)
+    df_redistribute.insert(0, 'name', df_asis['name'])
     return df_redistribute
 
 
@@ -1,8 +1,13 @@
 import os
+import sys
 import random
-import shutil
+from pathlib import Path
 from tqdm import tqdm
-from utils.tools import safly_create_dir, read_data, get_only_directories
+from utils.tools import safly_create_dir, read_data, get_only_directories, list_class_images
+
+sys.path.append(str(Path(__file__).resolve().parents[3] / "000_common"))
+from materialize import materialize_files
+from dataset_manifest import new_manifest, save_manifest, MANIFEST_NAME
 
 
 def create_dir_by_class(path_out, classes):
@@ -15,13 +20,29 @@ def create_dir_by_class(path_out, classes):
         safly_create_dir(path_class)
 
 
-def copy_images(path_src, path_dst, random_select_images):
-    for img_name in random_select_images:
-        shutil.copy(os.path.join(path_src, img_name), os.path.join(path_dst, img_name))
+def select_images(path_src, path_dst, random_select_images):
+    return [(os.path.join(path_src, img_name), os.path.join(path_dst, img_name))
+            for img_name in random_select_images]
+
+
+def copy_images(pairs, link_mode="copy"):
+    """Все отобранные изображения разом: copy | hardlink | reflink | symlink"""
+    used = materialize_files(pairs, link_mode, desc=f"Assemble ({link_mode})")
+    print(f"Done: {dict(used)}")
 
 
+def save_manifest_trainset(pairs, sources, classes, path_out, name_dir):
+    """
+    manifest.csv собранного набора: исходный путь, источник, класс, split=name_dir.
+    С link_mode: manifest это единственный результат сборки, файлы не создаются
+    """
+    df_manifest = new_manifest([src for src, _ in pairs], source=sources, split=name_dir, classes=classes)
+    save_manifest(df_manifest, os.path.join(path_out, MANIFEST_NAME))
 
-def save_trainset(df_redistribute, path_data, path_final_data, path_out, name_dir, classes):
+
+
+def save_trainset(df_redistribute, path_data, path_final_data, path_out, name_dir, classes, link_mode="copy",
+                  index=None, excluded=None):
 
     ## Create dir by class
     path_out = os.path.join(path_out, name_dir)
@@ -29,9 +50,10 @@ def save_trainset(df_redistribute, path_data, path_final_data, path_out, name_di
     
 
     list_sources = df_redistribute['name']
+    pairs, pair_sources, pair_classes = [], [], []
 
     print("########################")
-    print(f"Assemble dataset, copying images...")
+    print(f"Assemble dataset, selecting images...")
     print("........................")
     for source in tqdm(list_sources): # DIRS: 001_AM, 002_ECO, 003_iphone
         path_src = os.path.join(path_data, source)
@@ -39,12 +61,12 @@ def save_trainset(df_redistribute, path_data, path_final_data, path_out, name_di
         if path_classes is None:
             continue
 
-        list_classes = get_only_directories(path_classes)
+        list_classes = get_only_directories(path_classes, index)
 
         for cl_name in list_classes: # classes 1, 2, 3, 4, 5, 6, 7
             path_images = os.path.join(path_classes, cl_name)
             
-            list_imgs = os.listdir(path_images)
+            list_imgs = list_class_images(path_images, index, excluded)
             
             ### Get amount images in class
             value = df_redistribute.loc[df_redistribute['name'] == source, cl_name].iloc[0]
@@ -55,17 +77,24 @@ def save_trainset(df_redistribute, path_data, path_final_data, path_out, name_di
             # DST - path_dst 
 
             ### Random select images
-            random_select_images = random.sample(os.listdir(path_images), value)
+            random_select_images = random.sample(list_imgs, value)
             # print(f"source {source}")
             # print(f"class {cl_name}")
             # print(f"random_select_images {len(random_select_images)}")
 
-            ### Copy images
-            copy_images(path_images, path_dst, random_select_images)
+            ### Collect (src, dst) to copy or link all at once
+            pairs.extend(select_images(path_images, path_dst, random_select_images))
+            pair_sources.extend([source] * len(random_select_images))
+            pair_classes.extend([cl_name] * len(random_select_images))
 
             ### Save df_redistribute as csv
             df_redistribute.to_csv(os.path.join(path_out, "df_redistribute.csv"), index=False)
 
+    ### Save manifest and copy images
+    save_manifest_trainset(pairs, pair_sources, pair_classes, path_out, name_dir)
+    if link_mode != "manifest":
+        copy_images(pairs, link_mode)
+
 
     
 
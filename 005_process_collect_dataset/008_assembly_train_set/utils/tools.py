@@ -1,29 +1,40 @@
 import os
+import sys
 import yaml
 import pandas as pd
+from pathlib import Path
 from natsort import natsorted, ns
 
+sys.path.append(str(Path(__file__).resolve().parents[3] / "000_common"))
+from dir_index import DirIndex
+from image_probe import IMAGE_EXTENSIONS
+from dedup_index import (build_dedup_index, duplicate_mask, duplicates_of, reference_images,
+                         MAX_DISTANCE)
 
 
-def remove_ds_store(directory):
+def remove_ds_store(directory, index=None):
     """
     Safely removes all .DS_Store files in the given directory and subdirectories
     Args:
         directory (str): Root directory path to start searching from. Defaults to current directory.
+        index (DirIndex): already scanned index of the tree, the tree is not walked again
     Returns:
         list: List of removed .DS_Store file paths
     """
     removed_files = []
+    walk = index.walk(directory) if index is not None else os.walk(directory)
     
     try:
         # Walk through directory tree
-        for root, dirs, files in os.walk(directory):
+        for root, dirs, files in walk:
             for file in files:
                 if file == ".DS_Store":
                     file_path = os.path.join(root, file)
                     try:
                         os.remove(file_path)
                         removed_files.append(file_path)
+                        if index is not None:
+                            index.discard(file_path)
                         # print(f"Removed: {file_path}")
                     except OSError as e:
                         pass
@@ -53,13 +64,71 @@ def get_yaml_config(pth):
     return config
 
 
-def get_only_directories(path):
+def get_only_directories(path, index=None):
     # Get all directories from the specified path
+    if index is not None:
+        return index.dirs(path)
     directories = [d for d in os.listdir(path) 
                   if os.path.isdir(os.path.join(path, d))]
     return directories
 
 
+def list_class_images(path_images, index=None, excluded=None):
+    """
+    Files of a class dir without hidden ones (.DS_Store, tool caches)
+    and without the duplicates from excluded (see find_duplicates)
+    """
+    files = index.files(path_images) if index is not None else os.listdir(path_images)
+    files = [f for f in files if not f.startswith('.')]
+    if excluded:
+        files = [f for f in files if os.path.join(path_images, f) not in excluded]
+    return files
+
+
+def find_duplicates(list_sources, path_data, path_final_data, dedup_index, index=None,
+                    max_distance=MAX_DISTANCE, dedup_against=None):
+    """
+    Exact and near duplicate images across all sources and classes (see 000_common/dedup_index.py).
+    From every group of duplicates the first image in list_sources order stays,
+    with dedup_against (manifest.csv or folder of an already assembled set, e.g. val)
+    all images that have a duplicate there are dropped too.
+    Returns set of paths to leave out of the assembly.
+    """
+    paths = []
+    for source in list_sources:
+        path_classes = read_data(os.path.join(path_data, source), path_final_data)
+        if path_classes is None:
+            continue
+        for cl_name in get_only_directories(path_classes, index):
+            path_images = os.path.join(path_classes, cl_name)
+            files = index.files(path_images, IMAGE_EXTENSIONS) if index is not None else \
+                [f for f in os.listdir(path_images) if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS]
+            paths.extend(os.path.join(path_images, f) for f in sorted(files) if not f.startswith('.'))
+
+    reference = reference_images(dedup_against) if dedup_against else []
+    dedup = build_dedup_index(dedup_index, paths=paths + reference)
+    excluded = duplicate_mask(dedup.clusters(paths, max_distance))
+    print(f"Duplicates inside sources: {int(excluded.sum())} of {len(paths)}")
+    if reference:
+        leaked = duplicates_of(paths, reference, dedup, max_distance)
+        print(f"Duplicates of {dedup_against}: {int((leaked & ~excluded).sum())}")
+        excluded |= leaked
+    return {path for path, drop in zip(paths, excluded) if drop}
+
+
+def get_dir_index(path_data, use_cache=True):
+    """
+    One parallel scandir pass over all sources, listings cached by dir mtime.
+    remove_ds_store, create_df_asis and save_trainset query it instead of
+    listing every class dir again
+    """
+    index = DirIndex(path_data, use_cache)
+    print(f"Indexing {path_data}...")
+    index.scan()
+    print(f"Listed {index.listed} of {len(index.listings)} dirs, the rest from cache")
+    return index
+
+
 def prep_columns(classes):
     classes = list(map(str, classes))
     classes = natsorted(classes, alg=ns.IGNORECASE) 
@@ -68,7 +137,7 @@ def prep_columns(classes):
 
 
 
-def create_df_asis(columns, list_sources, path_data, path_final_data, classes):
+def create_df_asis(columns, list_sources, path_data, path_final_data, classes, index=None, excluded=None):
     df_asis = pd.DataFrame(columns=columns)  # создаем пустой DataFrame
     # df_asis = df_asis.reindex(columns=columns)
 
@@ -81,7 +150,7 @@ def create_df_asis(columns, list_sources, path_data, path_final_data, classes):
         # print(f"path_classes {path_classes}")
 
         # list_classes = os.listdir(path_classes)
-        list_classes = get_only_directories(path_classes)
+        list_classes = get_only_directories(path_classes, index)
 
         dict_amount = {}
         dict_amount['name'] = source
@@ -93,9 +162,7 @@ def create_df_asis(columns, list_sources, path_data, path_final_data, classes):
             path_images = os.path.join(path_classes, cl_name)
             # print(f"path_images {path_images}")
             # classes_dirs = get_only_directories(path_images)
-            list_imgs = os.listdir(path_images)
-            # print(f"list_imgs {list_imgs}")
-            len_images_cls = len(os.listdir(path_images))
+            len_images_cls = len(list_class_images(path_images, index, excluded))
             dict_amount[cl_name] = len_images_cls
 
         # df_asis = df_asis.append(dict_amount, ignore_index=True)
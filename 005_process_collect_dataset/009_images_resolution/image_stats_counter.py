@@ -1,4 +1,5 @@
 import os
+import sys
 import yaml
 import csv
 import pandas as pd
@@ -6,9 +7,83 @@ import numpy as np
 from pathlib import Path
 from tabulate import tabulate
 from natsort import natsorted
-from PIL import Image
 
-def get_image_stats(directory):
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from image_probe import list_images, probe_images
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+# Колонки таблицы, которая хранится для каждой директории
+COLUMNS = ['width', 'height', 'file_size', 'aspect']
+PERCENTILES = [5, 25, 50, 75, 95]
+CACHE_NAME = '.image_stats_cache.npz'
+
+
+def _load_cache(cache_path):
+    try:
+        with np.load(cache_path) as cache:
+            return cache['names'], cache['file_sizes'], cache['mtimes'], cache['table']
+    except Exception:
+        return None
+
+
+def _save_cache(cache_path, names, file_sizes, mtimes, table):
+    order = np.argsort(names)
+    try:
+        with open(cache_path, 'wb') as f:
+            np.savez(f, names=names[order], file_sizes=file_sizes[order],
+                     mtimes=mtimes[order], table=table[order])
+    except OSError as e:
+        print(f"Не удалось сохранить кэш {cache_path}: {e}")
+
+
+def get_image_table(directory, use_cache=True):
+    """
+    Собирает таблицу (width, height, file_size, aspect) по всем изображениям директории.
+    Размеры читаются только из заголовков файлов (os.scandir + пул потоков).
+    Таблица кэшируется рядом с данными: при повторном запуске читаются
+    только новые и изменившиеся файлы.
+
+    Возвращает:
+    - Массив имен файлов
+    - Массив (N, 4) с колонками COLUMNS
+    """
+    assert os.path.exists(directory), f"Директория {directory} не существует"
+    assert os.path.isdir(directory), f"{directory} не является директорией"
+
+    files = list_images(directory, extensions=IMAGE_EXTENSIONS)
+    names = np.array([os.path.basename(path) for path, _, _ in files], dtype=str)
+    file_sizes = np.array([size for _, size, _ in files], dtype=np.int64)
+    mtimes = np.array([mtime for _, _, mtime in files], dtype=np.float64)
+    table = np.zeros((len(files), len(COLUMNS)), dtype=np.float64)
+    known = np.zeros(len(files), dtype=bool)
+
+    cache_path = os.path.join(directory, CACHE_NAME)
+    cache = _load_cache(cache_path) if use_cache and os.path.exists(cache_path) else None
+    if cache is not None and len(cache[0]) and len(files):
+        cache_names, cache_sizes, cache_mtimes, cache_table = cache
+        # Имена в кэше отсортированы: сопоставление одним searchsorted
+        pos = np.clip(np.searchsorted(cache_names, names), 0, len(cache_names) - 1)
+        known = ((cache_names[pos] == names)
+                 & (cache_sizes[pos] == file_sizes)
+                 & (cache_mtimes[pos] == mtimes))
+        table[known] = cache_table[pos[known]]
+
+    new_idx = np.flatnonzero(~known)
+    failed = np.zeros(len(files), dtype=bool)
+    for i, info in zip(new_idx, probe_images([files[i] for i in new_idx])):
+        if info.width is None:
+            print(f"Ошибка при чтении изображения {info.path}")
+            failed[i] = True
+            continue
+        table[i] = (info.width, info.height, info.file_size, info.width / info.height)
+
+    names, file_sizes, mtimes, table = names[~failed], file_sizes[~failed], mtimes[~failed], table[~failed]
+    if use_cache and (len(new_idx) or cache is None or len(cache[0]) != len(names)):
+        _save_cache(cache_path, names, file_sizes, mtimes, table)
+
+    return names, table
+
+def get_image_stats(directory, use_cache=True):
     """
     Подсчитывает количество изображений в указанной директории
     и вычисляет средний размер (ширину и высоту) этих изображений.
@@ -17,35 +92,90 @@ def get_image_stats(directory):
     - Количество изображений
     - Средний размер (ширина, высота)
     """
-    image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp']
-    count = 0
-    width_sum = 0
-    height_sum = 0
+    _, table = get_image_table(directory, use_cache)
+    if len(table) == 0:
+        return 0, (0, 0)
+    avg_width, avg_height = np.round(table[:, :2].mean(axis=0)).astype(int)
+    return len(table), (int(avg_width), int(avg_height))
     
-    assert os.path.exists(directory), f"Директория {directory} не существует"
-    assert os.path.isdir(directory), f"{directory} не является директорией"
+def describe_table(table):
+    """Перцентили ширины, высоты, размера файла и соотношения сторон: (len(PERCENTILES), 4)"""
+    if len(table) == 0:
+        return np.zeros((len(PERCENTILES), len(COLUMNS)))
+    return np.percentile(table, PERCENTILES, axis=0)
     
-    for file in os.listdir(directory):
-        file_path = os.path.join(directory, file)
-        if os.path.isfile(file_path):
-            file_ext = os.path.splitext(file)[1].lower()
-            if file_ext in image_extensions:
-                try:
-                    with Image.open(file_path) as img:
-                        width, height = img.size
-                        width_sum += width
-                        height_sum += height
-                        count += 1
-                except Exception as e:
-                    print(f"Ошибка при чтении изображения {file_path}: {e}")
-                    continue
+def resolution_clusters(table):
+    """
+    Группирует изображения по "камерам": одинаковое разрешение без учета
+    ориентации (длинная x короткая сторона).
     
-    if count > 0:
-        avg_width = round(width_sum / count)
-        avg_height = round(height_sum / count)
-        return count, (avg_width, avg_height)
-    else:
-        return 0, (0, 0)
+    Возвращает список (разрешение, количество, доля, вертикальных), по убыванию количества
+    """
+    if len(table) == 0:
+        return []
+    width, height = table[:, 0], table[:, 1]
+    keys = np.stack([np.maximum(width, height), np.minimum(width, height)], axis=1).astype(np.int64)
+    clusters, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    portrait = np.bincount(inverse.ravel(), weights=height > width, minlength=len(clusters))
+    return [
+        (f"{clusters[i, 0]}x{clusters[i, 1]}", int(counts[i]), counts[i] / len(table), int(portrait[i]))
+        for i in np.argsort(-counts, kind='stable')
+    ]
+
+def resolution_histogram(table, bins):
+    """2D гистограмма ширина x высота в виде DataFrame"""
+    hist, width_edges, height_edges = np.histogram2d(table[:, 0], table[:, 1], bins=bins)
+    index = [f"{width_edges[i]:.0f}-{width_edges[i + 1]:.0f}" for i in range(len(width_edges) - 1)]
+    columns = [f"{height_edges[i]:.0f}-{height_edges[i + 1]:.0f}" for i in range(len(height_edges) - 1)]
+    return pd.DataFrame(hist.astype(np.int64), index=index, columns=columns)
+
+def print_distribution(class_tables, top_clusters, outlier_share, hist_bins):
+    """Вывод перцентилей, кластеров по разрешению и 2D гистограммы"""
+    rows = []
+    for class_name, table in class_tables.items():
+        stats = describe_table(table)
+        row = [class_name, len(table)]
+        for column in range(len(COLUMNS)):
+            if COLUMNS[column] == 'file_size':
+                row.append(" / ".join(f"{v / 2**20:.2f}" for v in stats[[0, 2, 4], column]))
+            elif COLUMNS[column] == 'aspect':
+                row.append(" / ".join(f"{v:.2f}" for v in stats[[0, 2, 4], column]))
+            else:
+                row.append(" / ".join(f"{v:.0f}" for v in stats[[0, 2, 4], column]))
+        rows.append(row)
+    headers = ['class', 'count', 'width p5/p50/p95', 'height p5/p50/p95',
+               'MB p5/p50/p95', 'aspect p5/p50/p95']
+    print("\nРаспределение размеров по классам:")
+    print(tabulate(rows, headers=headers, tablefmt='fancy_grid'))
+
+    rows = []
+    for class_name, table in class_tables.items():
+        for idx, (resolution, count, share, portrait) in enumerate(resolution_clusters(table)):
+            is_outlier = share < outlier_share
+            if idx >= top_clusters and not is_outlier:
+                continue
+            rows.append([class_name, resolution, count, f"{share:.1%}", portrait,
+                         "outlier" if is_outlier else ""])
+    print("\nКластеры по разрешению (камеры):")
+    print(tabulate(rows, headers=['class', 'resolution', 'count', 'share', 'portrait', ''],
+                   tablefmt='fancy_grid'))
+
+    all_table = np.concatenate(list(class_tables.values()))
+    if len(all_table):
+        print("\n2D гистограмма разрешений всего датасета (строки - ширина, столбцы - высота):")
+        print(tabulate(resolution_histogram(all_table, hist_bins), headers='keys', tablefmt='fancy_grid'))
+
+def export_parquet(class_names, class_tables, dst_parquet):
+    """Полная таблица по всем изображениям для анализа в ноутбуке"""
+    frames = []
+    for class_name, table in class_tables.items():
+        df = pd.DataFrame(table, columns=COLUMNS)
+        df[['width', 'height', 'file_size']] = df[['width', 'height', 'file_size']].astype(np.int64)
+        df.insert(0, 'file', class_names[class_name])
+        df.insert(0, 'class', class_name)
+        frames.append(df)
+    pd.concat(frames, ignore_index=True).to_parquet(dst_parquet, index=False)
+    print(f"Полная таблица сохранена в {dst_parquet}")
 
 def main():
     # Загрузка конфигурации из YAML
@@ -58,6 +188,11 @@ def main():
     src_dir = config.get('src')
     dst_csv = config.get('dst_csv')
     orientation = config.get('orientation', 'vertical')  # По умолчанию вертикальное расположение
+    dst_parquet = config.get('dst_parquet')
+    use_cache = config.get('use_cache', True)
+    top_clusters = config.get('top_clusters', 3)
+    outlier_share = config.get('outlier_share', 0.01)
+    hist_bins = config.get('hist_bins', 8)
     
     assert src_dir is not None, "В конфигурационном файле отсутствует параметр 'src'"
     assert dst_csv is not None, "В конфигурационном файле отсутствует параметр 'dst_csv'"
@@ -72,9 +207,8 @@ def main():
     
     # Сбор данных о количестве и размерах изображений в каждой директории
     class_stats = {}
-    all_images_count = 0
-    all_width_sum = 0
-    all_height_sum = 0
+    class_tables = {}
+    class_names = {}
     
     # Получение списка директорий и их естественная сортировка
     dirs = [d for d in os.listdir(src_dir) if os.path.isdir(os.path.join(src_dir, d))]
@@ -82,23 +216,23 @@ def main():
     
     for class_dir in sorted_dirs:
         class_path = os.path.join(src_dir, class_dir)
-        count, (avg_width, avg_height) = get_image_stats(class_path)
+        names, table = get_image_table(class_path, use_cache)
+        class_tables[class_dir] = table
+        class_names[class_dir] = names
+        count = len(table)
+        avg_width, avg_height = np.round(table[:, :2].mean(axis=0)).astype(int) if count else (0, 0)
         class_stats[class_dir] = {
             'count': count,
             'avg_size': f"{avg_width}x{avg_height}"
         }
         
-        # Накапливаем статистику для всего датасета
-        all_images_count += count
-        all_width_sum += avg_width * count
-        all_height_sum += avg_height * count
-    
     assert class_stats, "Не найдено классов с изображениями в указанной директории"
     
     # Вычисляем средний размер для всего датасета
+    all_table = np.concatenate(list(class_tables.values()))
+    all_images_count = len(all_table)
     if all_images_count > 0:
-        avg_width_all = round(all_width_sum / all_images_count)
-        avg_height_all = round(all_height_sum / all_images_count)
+        avg_width_all, avg_height_all = np.round(all_table[:, :2].mean(axis=0)).astype(int)
         total_avg_size = f"{avg_width_all}x{avg_height_all}"
     else:
         total_avg_size = "0x0"
@@ -150,5 +284,11 @@ def main():
         print("\nСтатистика по классам (горизонтальное отображение):")
         print(tabulate(df, headers='keys', tablefmt='fancy_grid'))
 
+    # Распределения: перцентили, камеры, 2D гистограмма
+    print_distribution(class_tables, top_clusters, outlier_share, hist_bins)
+
+    if dst_parquet:
+        export_parquet(class_names, class_tables, dst_parquet)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,8 +1,16 @@
 import os
-import shutil
+import sys
 import yaml
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from materialize import materialize_files
+from dataset_manifest import (new_manifest, add_class_counts, save_manifest,
+                              write_yolo_lists, split_summary, MANIFEST_NAME)
+from stratified_split import (stratified_split, stratification_report, add_groups,
+                              group_leakage, GROUP_PATTERN)
+from dedup_index import build_dedup_index, drop_duplicates, MAX_DISTANCE
 
 def load_config(config_path: str = "config.yaml") -> dict:
     """Загружает конфигурацию из YAML файла"""
@@ -37,6 +45,60 @@ def sort_pairs_by_label_size(pairs: List[Tuple[str, str, int]]) -> List[Tuple[st
     """Сортирует пары по размеру файла лейбла (по убыванию)"""
     return sorted(pairs, key=lambda x: x[2], reverse=True)
 
+def drop_duplicate_pairs(pairs: List[Tuple[str, str, int]], dedup_index: str,
+                         max_distance: int = MAX_DISTANCE) -> List[Tuple[str, str, int]]:
+    """Убирает точные и почти дубли изображений, из каждой группы остается первая пара"""
+    images = [img for img, _, _ in pairs]
+    keep = drop_duplicates(images, build_dedup_index(dedup_index, paths=images), max_distance)
+    return [pair for pair, k in zip(pairs, keep) if k]
+
+def pair_groups(pairs: List[Tuple[str, str, int]], group_by: str,
+                group_pattern: str = GROUP_PATTERN) -> List[str]:
+    """Ключ группы (видео) для каждой пары, см. stratified_split.add_groups"""
+    df = new_manifest([img for img, _, _ in pairs])
+    return add_groups(df, group_by, group_pattern)['group'].tolist()
+
+def stratified_pairs(pairs: List[Tuple[str, str, int]], train_count: int, val_count: int,
+                     seed: int = 0, groups: Optional[List[str]] = None
+                     ) -> Tuple[List[Tuple[str, str, int]], List[Tuple[str, str, int]]]:
+    """
+    Выбирает train_count + val_count пар так, чтобы доля изображений каждого
+    класса в train и val была одинаковой (multi-label iterative stratification).
+    groups - ключ группы для каждой пары, группы не разделяются между выборками
+    """
+    df = new_manifest([img for img, _, _ in pairs], [label for _, label, _ in pairs])
+    df = add_class_counts(df)
+    if groups is not None:
+        df['group'] = groups
+    df = stratified_split(df, {'train': train_count, 'val': val_count}, seed,
+                          groups='group' if groups is not None else None)
+    print(stratification_report(df[df['split'] != '']))
+    if groups is not None:
+        print(f"Groups in both train and val: {len(group_leakage(df[df['split'] != '']))}")
+
+    split = df['split'].to_numpy()
+    train_pairs = [pair for pair, s in zip(pairs, split) if s == 'train']
+    val_pairs = [pair for pair, s in zip(pairs, split) if s == 'val']
+    return train_pairs, val_pairs
+
+def split_by_label_size(sorted_pairs: List[Tuple[str, str, int]], train_count: int, val_count: int,
+                        groups: Optional[List[str]] = None
+                        ) -> Tuple[List[Tuple[str, str, int]], List[Tuple[str, str, int]]]:
+    """
+    Train - первые train_count пар, val - следующие val_count.
+    С groups в val не берутся пары из групп (видео), уже попавших в train
+    """
+    train_pairs = sorted_pairs[:train_count]
+    if groups is None:
+        return train_pairs, sorted_pairs[train_count:train_count + val_count]
+
+    train_groups = set(groups[:train_count])
+    val_pairs = [pair for pair, group in zip(sorted_pairs[train_count:], groups[train_count:])
+                 if group not in train_groups][:val_count]
+    if len(val_pairs) < val_count:
+        print(f"Warning: only {len(val_pairs)} val samples from groups not used in train")
+    return train_pairs, val_pairs
+
 def create_directories(dst_data: str):
     """Создает необходимые директории"""
     dst_path = Path(dst_data)
@@ -50,20 +112,36 @@ def create_directories(dst_data: str):
         (split_dir / "images").mkdir(parents=True, exist_ok=True)
         (split_dir / "labels").mkdir(parents=True, exist_ok=True)
 
-def copy_files(pairs: List[Tuple[str, str, int]], dst_data: str, split: str, count: int):
-    """Копирует файлы в соответствующие директории"""
+def copy_files(pairs: List[Tuple[str, str, int]], dst_data: str, split: str, count: int,
+               link_mode: str = "copy"):
+    """Копирует (или линкует, см. link_mode) файлы в соответствующие директории"""
     dst_path = Path(dst_data) / split
     
-    for i, (img_path, label_path, _) in enumerate(pairs[:count]):
-        # Копируем изображение
-        img_filename = Path(img_path).name
-        shutil.copy2(img_path, dst_path / "images" / img_filename)
-        
-        # Копируем лейбл
-        label_filename = Path(label_path).name
-        shutil.copy2(label_path, dst_path / "labels" / label_filename)
-        
-        print(f"Copied {split} {i+1}/{count}: {img_filename}")
+    file_pairs = []
+    for img_path, label_path, _ in pairs[:count]:
+        file_pairs.append((img_path, str(dst_path / "images" / Path(img_path).name)))
+        file_pairs.append((label_path, str(dst_path / "labels" / Path(label_path).name)))
+    
+    used = materialize_files(file_pairs, link_mode, desc=f"Copying {split}")
+    print(f"Copied {split}: {dict(used)}")
+
+def write_manifest(train_pairs: List[Tuple[str, str, int]], val_pairs: List[Tuple[str, str, int]],
+                   src_data: str, dst_data: str):
+    """
+    Виртуальное разбиение без копирования: manifest.csv, train.txt, val.txt
+    и data.yaml для Ultralytics в dst_data
+    """
+    pairs = train_pairs + val_pairs
+    df = new_manifest([img for img, _, _ in pairs], [label for _, label, _ in pairs],
+                      source=Path(src_data).name,
+                      split=["train"] * len(train_pairs) + ["val"] * len(val_pairs))
+    df = add_class_counts(df)
+    save_manifest(df, str(Path(dst_data) / MANIFEST_NAME))
+
+    classes_txt = Path(src_data) / "classes.txt"
+    yaml_path = write_yolo_lists(df, dst_data, str(classes_txt) if classes_txt.exists() else None)
+    print(split_summary(df))
+    print(f"Dataset yaml: {yaml_path}")
 
 def split_dataset():
     """Основная функция для разбивки датасета"""
@@ -74,11 +152,22 @@ def split_dataset():
     dst_data = config['dst_data']
     train_count = config['train']
     val_count = config['val']
+    link_mode = config.get('link_mode', 'copy')
+    # label_size - самые размеченные изображения, stratified - стратификация по классам
+    strategy = config.get('strategy', 'label_size')
+    # pattern | parent: кадры одного видео не попадают и в train, и в val
+    group_by = config.get('group_by')
+    group_pattern = config.get('group_pattern', GROUP_PATTERN)
+    # индекс хэшей для удаления точных и почти дублей
+    dedup_index = config.get('dedup_index')
     
     print(f"Source data: {src_data}")
     print(f"Destination data: {dst_data}")
     print(f"Train samples: {train_count}")
     print(f"Val samples: {val_count}")
+    print(f"Link mode: {link_mode}")
+    print(f"Strategy: {strategy}")
+    print(f"Group by: {group_by}")
     
     # Проверяем существование исходных директорий
     src_path = Path(src_data)
@@ -89,39 +178,54 @@ def split_dataset():
     print("Collecting image-label pairs...")
     pairs = get_image_label_pairs(src_data)
     print(f"Found {len(pairs)} pairs")
+    if dedup_index:
+        pairs = drop_duplicate_pairs(pairs, dedup_index, config.get('dedup_distance', MAX_DISTANCE))
     
     # Проверяем, достаточно ли данных
     total_needed = train_count + val_count
     if len(pairs) < total_needed:
         raise ValueError(f"Not enough data! Found {len(pairs)} pairs, but need {total_needed}")
     
-    # Сортируем по размеру файлов лейблов (по убыванию)
-    print("Sorting by label file size...")
-    sorted_pairs = sort_pairs_by_label_size(pairs)
-    
-    # Показываем статистику по размерам
-    print("\nTop 5 largest label files:")
-    for i, (img_path, label_path, size) in enumerate(sorted_pairs[:5]):
-        print(f"{i+1}. {Path(label_path).name}: {size} bytes")
-    
-    # Создаем директории
-    print("Creating directories...")
-    create_directories(dst_data)
-    
-    # Копируем файлы для train
-    print(f"\nCopying {train_count} samples to train...")
-    train_pairs = sorted_pairs[:train_count]
-    copy_files(train_pairs, dst_data, "train", train_count)
-    
-    # Копируем файлы для val
-    print(f"\nCopying {val_count} samples to val...")
-    val_pairs = sorted_pairs[train_count:train_count + val_count]
-    copy_files(val_pairs, dst_data, "val", val_count)
+    if strategy == "stratified":
+        print("Stratified split by classes...")
+        groups = pair_groups(pairs, group_by, group_pattern) if group_by else None
+        train_pairs, val_pairs = stratified_pairs(pairs, train_count, val_count,
+                                                  config.get('seed', 0), groups)
+    else:
+        # Сортируем по размеру файлов лейблов (по убыванию)
+        print("Sorting by label file size...")
+        sorted_pairs = sort_pairs_by_label_size(pairs)
+        
+        # Показываем статистику по размерам
+        print("\nTop 5 largest label files:")
+        for i, (img_path, label_path, size) in enumerate(sorted_pairs[:5]):
+            print(f"{i+1}. {Path(label_path).name}: {size} bytes")
+        
+        groups = pair_groups(sorted_pairs, group_by, group_pattern) if group_by else None
+        train_pairs, val_pairs = split_by_label_size(sorted_pairs, train_count, val_count, groups)
+    
+    if link_mode == "manifest":
+        # Ничего не копируем, только списки для Ultralytics
+        print("\nWriting manifest...")
+        write_manifest(train_pairs, val_pairs, src_data, dst_data)
+    else:
+        # Создаем директории
+        print("Creating directories...")
+        create_directories(dst_data)
+        
+        # Копируем файлы для train
+        print(f"\nCopying {len(train_pairs)} samples to train...")
+        copy_files(train_pairs, dst_data, "train", len(train_pairs), link_mode)
+        
+        # Копируем файлы для val
+        print(f"\nCopying {len(val_pairs)} samples to val...")
+        copy_files(val_pairs, dst_data, "val", len(val_pairs), link_mode)
     
+    # с группами размеры выдерживаются с точностью до одной группы
     print(f"\nDataset splitting completed!")
-    print(f"Train: {train_count} samples")
-    print(f"Val: {val_count} samples")
-    print(f"Total: {train_count + val_count} samples")
+    print(f"Train: {len(train_pairs)} samples")
+    print(f"Val: {len(val_pairs)} samples")
+    print(f"Total: {len(train_pairs) + len(val_pairs)} samples")
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,43 @@
+import os
+import sys
+import yaml
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from reconcile import reconcile, print_summary, save_report, apply_action, REPORT_NAME
+
+
+def read_yaml(config='config.yaml'):
+    with open(config) as fh:
+        read_data = yaml.load(fh, Loader=yaml.FullLoader)
+    return read_data
+
+
+def reconcile_dataset(images_dir, labels_dir, action="report", issues=("labels_without_images",),
+                      path_out=None, num_threads=16):
+    """
+    Images and labels are indexed by relative stem in one scandir pass per side,
+    orphans, duplicates (same stem, several extensions) and empty labels
+    are found with set operations, then the action is applied to the chosen issues.
+    """
+    result = reconcile(images_dir, labels_dir, num_threads=num_threads)
+    print_summary(result)
+
+    report_dir = path_out or os.path.dirname(os.path.abspath(labels_dir))
+    print(f"Report: {save_report(result, os.path.join(report_dir, REPORT_NAME))}")
+
+    count = apply_action(result, issues, action, images_dir, labels_dir, path_out, num_threads)
+    if action != "report":
+        print(f"{action}: {count} files")
+    print(f"Task has done! 🎉")
+
+
+data = read_yaml(config='config.yaml')
+print(data)
+
+reconcile_dataset(data["images_dir"],
+                  data["labels_dir"],
+                  data.get("action", "report"),
+                  data.get("issues", ["labels_without_images"]),
+                  data.get("path_out"),
+                  data.get("num_threads", 16))
@@ -1,9 +1,13 @@
 import os
-import shutil
+import sys
 import yaml
 import re
+from pathlib import Path
 from tqdm import tqdm
 
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from file_ops import execute_plan, overwrite_plan, JOURNAL_NAME
+
 def rename_and_copy_files(src_dir, dst_dir):
     """
     Copy files from src_dir to dst_dir while renaming them:
@@ -31,6 +35,7 @@ def rename_and_copy_files(src_dir, dst_dir):
     
     # Process files with progress bar
     count = 0
+    operations = []
     for filename in tqdm(target_files, desc="Processing files"):
         src_path = os.path.join(src_dir, filename)
         
@@ -49,8 +54,8 @@ def rename_and_copy_files(src_dir, dst_dir):
             new_filename = f"{base_name}{file_extension}"
             dst_path = os.path.join(dst_dir, new_filename)
             
-            # Copy and rename the file
-            shutil.copy2(src_path, dst_path)
+            # Copy and rename the file: planned here, copied in one journaled batch below
+            operations.append(("copy", src_path, dst_path))
             count += 1
             
             # Show some examples for verification
@@ -60,6 +65,17 @@ def rename_and_copy_files(src_dir, dst_dir):
             # File already has the correct naming pattern or doesn't match expected pattern
             print(f"Skipping (no pattern match): {filename}")
     
+    # Rerun into the same dst_dir: files with the same content are skipped,
+    # changed ones are overwritten (as shutil.copy2 did before) through the journal,
+    # rollback puts the old versions back
+    operations, skipped, replaced = overwrite_plan(operations)
+    if skipped or replaced:
+        print(f"Already in {dst_dir}: {skipped} unchanged (skipped), {replaced} changed (overwritten)")
+    
+    # Name collisions are checked before copying; an interrupted run is finished or undone with
+    # python 000_common/file_ops.py resume|rollback <dst_dir>/.file_ops_journal.jsonl
+    execute_plan(operations, os.path.join(dst_dir, JOURNAL_NAME), desc="Copying files", replace=True)
+    
     return count
 
 def main():
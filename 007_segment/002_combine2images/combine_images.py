@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 import os
+import sys
 import yaml
 from pathlib import Path
 from PIL import Image
 
+sys.path.append(str(Path(__file__).resolve().parents[2] / "000_common"))
+from image_io import image_size, fit_size, open_reduced
+
 # Путь до конфига (захардкожен)
 CONFIG_PATH = "config.yaml"
 
@@ -22,24 +26,30 @@ def load_config(config_path):
         print(f"Ошибка при загрузке конфига: {e}")
         exit(1)
 
-def merge_images(img1_path, img2_path, output_path):
+def merge_images(img1_path, img2_path, output_path, max_side=None):
     """Склеивает две фотографии горизонтально и сохраняет результат.
     Размер холста определяется по большей картинке. Вторая картинка 
-    масштабируется для заполнения своей половины холста, сохраняя пропорции."""
+    масштабируется для заполнения своей половины холста, сохраняя пропорции.
+    max_side ограничивает сторону половины холста; размеры берутся из заголовков,
+    JPEG декодируется сразу в уменьшенном размере (draft)."""
     try:
-        img1 = Image.open(img1_path)
-        img2 = Image.open(img2_path)
+        size1 = image_size(img1_path)
+        size2 = image_size(img2_path)
         
         # Определяем размеры большей картинки
-        img1_area = img1.width * img1.height
-        img2_area = img2.width * img2.height
+        img1_area = size1[0] * size1[1]
+        img2_area = size2[0] * size2[1]
         
         if img1_area >= img2_area:
-            base_width = img1.width
-            base_height = img1.height
+            base_width, base_height = size1
         else:
-            base_width = img2.width
-            base_height = img2.height
+            base_width, base_height = size2
+        
+        if max_side and max(base_width, base_height) > max_side:
+            base_width, base_height = fit_size((base_width, base_height), (max_side, max_side))
+        
+        img1 = open_reduced(img1_path, fit_size(size1, (base_width, base_height)))
+        img2 = open_reduced(img2_path, fit_size(size2, (base_width, base_height)))
         
         # Создаем холст в два раза шире большей картинки
         canvas_width = base_width * 2
@@ -90,7 +100,7 @@ def merge_images(img1_path, img2_path, output_path):
         print(f"Ошибка при обработке {img1_path} и {img2_path}: {e}")
         return False
 
-def process_folders(src1, src2, dst_path):
+def process_folders(src1, src2, dst_path, max_side=None):
     """Обрабатывает файлы в указанных папках."""
     # Проверка существования директорий
     if not os.path.isdir(src1):
@@ -120,7 +130,7 @@ def process_folders(src1, src2, dst_path):
                 dst_file_path = os.path.join(dst_path, filename)
                 
                 # Склеиваем изображения
-                success = merge_images(src1_file_path, src2_file_path, dst_file_path)
+                success = merge_images(src1_file_path, src2_file_path, dst_file_path, max_side)
                 
                 if success:
                     processed_count += 1
@@ -139,6 +149,7 @@ def main():
     
     # Загрузка конфигурации
     config = load_config(CONFIG_PATH)
+    max_side = config.get('max_side')
     
     # Выводим информацию о настройках
     print(f"Исходная папка 1: {config['src1']}")
@@ -146,7 +157,7 @@ def main():
     print(f"Папка для результатов: {config['dst']}")
     
     # Обработка папок
-    process_folders(config['src1'], config['src2'], config['dst'])
+    process_folders(config['src1'], config['src2'], config['dst'], max_side)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+import sys
 import yaml
 import cv2
 import numpy as np
@@ -8,6 +9,14 @@ from matplotlib.patches import PathPatch
 import random
 from tqdm import tqdm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "000_common"))
+from image_io import imread_preview
+
+FIGSIZE = (12, 9)
+DPI = 200
+# Больше этого по длинной стороне в сохраненной картинке все равно не будет
+PREVIEW_MAX_SIDE = int(max(FIGSIZE) * DPI)
+
 def generate_colors(n):
     """
     Generate n distinct colors for visualization
@@ -38,8 +47,8 @@ def draw_segmentation(img_path, label_path, output_path, class_names, colors):
     """
     Draw segmentation masks on the image
     """
-    # Read the image
-    img = cv2.imread(img_path)
+    # Read the image (JPEG is decoded at reduced scale if it is bigger than the figure)
+    img = imread_preview(img_path, PREVIEW_MAX_SIDE)
     if img is None:
         print(f"Cannot read image: {img_path}")
         return False
@@ -55,7 +64,7 @@ def draw_segmentation(img_path, label_path, output_path, class_names, colors):
         segmentation_lines = [line.strip() for line in f.readlines()]
     
     # Create figure and axes
-    fig, ax = plt.subplots(1, figsize=(12, 9))
+    fig, ax = plt.subplots(1, figsize=FIGSIZE)
     ax.imshow(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
     
     # Draw each segmentation
@@ -99,7 +108,7 @@ def draw_segmentation(img_path, label_path, output_path, class_names, colors):
     
     # Save the figure
     plt.tight_layout()
-    plt.savefig(output_path, dpi=200, bbox_inches='tight')
+    plt.savefig(output_path, dpi=DPI, bbox_inches='tight')
     plt.close(fig)
     
     return True